@@ -1,14 +1,76 @@
 from abc import ABC, abstractmethod
-from queue import PriorityQueue, Queue
+from collections import deque, namedtuple
+from heapq import heappush, heappop
+import threading
+from time import perf_counter
+
+INF = float('inf')
+CANCEL_CHECK_INTERVAL = 256  # số node lấy ra giữa hai lần kiểm tra yêu cầu hủy
+STEP_BATCH = 64  # số node lấy ra giữa hai bước của Algorithm.steps
+
+# Một bước của Algorithm.steps: node_id mới được lấy ra (closed) / mới vào tập mở (frontier)
+# kể từ bước trước, tổng số node đã lấy ra; result = (count_node, path) ở bước cuối, None ở các bước khác
+SearchStep = namedtuple("SearchStep", "closed frontier popped result")
+
+
+class SearchCancelled(Exception):
+    """Lần tìm bị hủy giữa chừng (đã có yêu cầu tìm đường mới hơn)"""
+
+
+class CancelToken:
+    """Cờ hủy dùng chung giữa luồng gửi yêu cầu và luồng đang tìm đường"""
+
+    def __init__(self):
+        self._event = threading.Event()
+
+    def cancel(self):
+        self._event.set()
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def check(self):
+        if self._event.is_set():
+            raise SearchCancelled()
+
 
 class Algorithm(ABC):
     def __init__(self):
-        pass
+        # CancelToken của lần chạy hiện tại (Router gán trước khi gọi run), None: không hủy được.
+        # Vòng lặp tìm kiếm gọi check() sau mỗi CANCEL_CHECK_INTERVAL node và dừng bằng SearchCancelled.
+        self.cancel = None
+        # metrics.SearchMetrics nhận số liệu của lần chạy (Router gán), None: không ghi
+        self.metrics = None
 
     @abstractmethod
     def run(self, start, goal, graph):
         pass
 
+    def steps(self, start, goal, graph, batch=STEP_BATCH):
+        """
+        Chế độ từng bước (để minh họa): generator các SearchStep, mỗi bước sau khoảng batch node
+        được lấy ra; bước cuối có result như run(). Thuật toán không hỗ trợ (CH, LPA*) chỉ có bước cuối.
+        run() không ghi lại gì nên không chậm đi khi không minh họa.
+        """
+        trace = SearchTrace()
+        result = yield from self._search(start, goal, graph, trace, batch)
+        yield trace.step(graph, result[0], result)
+
+    def _search(self, start, goal, graph, trace=None, batch=STEP_BATCH):
+        """
+        Vòng lặp tìm kiếm dạng generator: trace=None thì không bao giờ yield và trả về (count_node, path);
+        có trace thì yield trace.step(...) sau mỗi batch node. Mặc định: chạy run(), không có bước giữa.
+        """
+        return self.run(start, goal, graph)
+        yield
+
+    def _checkpoint(self, trace, batch):
+        """Số node lấy ra giữa hai lần kiểm tra hủy / yield bước, 0 nếu không cần kiểm tra"""
+        if trace is not None:
+            return max(1, batch)
+        return CANCEL_CHECK_INTERVAL if self.cancel is not None else 0
+
     def reconstruct_path(self, start, goal, came_from):
         path = []
         current = goal
@@ -20,196 +82,430 @@ class Algorithm(ABC):
         path.append(start)
         return path[::-1]
 
-class AStar(Algorithm):
-    def __init__(self, heuristic, graph = None):
+    def heuristic_for(self, graph, target, backward=False):
+        """
+        Bảng h[chỉ số node] tới target, None nếu thuật toán không dùng heuristic.
+        Heuristic có table() (GeoHeuristic, Landmarks) được tính một lần cho cả truy vấn;
+        hàm heuristic(u, v) kiểu cũ vẫn dùng được, được gọi khi tra từng node.
+        backward=True: cận dưới khoảng cách từ target tới node (phía tìm kiếm ngược).
+        """
+        heuristic = getattr(self, 'heuristic', None)
+        if heuristic is None:
+            return None
+        if hasattr(heuristic, 'table'):
+            return heuristic.table(graph, target, backward)
+        return _CallableTable(heuristic, graph.ids, int(graph.ids[target]))
+
+    def record(self, spaces, relaxed=0, heuristic_calls=0, phases=None):
+        """Cộng số liệu của các SearchSpace vào self.metrics (nếu có)"""
+        if self.metrics is None:
+            return
+        self.record_counts(popped=sum(space.popped for space in spaces),
+                           pushed=sum(space.pushed for space in spaces), relaxed=relaxed,
+                           heuristic_calls=heuristic_calls, duplicate_pops=sum(space.stale for space in spaces),
+                           peak_frontier=max(space.peak for space in spaces), phases=phases)
+
+    def record_counts(self, **counts):
+        """Cộng trực tiếp các bộ đếm (xem SearchMetrics.add) vào self.metrics (nếu có)"""
+        if self.metrics is not None:
+            self.metrics.add(**counts)
+
+    @staticmethod
+    def endpoints(start, goal, graph):
+        """Chỉ số của start/goal, (None, None) nếu không tồn tại hoặc là vật cản"""
+        s, t = graph.find_index(start), graph.find_index(goal)
+        if s is None or t is None or graph.blocked[s] or graph.blocked[t]:
+            return None, None
+        return s, t
+
+
+def _drain(search):
+    """Chạy hết generator _search (không trace nên không có bước nào) và trả về kết quả"""
+    try:
+        while True:
+            next(search)
+    except StopIteration as stop:
+        return stop.value
+
+
+class SearchTrace:
+    """Các node được lấy ra / đưa vào tập mở từ bước trước, chỉ được ghi ở chế độ từng bước"""
+
+    def __init__(self):
+        self.closed = []
+        self.frontier = []
+        self.indices = True  # closed/frontier là chỉ số node (False: đã là node_id)
+
+    def step(self, graph, popped, result=None):
+        closed, frontier = self.closed, self.frontier
+        self.closed, self.frontier = [], []
+        if self.indices:
+            closed, frontier = graph.ids[closed].tolist(), graph.ids[frontier].tolist()
+        return SearchStep(closed, frontier, popped, result)
+
+
+class _TracedDeque(deque):
+    """deque ghi lại phần tử được thêm (tập mở) và lấy ra (đã duyệt) vào trace"""
+
+    def __init__(self, iterable, trace):
+        self.trace = trace
         super().__init__()
-        self.graph = graph
+        for item in iterable:
+            self.append(item)
+
+    def append(self, item):
+        super().append(item)
+        self.trace.frontier.append(item)
+
+    def appendleft(self, item):
+        super().appendleft(item)
+        self.trace.frontier.append(item)
+
+    def pop(self):
+        item = super().pop()
+        self.trace.closed.append(item)
+        return item
+
+    def popleft(self):
+        item = super().popleft()
+        self.trace.closed.append(item)
+        return item
+
+
+class _CallableTable:
+    """Bọc hàm heuristic(u_id, v_id) thành bảng tra theo chỉ số node"""
+
+    def __init__(self, heuristic, ids, target_id):
         self.heuristic = heuristic
+        self.ids = ids
+        self.target_id = target_id
+
+    def __getitem__(self, i):
+        return self.heuristic(int(self.ids[i]), self.target_id)
+
+
+class SearchSpace:
+    """
+    Trạng thái một hướng tìm kiếm theo chỉ số node của Graph.
+
+    Heap là heapq thường với xóa lười: một node có thể nằm trong heap nhiều lần,
+    bản ghi có g lớn hơn g hiện tại bị bỏ qua khi lấy ra. g và cha lưu trong dict
+    nên chi phí mỗi truy vấn tỉ lệ với số node đã chạm tới, không phải kích thước đồ thị.
+    """
+
+    def __init__(self, source, key):
+        self.heap = [(key, source, 0.0)]
+        self.g = {source: 0.0}
+        self.parent = {source: None}
+        self.popped = 0
+        self.stale = 0  # bản ghi cũ bị bỏ khi lấy ra (xóa lười)
+        self._peak = 1
+
+    @property
+    def pushed(self):
+        # Mỗi bản ghi đưa vào heap hoặc đã được lấy ra (hợp lệ / cũ) hoặc vẫn còn trong heap
+        return self.popped + self.stale + len(self.heap)
+
+    @property
+    def peak(self):
+        """Kích thước lớn nhất của heap (heap chỉ lớn lên giữa hai lần pop nên đo lúc pop là đủ)"""
+        return max(self._peak, len(self.heap))
+
+    def push(self, node, g, key, parent):
+        self.g[node] = g
+        self.parent[node] = parent
+        heappush(self.heap, (key, node, g))
+
+    def pop(self):
+        """Lấy node có khóa nhỏ nhất còn hợp lệ, None nếu heap rỗng"""
+        heap, g = self.heap, self.g
+        if len(heap) > self._peak:
+            self._peak = len(heap)
+        while heap:
+            _, node, g_node = heappop(heap)
+            if g_node == g[node]:
+                self.popped += 1
+                return node
+            self.stale += 1
+        return None
+
+    def top_key(self):
+        """Khóa nhỏ nhất còn hợp lệ trong heap (inf nếu rỗng)"""
+        heap, g = self.heap, self.g
+        while heap and heap[0][2] != g[heap[0][1]]:
+            heappop(heap)
+            self.stale += 1
+        return heap[0][0] if heap else float('inf')
+
+    def path_to(self, node):
+        path = []
+        while node is not None:
+            path.append(node)
+            node = self.parent[node]
+        return path[::-1]
 
-    def run(self, start, goal, graph):
-        count_node = 0
-        open_queue = PriorityQueue()
-        open_queue.put((0, start))
-        open_set = set()
-        open_set.add(start)
-        came_from = {}
-        f_score = {node: float('inf') for node in graph.nodes}
-        f_score[start] = self.heuristic(start, goal)
-        g_score = {}
-        g_score[start] = 0
 
-        while not open_queue.empty():
-            _, current = open_queue.get()
-            count_node += 1
-            if current == goal:
-                return count_node, self.reconstruct_path(start, goal, came_from)
-            for neighbor in graph.neighbors(current):
-                tentative_g_score = g_score[current] + graph.cost(current, neighbor)
-                if tentative_g_score < g_score.get(neighbor, float('inf')):
-                    came_from[neighbor] = current
-                    g_score[neighbor] = tentative_g_score
-                    f_score[neighbor] = g_score[neighbor] + self.heuristic(neighbor, goal)
-                    if neighbor not in open_set:
-                        open_queue.put((f_score[neighbor], neighbor))
-                        open_set.add(neighbor)
-        return count_node, None
-
-class BidirectionalAStar(Algorithm):
-    def __init__(self, heuristic, graph=None):
+class _TracedSearchSpace(SearchSpace):
+    """SearchSpace ghi lại node được đưa vào heap / lấy ra vào trace (chế độ từng bước)"""
+
+    def __init__(self, source, key, trace):
+        super().__init__(source, key)
+        self.trace = trace
+        trace.frontier.append(source)
+
+    def push(self, node, g, key, parent):
+        super().push(node, g, key, parent)
+        self.trace.frontier.append(node)
+
+    def pop(self):
+        node = super().pop()
+        if node is not None:
+            self.trace.closed.append(node)
+        return node
+
+
+def _search_space(source, key, trace):
+    return SearchSpace(source, key) if trace is None else _TracedSearchSpace(source, key, trace)
+
+
+class BestFirstSearch(Algorithm):
+    """
+    Bộ máy tìm kiếm best-first dùng chung cho A*, Dijkstra, UCS và Greedy.
+
+    priority(g, h) cho khóa trong heap; stop_at_goal dừng khi lấy goal ra khỏi heap
+    (nếu False thì duyệt hết đồ thị như Dijkstra); relax=False giữ nguyên cha của
+    node ngay từ lần đầu gặp (Greedy).
+    """
+
+    def __init__(self, priority, heuristic=None, stop_at_goal=True, relax=True):
         super().__init__()
+        self.priority = priority
         self.heuristic = heuristic
-        self.graph = graph
+        self.stop_at_goal = stop_at_goal
+        self.relax = relax
 
     def run(self, start, goal, graph):
-        if start in graph.obstacles or goal in graph.obstacles:
-            return 0, None
-        if start == goal:
-            return 0, [start]
+        return _drain(self._search(start, goal, graph))
 
-        open_start = PriorityQueue()
-        open_goal = PriorityQueue()
-        open_set_start = {start}
-        open_set_goal = {goal}
-        closed_start = set()
-        closed_goal = set()
+    def _search(self, start, goal, graph, trace=None, batch=STEP_BATCH):
+        time_start = perf_counter()
+        s, t = self.endpoints(start, goal, graph)
+        if s is None:
+            return 0, None
+        h = self.heuristic_for(graph, t)
+        space = _search_space(s, self.priority(0.0, h[s] if h is not None else 0.0), trace)
+        time_search = perf_counter()
+        relaxed, evaluated = yield from self._settle(space, graph, graph.csr(), h,
+                                                     {t} if self.stop_at_goal else None, trace, batch)
+
+        time_path = perf_counter()
+        path = graph.ids[space.path_to(t)].tolist() if t in space.g else None
+        self.record([space], relaxed, evaluated + 1 if h is not None else 0, {"setup": time_search - time_start,
+                    "search": time_path - time_search, "path": perf_counter() - time_path})
+        return space.popped, path
+
+    def explore(self, graph, source, reverse=False, targets=None):
+        """
+        Chế độ một-tới-tất-cả (cây đường đi ngắn nhất, ma trận khoảng cách): duyệt từ source (chỉ số)
+        theo cạnh đi ra, hoặc đi vào nếu reverse, tới khi đã lấy ra mọi node trong targets (tập chỉ số,
+        bị xóa dần; None: hết đồ thị). Trả về SearchSpace: g là chi phí đã chốt, parent là node cha.
+        """
+        time_start = perf_counter()
+        space = SearchSpace(source, self.priority(0.0, 0.0))
+        csr = graph.reverse_csr() if reverse else graph.csr()
+        time_search = perf_counter()
+        relaxed, _ = _drain(self._settle(space, graph, csr, targets=targets))
+        self.record([space], relaxed, phases={"setup": time_search - time_start,
+                                              "search": perf_counter() - time_search})
+        return space
+
+    def _settle(self, space, graph, csr, h=None, targets=None, trace=None, batch=STEP_BATCH):
+        """
+        Vòng lặp chung: lấy node có khóa nhỏ nhất và nới lỏng các cạnh csr của nó (bỏ node bị chặn)
+        tới khi heap rỗng hoặc mọi node trong targets đã được lấy ra.
+        Trả về (số cạnh đã xét, số lần tính khóa, cũng là số lần tra h nếu có heuristic).
+        """
+        indptr, indices, weights = csr
+        blocked = graph.blocked if graph.num_obstacles else None
+        priority, relax = self.priority, self.relax
+        g, push = space.g, space.push
+        cancel = self.cancel
+        checkpoint = self._checkpoint(trace, batch)
+        relaxed = evaluated = 0
+        while True:
+            u = space.pop()
+            if u is None:
+                break
+            if targets is not None:
+                targets.discard(u)
+                if not targets:
+                    break
+            if checkpoint and space.popped % checkpoint == 0:
+                if cancel is not None:
+                    cancel.check()
+                if trace is not None:
+                    yield trace.step(graph, space.popped)
+            g_u = g[u]
+            a, b = indptr[u], indptr[u + 1]
+            relaxed += b - a
+            for v, w in zip(indices[a:b].tolist(), weights[a:b].tolist()):
+                if blocked is not None and blocked[v]:
+                    continue
+                g_v = g_u + w
+                if v in g and (not relax or g_v >= g[v]):
+                    continue
+                key = priority(g_v, h[v] if h is not None else 0.0)
+                evaluated += 1
+                # heuristic = inf: từ v không thể tới goal; g = inf: cạnh đã co bị chặn giữa chừng
+                if key < INF and g_v < INF:
+                    push(v, g_v, key, u)
+        return int(relaxed), evaluated
+
+class AStar(BestFirstSearch):
+    def __init__(self, heuristic, graph = None):
+        super().__init__(lambda g, h: g + h, heuristic)
+        self.graph = graph
 
-        came_from_start = {}
-        came_from_goal = {}
+class BidirectionalSearch(Algorithm):
+    """
+    Tìm kiếm hai phía dùng hai SearchSpace, heuristic=None là Dijkstra hai phía.
 
-        g_start = {start: 0}
-        g_goal = {goal: 0}
-        f_start = {start: self.heuristic(start, goal)}
-        f_goal = {goal: self.heuristic(goal, start)}
+    Phía xuôi đi từ start theo cạnh đi ra, phía ngược đi từ goal theo cạnh đi vào
+    (Graph.reverse_csr) nên đúng với đường một chiều. mu (chi phí đường tốt nhất qua điểm gặp)
+    được cập nhật ngay khi nới lỏng cạnh tới node phía kia đã chạm tới.
+    Với heuristic, hai phía dùng chung thế vị trung bình p(v) = (h_goal(v) - h_start(v)) / 2
+    (khóa xuôi g + p, khóa ngược g - p): vẫn nhất quán nếu hai heuristic nhất quán, nên điều
+    kiện dừng top_xuôi + top_ngược >= mu giống hệt Dijkstra hai phía và đường đi là tối ưu.
+    """
 
-        open_start.put((f_start[start], start))
-        open_goal.put((f_goal[goal], goal))
+    def __init__(self, heuristic=None):
+        super().__init__()
+        self.heuristic = heuristic
 
-        best_node = None
-        best_path_cost = float('inf')
-        mu = float('inf')
-        count_node = 0
+    def run(self, start, goal, graph):
+        return _drain(self._search(start, goal, graph))
 
-        while not open_start.empty() and not open_goal.empty():
-            f_min_start = open_start.queue[0][0]
-            f_min_goal = open_goal.queue[0][0]
-            if mu <= f_min_start + f_min_goal:
+    def _search(self, start, goal, graph, trace=None, batch=STEP_BATCH):
+        time_start = perf_counter()
+        s, t = self.endpoints(start, goal, graph)
+        if s is None:
+            return 0, None
+        if s == t:
+            return 0, [start]
+        h_goal = self.heuristic_for(graph, t)
+        h_start = self.heuristic_for(graph, s, backward=True)
+        potential = _AveragePotential(h_goal, h_start) if h_goal is not None else None
+        p_s = potential[s] if potential is not None else 0.0
+        p_t = potential[t] if potential is not None else 0.0
+        if p_s == INF or p_t == INF:  # heuristic cho biết không có đường từ start tới goal
+            return 0, None
+        forward = _search_space(s, p_s, trace)
+        backward = _search_space(t, -p_t, trace)
+        blocked = graph.blocked if graph.num_obstacles else None
+        forward_csr, backward_csr = graph.csr(), graph.reverse_csr()
+
+        self.mu = INF  # chi phí đường đi tốt nhất đã thấy qua điểm gặp
+        self.meeting = None
+        self.relaxed = 0
+        cancel = self.cancel
+        checkpoint = self._checkpoint(trace, batch)
+        time_search = perf_counter()
+        while forward.heap and backward.heap:
+            if self.mu <= forward.top_key() + backward.top_key():
                 break
-
-            if len(open_set_start) <= len(open_set_goal):
-                count_node += self._expand(
-                    open_start, open_set_start, closed_start, g_start, f_start, came_from_start,
-                    open_set_goal, g_goal, goal, graph
-                )
+            if checkpoint and (forward.popped + backward.popped) % checkpoint == 0:
+                if cancel is not None:
+                    cancel.check()
+                if trace is not None:
+                    yield trace.step(graph, forward.popped + backward.popped)
+            if len(forward.heap) <= len(backward.heap):
+                self._expand(forward, backward, forward_csr, potential, 1.0, blocked)
             else:
-                count_node += self._expand(
-                    open_goal, open_set_goal, closed_goal, g_goal, f_goal, came_from_goal,
-                    open_set_start, g_start, start, graph
-                )
-
-            # Kiểm tra node giao nhau giữa 2 phía
-            intersection = open_set_start & open_set_goal
-            for node in intersection:
-                if node in g_start and node in g_goal:
-                    cost = g_start[node] + g_goal[node]
-                    if cost < best_path_cost:
-                        best_path_cost = cost
-                        best_node = node
-                        mu = cost
-
-        if best_node:
-            path_start = self.reconstruct_path(start, best_node, came_from_start)
-            path_goal = self.reconstruct_path(goal, best_node, came_from_goal)[::-1]
-            if path_goal and path_goal[0] == best_node:
-                path_goal = path_goal[1:]
-            return count_node, path_start + path_goal
-        else:
-            return count_node, None
-
-    def _expand(self, open_queue, open_set, closed, g_score, f_score, came_from,
-                other_open_set, other_g_score, target, graph):
-        if open_queue.empty():
-            return 0
-
-        _, current = open_queue.get()
-        if current in closed:
-            return 0
-        open_set.discard(current)
-        closed.add(current)
-
-        for neighbor in graph.neighbors(current):
-            if neighbor in closed:
+                self._expand(backward, forward, backward_csr, potential, -1.0, blocked)
+
+        count_node = forward.popped + backward.popped
+        time_path = perf_counter()
+        path = None
+        if self.meeting is not None:
+            path = forward.path_to(self.meeting) + backward.path_to(self.meeting)[-2::-1]
+            path = graph.ids[path].tolist()
+        # Mỗi lần tính thế vị tra cả hai heuristic
+        heuristic_calls = 2 * potential.calls if potential is not None else 0
+        self.record([forward, backward], int(self.relaxed), heuristic_calls, {
+            "setup": time_search - time_start, "search": time_path - time_search, "path": perf_counter() - time_path})
+        return count_node, path
+
+    def _expand(self, space, other, csr, potential, sign, blocked):
+        """Lấy một node của space và nới lỏng các cạnh của nó; sign = -1 cho phía ngược"""
+        u = space.pop()
+        if u is None:
+            return
+        indptr, indices, weights = csr
+        g, other_g = space.g, other.g
+        g_u = g[u]
+        if u in other_g and g_u + other_g[u] < self.mu:
+            self.mu, self.meeting = g_u + other_g[u], u
+        a, b = indptr[u], indptr[u + 1]
+        self.relaxed += b - a
+        for v, w in zip(indices[a:b].tolist(), weights[a:b].tolist()):
+            if blocked is not None and blocked[v]:
                 continue
-            tentative_g = g_score[current] + graph.cost(current, neighbor)
-            if neighbor not in g_score or tentative_g < g_score[neighbor]:
-                came_from[neighbor] = current
-                g_score[neighbor] = tentative_g
-                f_score[neighbor] = tentative_g + self.heuristic(neighbor, target)
-                if neighbor not in open_set:
-                    open_queue.put((f_score[neighbor], neighbor))
-                    open_set.add(neighbor)
-        return 1
-
-class Greedy(Algorithm):
+            g_v = g_u + w
+            if g_v >= g.get(v, INF):
+                continue
+            if potential is None:
+                key = g_v
+            else:
+                p_v = potential[v]
+                if p_v == INF:  # từ v không tới được goal hoặc start không tới được v
+                    continue
+                key = g_v + sign * p_v
+            space.push(v, g_v, key, u)
+            # Cập nhật điểm gặp ngay khi nới lỏng cạnh, không cần giao hai tập mở
+            if v in other_g and g_v + other_g[v] < self.mu:
+                self.mu, self.meeting = g_v + other_g[v], v
+
+
+class _AveragePotential:
+    """Thế vị p(v) = (h_goal(v) - h_start(v)) / 2 tính khi tra, inf nếu một trong hai là inf"""
+
+    def __init__(self, h_goal, h_start):
+        self.h_goal = h_goal
+        self.h_start = h_start
+        self.calls = 0
+
+    def __getitem__(self, v):
+        self.calls += 1
+        a, b = self.h_goal[v], self.h_start[v]
+        if a == INF or b == INF:
+            return INF
+        return 0.5 * (a - b)
+
+class BidirectionalAStar(BidirectionalSearch):
+    def __init__(self, heuristic, graph=None):
+        super().__init__(heuristic)
+        self.graph = graph
+
+class Greedy(BestFirstSearch):
     def __init__(self, heuristic, graph = None):
-        super().__init__()
+        super().__init__(lambda g, h: h, heuristic, relax=False)
         self.graph = graph
-        self.heuristic = heuristic
 
-    def run(self, start, goal, graph):
-        if start in graph.obstacles or goal in graph.obstacles:
-            return 0, None # kiem tra dau vao va dich
-        count_node = 0
-        open_set = PriorityQueue()
-        open_set.put((0, start))
-        closed = set()
-        closed.add(start)
-        came_from = {}
-        while not open_set.empty():
-            count_node += 1
-            _, current = open_set.get()
-            if current == goal:
-                return count_node, self.reconstruct_path(start, goal, came_from)
-            for neighbor in graph.neighbors(current):
-                if neighbor not in came_from:
-                    came_from[neighbor] = current
-                    if neighbor not in closed:
-                        open_set.put((self.heuristic(neighbor, goal), neighbor))
-                        closed.add(neighbor)
-        return count_node, None
-
-class Dijkstra(Algorithm):
-    def __init__(self, graph = None):
-        super().__init__()
+class Dijkstra(BestFirstSearch):
+    def __init__(self, graph = None, trees = None):
+        # Dijkstra duyệt hết đồ thị rồi mới lấy đường đi tới goal
+        super().__init__(lambda g, h: g, stop_at_goal=False)
         self.graph = graph
-    
+        # tree_cache.TreeCache: giữ cả cây đường đi ngắn nhất để trả lời các goal sau từ cùng start
+        self.trees = trees
+
     def run(self, start, goal, graph):
-        if start in graph.obstacles or goal in graph.obstacles:
+        if self.trees is None:
+            return super().run(start, goal, graph)
+        s, t = self.endpoints(start, goal, graph)
+        if s is None:
             return 0, None
-        count_node = 0
-        came_from = {}
-        open_queue = PriorityQueue()
-        open_queue.put((0, start))
-        open_set = {start}
-
-        g_score = {node: float('inf') for node in graph.nodes}
-        g_score[start] = 0
-
-        while not open_queue.empty():
-            count_node += 1
-            _, current = open_queue.get()
-            open_set.remove(current)
-            for neighbor in graph.neighbors(current):
-                tentative_g_score = g_score[current] + graph.cost(current, neighbor)
-                if tentative_g_score < g_score.get(neighbor, float('inf')):
-                    came_from[neighbor] = current
-                    g_score[neighbor] = tentative_g_score
-                    if neighbor not in open_set:
-                        open_queue.put((g_score[neighbor], neighbor))
-                        open_set.add(neighbor)
-        if goal in g_score and g_score[goal] != float('inf'):
-            return count_node, self.reconstruct_path(start, goal, came_from)
-        else:
-            return count_node, None
+        return self.trees.route(graph, s, t, self)
     
 class BFS(Algorithm):
     def __init__(self, graph = None):
@@ -217,28 +513,53 @@ class BFS(Algorithm):
         self.graph = graph
     
     def run(self, start, goal, graph):
+        return _drain(self._search(start, goal, graph))
+
+    def _search(self, start, goal, graph, trace=None, batch=STEP_BATCH):
+        time_start = perf_counter()
         if start in graph.obstacles or goal in graph.obstacles:
             return 0, None
         count_node = 0
         came_from = {}
-        open_set = Queue()
-        open_set.put(start)
+        if trace is not None:
+            trace.indices = False  # BFS duyệt theo node_id
+        open_set = deque() if trace is None else _TracedDeque((), trace)
+        open_set.append(start)
         came_from[start] = None
         closed = set()
         closed.add(start)
 
-        while not open_set.empty():
+        found = False
+        relaxed = peak = 0
+        checkpoint = self._checkpoint(trace, batch)
+        time_search = perf_counter()
+        while open_set:
             count_node += 1
-            current = open_set.get()
+            if checkpoint and count_node % checkpoint == 0:
+                if self.cancel is not None:
+                    self.cancel.check()
+                if trace is not None:
+                    yield trace.step(graph, count_node)
+            if len(open_set) > peak:
+                peak = len(open_set)
+            current = open_set.popleft()
             if current == goal:
-                return count_node, self.reconstruct_path(start, goal, came_from)
-            for neighbor in graph.neighbors(current):
+                found = True
+                break
+            neighbors = graph.neighbors(current)
+            relaxed += len(neighbors)
+            for neighbor in neighbors:
                 if neighbor in closed:
                     continue
                 closed.add(neighbor)
                 came_from[neighbor] = current
-                open_set.put(neighbor)
-        return count_node, None
+                open_set.append(neighbor)
+        time_path = perf_counter()
+        path = self.reconstruct_path(start, goal, came_from) if found else None
+        self.record_counts(popped=count_node, pushed=len(came_from), relaxed=relaxed, peak_frontier=peak,
+                           phases={"setup": time_search - time_start, "search": time_path - time_search,
+                                   "path": perf_counter() - time_path})
+        return count_node, path
     
 class DFS(Algorithm):
     def __init__(self, graph = None):
@@ -246,166 +567,162 @@ class DFS(Algorithm):
         self.graph = graph
     
     def run(self, start, goal, graph):
+        return _drain(self._search(start, goal, graph))
+
+    def _search(self, start, goal, graph, trace=None, batch=STEP_BATCH):
+        time_start = perf_counter()
         if start in graph.obstacles or goal in graph.obstacles:
             return 0, None
         count_node = 0
         came_from = {}
-        open_set = []
+        if trace is not None:
+            trace.indices = False  # DFS duyệt theo node_id
+        open_set = [] if trace is None else _TracedDeque((), trace)  # ngăn xếp: append/pop ở cùng một đầu
         open_set.append(start)
         came_from[start] = None
         closed = set()
         closed.add(start)
 
+        found = False
+        relaxed = peak = 0
+        checkpoint = self._checkpoint(trace, batch)
+        time_search = perf_counter()
         while open_set:
             count_node += 1
+            if checkpoint and count_node % checkpoint == 0:
+                if self.cancel is not None:
+                    self.cancel.check()
+                if trace is not None:
+                    yield trace.step(graph, count_node)
+            if len(open_set) > peak:
+                peak = len(open_set)
             current = open_set.pop()
             if current == goal:
-                return count_node, self.reconstruct_path(start, goal, came_from)
-            for neighbor in graph.neighbors(current):
+                found = True
+                break
+            neighbors = graph.neighbors(current)
+            relaxed += len(neighbors)
+            for neighbor in neighbors:
                 if neighbor in closed:
                     continue
                 closed.add(neighbor)
                 came_from[neighbor] = current
                 open_set.append(neighbor)
-        return count_node, None
+        time_path = perf_counter()
+        path = self.reconstruct_path(start, goal, came_from) if found else None
+        self.record_counts(popped=count_node, pushed=len(came_from), relaxed=relaxed, peak_frontier=peak,
+                           phases={"setup": time_search - time_start, "search": time_path - time_search,
+                                   "path": perf_counter() - time_path})
+        return count_node, path
 
 class BellmanFord(Algorithm):
+    """
+    Bellman-Ford dạng hàng đợi (SPFA) trên CSR, dùng được với trọng số âm.
+
+    Chỉ những node vừa giảm khoảng cách mới được đưa lại vào hàng đợi, nên dừng ngay khi
+    không còn gì thay đổi thay vì luôn chạy |V|-1 vòng. SLF: node có khoảng cách nhỏ hơn
+    đầu hàng đợi được chèn lên đầu; LLL: đầu hàng đợi lớn hơn trung bình bị đẩy xuống cuối.
+    Một node vào hàng đợi tới |V| lần nghĩa là có chu trình âm tới được từ start:
+    khi đó trả về (số node đã lấy ra, None) và negative_cycle = True.
+    """
+
     def __init__(self, graph = None):
         super().__init__()
         self.graph = graph
-    
+        self.negative_cycle = False
+
     def run(self, start, goal, graph):
-        if start in graph.obstacles or goal in graph.obstacles:
-            return 0, None
-        count_node = 0
-        dist = {node: float('inf') for node in graph.nodes}
-        prev = {node: None for node in graph.nodes}
-        dist[start] = 0
-
-        for _ in range(len(graph.nodes) - 1):
-            for edge in graph.edges:
-                u, v, w = edge
-                if u in graph.obstacles or v in graph.obstacles :
-                    continue  # Bỏ qua cạnh này
-                count_node += 1
-                if dist[u] + w < dist[v]:
-                    dist[v] = dist[u] + w
-                    prev[v] = u
-            
-        for edge in graph.edges:
-            u, v, w = edge
-            if u in graph.obstacles or v in graph.obstacles :
-                continue  # Bỏ qua cạnh này
-            count_node += 1
-            if dist[u] + w < dist[v]:
-                return None
-            
-        return count_node, self.reconstruct_path(start, goal, prev)
+        return _drain(self._search(start, goal, graph))
 
-class UCS(Algorithm):
+    def _search(self, start, goal, graph, trace=None, batch=STEP_BATCH):
+        time_start = perf_counter()
+        self.negative_cycle = False
+        s, t = self.endpoints(start, goal, graph)
+        if s is None:
+            return 0, None
+        indptr, indices, weights = graph.csr()
+        blocked = graph.blocked if graph.num_obstacles else None
+        n = graph.num_nodes
+        cancel = self.cancel
+        checkpoint = self._checkpoint(trace, batch)
+
+        dist = {s: 0.0}
+        parent = {s: None}
+        enqueued = {s: 1}  # số lần mỗi node được đưa vào hàng đợi
+        queue = deque([s]) if trace is None else _TracedDeque([s], trace)
+        in_queue = {s}
+        total = 0.0  # tổng khoảng cách các node trong hàng đợi (cho LLL)
+        popped = relaxed = peak = 0
+        pushed = 1
+        time_search = perf_counter()
+        while queue:
+            if len(queue) > peak:
+                peak = len(queue)
+            # LLL (giới hạn số lần xoay vì sai số làm tròn của total)
+            average = total / len(queue)
+            for _ in range(len(queue) - 1):
+                if dist[queue[0]] <= average:
+                    break
+                queue.rotate(-1)
+            u = queue.popleft()
+            in_queue.discard(u)
+            d_u = dist[u]
+            total -= d_u
+            popped += 1
+            if checkpoint and popped % checkpoint == 0:
+                if cancel is not None:
+                    cancel.check()
+                if trace is not None:
+                    yield trace.step(graph, popped)
+            a, b = indptr[u], indptr[u + 1]
+            relaxed += b - a
+            for v, w in zip(indices[a:b].tolist(), weights[a:b].tolist()):
+                if blocked is not None and blocked[v]:
+                    continue
+                d_v = d_u + w
+                if d_v >= dist.get(v, INF):
+                    continue
+                parent[v] = u
+                if v in in_queue:
+                    total += d_v - dist[v]
+                    dist[v] = d_v
+                    continue
+                dist[v] = d_v
+                count = enqueued[v] = enqueued.get(v, 0) + 1
+                if count >= n:
+                    self.negative_cycle = True
+                    self.record_counts(popped=popped, pushed=pushed, relaxed=int(relaxed), peak_frontier=peak,
+                                       phases={"setup": time_search - time_start,
+                                               "search": perf_counter() - time_search})
+                    return popped, None
+                in_queue.add(v)
+                total += d_v
+                pushed += 1
+                if queue and d_v < dist[queue[0]]:  # SLF
+                    queue.appendleft(v)
+                else:
+                    queue.append(v)
+
+        time_path = perf_counter()
+        path = None
+        if t in dist:
+            path = []
+            node = t
+            while node is not None:
+                path.append(node)
+                node = parent[node]
+            path = graph.ids[path[::-1]].tolist()
+        self.record_counts(popped=popped, pushed=pushed, relaxed=int(relaxed), peak_frontier=peak,
+                           phases={"setup": time_search - time_start, "search": time_path - time_search,
+                                   "path": perf_counter() - time_path})
+        return popped, path
+
+class UCS(BestFirstSearch):
     def __init__(self, graph = None):
-        super().__init__()
+        super().__init__(lambda g, h: g)
         self.graph = graph
-    
-    def run(self, start, goal, graph):
-        if start in graph.obstacles or goal in graph.obstacles:
-            return 0, None
-        count_node = 0
-        open_queue = PriorityQueue()
-        open_queue.put((0, start))
-        came_from = {}
-        g_score = {node: float('inf') for node in graph.nodes}
-        g_score[start] = 0
-        open_set = {start}
 
-        while not open_queue.empty():
-            count_node += 1
-            _, current = open_queue.get()
-            if current == goal:
-                return count_node, self.reconstruct_path(start, goal, came_from)
-            for neighbor in graph.neighbors(current):
-                tentative_g_score = g_score[current] + graph.cost(current, neighbor)
-                if tentative_g_score < g_score.get(neighbor, float('inf')):
-                    came_from[neighbor] = current
-                    g_score[neighbor] = tentative_g_score
-                    if neighbor not in open_set:
-                        open_queue.put((g_score[neighbor], neighbor))
-                        open_set.add(neighbor)
-        return count_node, None
-
-class BidirectionalDijkstra(Algorithm):
+class BidirectionalDijkstra(BidirectionalSearch):
     def __init__(self, graph = None):
         super().__init__()
         self.graph = graph
-    
-    def run(self, start, goal, graph):
-        if start in graph.obstacles or goal in graph.obstacles:
-            return 0, None
-        count_node = 0
-        open_set_start = PriorityQueue()
-        open_set_goal = PriorityQueue()
-        open_set_start.put((0, start))
-        open_set_goal.put((0, goal))
-        came_from_start = {}
-        came_from_goal = {}
-        g_score_start = {node: float('inf') for node in graph.nodes}
-        g_score_goal = {node: float('inf') for node in graph.nodes}
-        g_score_start[start] = 0
-        g_score_goal[goal] = 0
-        open_set_start_set = {start}
-        open_set_goal_set = {goal}
-
-        best_node = None
-        best_path_cost = float('inf')
-        mu = float('inf')
-        while not open_set_start.empty() and not open_set_goal.empty():
-            f_min_start = open_set_start.queue[0][0]
-            f_min_goal = open_set_goal.queue[0][0]
-            if mu <= f_min_start + f_min_goal:
-                break
-
-            if len(open_set_start_set) <= len(open_set_goal_set):
-                count_node += self._expand(
-                    open_set_start, open_set_start_set, g_score_start, came_from_start,
-                    open_set_goal_set, g_score_goal, goal, graph
-                )
-            else:
-                count_node += self._expand(
-                    open_set_goal, open_set_goal_set, g_score_goal, came_from_goal,
-                    open_set_start_set, g_score_start, start, graph
-                )
-
-            # Kiểm tra node giao nhau giữa 2 phía
-            intersection = open_set_start_set & open_set_goal_set
-            for node in intersection:
-                if node in g_score_start and node in g_score_goal:
-                    cost = g_score_start[node] + g_score_goal[node]
-                    if cost < best_path_cost:
-                        best_path_cost = cost
-                        best_node = node
-                        mu = cost
-        if best_node:
-            path_start = self.reconstruct_path(start, best_node, came_from_start)
-            path_goal = self.reconstruct_path(goal, best_node, came_from_goal)[::-1]
-            if path_goal and path_goal[0] == best_node:
-                path_goal = path_goal[1:]
-            return count_node, path_start + path_goal
-        else:
-            return count_node, None
-    def _expand(self, open_queue, open_set, g_score, came_from,
-                other_open_set, other_g_score, target, graph):
-        if open_queue.empty():
-            return 0
-        _, current = open_queue.get()
-        open_set.remove(current)
-        for neighbor in graph.neighbors(current):
-            if neighbor in open_set:
-                continue
-            tentative_g_score = g_score[current] + graph.cost(current, neighbor)
-            if tentative_g_score < g_score.get(neighbor, float('inf')):
-                came_from[neighbor] = current
-                g_score[neighbor] = tentative_g_score
-                if neighbor not in open_set:
-                    open_queue.put((g_score[neighbor], neighbor))
-                    open_set.add(neighbor)
-        return 1
\ No newline at end of file
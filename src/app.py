@@ -1,30 +1,31 @@
 from tkintermapview import TkinterMapView
 import customtkinter
-from graph import Graph
-from algorithm import *
+from router import TiledRouter
+from route_worker import RouteWorker
+from algorithm import SearchCancelled
+from metrics import SearchMetrics, MetricsLog
+from osm_loader import haversine
 import time
-import osmnx as ox
-from functools import lru_cache
 import threading
-from PIL import Image, ImageTk
 from obstacle_manager import ObstacleManager
+from map_layers import MapLayers
+from nearest import route_coords
 
 
 class App(customtkinter.CTk):
     APP_NAME = "Map View - Kim Mã, Ba Đình"
     CENTER_LAT, CENTER_LON = 21.0313417781923, 105.82443016071318
-    source_path = r"res/KimMa.osm"
-    ALGORITHMS = {
-        "A*": lambda self: AStar(self.distance),
-        "Dijkstra": lambda _: Dijkstra(),
-        "Bidirectional Dijkstra": lambda _: BidirectionalDijkstra(),
-        "Greedy": lambda self: Greedy(self.distance),
-        "BFS": lambda _: BFS(),
-        "DFS": lambda _: DFS(),
-        "Bidirectional A*": lambda self: BidirectionalAStar(self.distance),
-        "UCS": lambda _: UCS(),
-        "Bellman-Ford": lambda _: BellmanFord(),
-    }
+    # Các file OSM (có thể chồng lấn) được cắt thành ô, chỉ nạp các ô quanh vùng đang xem / đang tìm
+    source_paths = (r"res/KimMa.osm", r"res/map.osm")
+    ALGORITHMS = TiledRouter.ALGORITHMS
+    HEURISTICS = TiledRouter.HEURISTICS
+    REGION_SHAPES = ("Hình chữ nhật", "Hình tròn", "Đa giác")
+    SNAP_RADIUS_M = 1000  # chỉ nhận điểm chọn cách đường không quá khoảng này
+    METRICS_LOG = "search_metrics.jsonl"  # mỗi lần tìm đường ghi một dòng số liệu
+    OBSTACLE_ICON = "res/obstacle.png"
+    REGION_ICON = "res/house-flood-water-solid.png"
+    VISUALIZE_BATCH = 32  # số node lấy ra mỗi bước khi minh họa quá trình tìm
+    FRAME_MS = 33  # mỗi khung hình vẽ một bước (~30 khung/giây)
     
     def __init__(self):
         super().__init__()
@@ -34,13 +35,18 @@ class App(customtkinter.CTk):
         self.resizable(True, True)  # Cho phép điều chỉnh kích thước cửa sổ
 
         # Khởi tạo biến instance
-        self.graph = Graph()
+        self.router = TiledRouter(self.source_paths, progress=self.report_loading)
+        self.route_worker = RouteWorker()  # một luồng tìm đường, yêu cầu mới hủy yêu cầu cũ
+        self.region_worker = RouteWorker()  # nạp các ô của khung nhìn, chỉ giữ khung mới nhất
+        self.metrics_log = MetricsLog(self.METRICS_LOG)
         self.start_node = None
         self.goal_node = None
+        self.start_point = None  # vị trí đã nhấp (lat, lon), được gắn lên cạnh gần nhất mỗi lần tìm
+        self.goal_point = None
         self.markers = []
         self.path_line = None
         self.loading_indicator = None
-        self.g = None  # Sẽ được tải trong phương thức load_graph
+        self.graph_ready = False  # Đồ thị được tải trong phương thức load_graph
         self.obstacles=[]   #Danh sách các vật cản
         self.remove_obstacle_mode= False
         self.obstacle_stack=[] # Ngan xep luu vat can
@@ -48,10 +54,15 @@ class App(customtkinter.CTk):
         self.region_start_canvas_coords = None
         self.region_rectangle = None
         self.obstacle_manager = ObstacleManager(self)
-        self.region_rectangles = []  # Lưu các ID hình chữ nhật vùng cấm
+        self.region_rectangles = []  # Lưu các ID hình vẽ vùng cấm trên canvas
+        self.region_points = []  # Các đỉnh (x, y) trên canvas của đa giác đang vẽ
         # Thiết lập giao diện và bản đồ
         self._setup_ui()
         self._initialize_map()
+        # đường đi rút gọn theo zoom, marker vật cản theo khung nhìn; khung nhìn đổi thì nạp ô bản đồ
+        self.layers = MapLayers(self.map_widget, on_view=self.load_view_region)
+        self._animation = None  # after id của bước minh họa tiếp theo
+        self._snap_graph = None  # đồ thị của lần snap_to_road gần nhất
         
         # Đăng ký sự kiện đóng cửa sổ
         self.protocol("WM_DELETE_WINDOW", self.on_closing)
@@ -140,6 +151,10 @@ class App(customtkinter.CTk):
         )
         self.alg_selector.pack(pady=padding)
 
+        self.heuristic_selector = customtkinter.CTkComboBox(
+            self.panel, values=list(self.HEURISTICS.keys())
+        )
+        self.heuristic_selector.pack(pady=padding)
 
         self.run_button = customtkinter.CTkButton(
             self.panel, 
@@ -163,6 +178,11 @@ class App(customtkinter.CTk):
         )
         self.select_area_button.pack(pady=10)
 
+        self.region_shape_selector = customtkinter.CTkComboBox(
+            self.panel, values=list(self.REGION_SHAPES)
+        )
+        self.region_shape_selector.pack(pady=10)
+
         self.remove_region_button = customtkinter.CTkButton(
             self.panel,
             text="Xóa vùng cấm",
@@ -215,6 +235,27 @@ class App(customtkinter.CTk):
             anchor="w"
         )
         self.time_label.pack(pady=5, anchor="w")
+
+        self.metrics_label = customtkinter.CTkLabel(
+            self.info_frame,
+            text="",
+            anchor="w",
+            justify="left",
+            font=customtkinter.CTkFont(size=11)
+        )
+        self.metrics_label.pack(pady=5, anchor="w")
+
+        self.trace_memory_switch = customtkinter.CTkSwitch(
+            self.info_frame,
+            text="Đo bộ nhớ (chậm hơn)"
+        )
+        self.trace_memory_switch.pack(pady=5, anchor="w")
+
+        self.visualize_switch = customtkinter.CTkSwitch(
+            self.info_frame,
+            text="Minh họa quá trình tìm"
+        )
+        self.visualize_switch.pack(pady=5, anchor="w")
         #  Ẩn các nút không cần thiết khi khởi động
         self.toggle_mode()
         
@@ -237,12 +278,15 @@ class App(customtkinter.CTk):
             self.map_widget.canvas.bind("<ButtonPress-3>", self.on_region_draw_start)
             self.map_widget.canvas.bind("<B3-Motion>", self.on_region_draw_motion)
             self.map_widget.canvas.bind("<ButtonRelease-3>", self.on_region_draw_end)
+            self.map_widget.canvas.bind("<Double-Button-3>", self.on_polygon_close)
         else:
             self.select_area_button.configure(text="Chọn vùng cấm")  # Đặt lại tên nút
             # Hủy bỏ các sự kiện vẽ vùng cấm
             self.map_widget.canvas.unbind("<ButtonPress-3>")
             self.map_widget.canvas.unbind("<B3-Motion>")
             self.map_widget.canvas.unbind("<ButtonRelease-3>")
+            self.map_widget.canvas.unbind("<Double-Button-3>")
+            self._cancel_polygon()
 
     def _initialize_map(self):
         self.map_widget.set_position(self.CENTER_LAT, self.CENTER_LON)
@@ -267,35 +311,47 @@ class App(customtkinter.CTk):
 
             lat, lon = self.map_widget.convert_canvas_coords_to_decimal_coords(event.x, event.y)
 
-            if not self.g:
+            if not self.graph_ready:
                 return  # Bản đồ chưa được tải xong
 
             print(f"Clicked at: {lat}, {lon}")
-            node = self.find_nearest_node(lat, lon)
-            print(f"Nearest node: {node}")
-
-            marker = self.map_widget.set_marker(lat, lon)
-            self.markers.append(marker)
-            if not self.start_node:
-                self.start_node = node
-                marker.set_text("Điểm đầu")
-                # Đặt màu cho marker thay vì sử dụng icon
-                if hasattr(marker, "canvas_id"):
-                    self.map_widget.canvas.itemconfig(marker.canvas_id, fill="green")
-            elif not self.goal_node:
-                self.goal_node = node
-                marker.set_text("Điểm đích")
-                # Đặt màu cho marker thay vì sử dụng icon
-                if hasattr(marker, "canvas_id"):
-                    self.map_widget.canvas.itemconfig(marker.canvas_id, fill="red")
-
-            self.update_run_button()
+            self.when_region_ready((lat, lon), (lat, lon), lambda: self.select_point(lat, lon))
 
         elif mode == "Admin":
             # Chỉ cho phép đặt vật cản trong chế độ Admin
             if getattr(self, 'obstacle_mode', False):
                 self.add_obstacle((event.x, event.y))
 
+    def select_point(self, lat, lon):
+        """Gắn điểm đã chọn lên đường gần nhất, làm điểm đầu hoặc điểm đích"""
+        if self.start_node and self.goal_node:
+            return
+        snap = self.snap_to_road(lat, lon)
+        if snap is None:
+            self.status_label.configure(text="Không có đường nào gần điểm đã chọn", text_color="red")
+            return
+        node = self.snap_node(snap)
+        print(f"Snapped to edge: {snap}")
+
+        marker = self.map_widget.set_marker(snap.lat, snap.lon)
+        self.markers.append(marker)
+        if not self.start_node:
+            self.start_node = node
+            self.start_point = (lat, lon)
+            marker.set_text("Điểm đầu")
+            # Đặt màu cho marker thay vì sử dụng icon
+            if hasattr(marker, "canvas_id"):
+                self.map_widget.canvas.itemconfig(marker.canvas_id, fill="green")
+        elif not self.goal_node:
+            self.goal_node = node
+            self.goal_point = (lat, lon)
+            marker.set_text("Điểm đích")
+            # Đặt màu cho marker thay vì sử dụng icon
+            if hasattr(marker, "canvas_id"):
+                self.map_widget.canvas.itemconfig(marker.canvas_id, fill="red")
+
+        self.update_run_button()
+
     def set_start_marker(self, coords):
         # Chỉ cho phép đặt điểm đầu trong chế độ User
         if self.toggle_mode_button.get() != "User":
@@ -309,17 +365,20 @@ class App(customtkinter.CTk):
                     marker.delete()
 
         lat, lon = coords
-        if not self.g:
+        if not self.graph_ready:
             return  # Bản đồ chưa được tải xong
 
-        node = self.find_nearest_node(lat, lon)
+        snap = self.snap_to_road(lat, lon)
+        if snap is None:
+            return
 
-        marker = self.map_widget.set_marker(lat, lon, text="Điểm đầu")
+        marker = self.map_widget.set_marker(snap.lat, snap.lon, text="Điểm đầu")
         # Đặt màu cho marker thay vì sử dụng icon
         if hasattr(marker, "canvas_id"):
             self.map_widget.canvas.itemconfig(marker.canvas_id, fill="green")
         self.markers.append(marker)
-        self.start_node = node
+        self.start_node = self.snap_node(snap)
+        self.start_point = (lat, lon)
 
         self.update_run_button()
     
@@ -336,17 +395,20 @@ class App(customtkinter.CTk):
                     marker.delete()
 
         lat, lon = coords
-        if not self.g:
+        if not self.graph_ready:
             return  # Bản đồ chưa được tải xong
 
-        node = self.find_nearest_node(lat, lon)
+        snap = self.snap_to_road(lat, lon)
+        if snap is None:
+            return
 
-        marker = self.map_widget.set_marker(lat, lon, text="Điểm đích")
+        marker = self.map_widget.set_marker(snap.lat, snap.lon, text="Điểm đích")
         # Đặt màu cho marker thay vì sử dụng icon
         if hasattr(marker, "canvas_id"):
             self.map_widget.canvas.itemconfig(marker.canvas_id, fill="red")
         self.markers.append(marker)
-        self.goal_node = node
+        self.goal_node = self.snap_node(snap)
+        self.goal_point = (lat, lon)
 
         self.update_run_button()
     
@@ -356,21 +418,17 @@ class App(customtkinter.CTk):
             self.map_widget.canvas.itemconfig(marker.canvas_id, fill=color)
     
     def update_run_button(self):
-        if self.start_node and self.goal_node and self.g:
+        if self.start_node and self.goal_node and self.graph_ready:
             self.run_button.configure(state="normal")
         else:
             self.run_button.configure(state="disabled")
 
     def load_graph(self):
         try:
-            # Tải dữ liệu đồ thị từ file OSM
-            self.g = ox.graph_from_xml(self.source_path, retain_all=True, simplify=False)
-            print(len(self.g.nodes), len(self.g.edges))
-            # Chuyển đổi sang đồ thị nội bộ
-            for node_id, data in self.g.nodes(data=True):
-                self.graph.add_node(node_id, data['y'], data['x'])
-            for u, v, data in self.g.edges(data=True):
-                self.graph.add_edge(u, v, data['length'])
+            # Dùng snapshot nhị phân nếu file OSM chưa đổi, nếu không thì đọc OSM và ghi snapshot
+            self.router.load_graph()
+            print(self.graph.num_nodes, self.graph.num_edges)
+            self.graph_ready = True
             # Cập nhật giao diện sau khi tải xong
             self.after(0, self.on_graph_loaded)
         except Exception as e:
@@ -381,75 +439,176 @@ class App(customtkinter.CTk):
                 text_color="red"
             ))
             
+    def report_loading(self, message):
+        self.after(0, lambda: self.status_label.configure(text=message, text_color="orange"))
+
     def on_graph_loaded(self):
         self.status_label.configure(text="Bản đồ đã sẵn sàng", text_color="green")
         self.update_run_button()
+        self.load_view_region()
+
+    def load_view_region(self, view=None):
+        """Nạp (trên luồng riêng) các ô bản đồ giao với khung nhìn hiện tại"""
+        if not self.graph_ready:
+            return
+        width, height = self.map_widget.canvas.winfo_width(), self.map_widget.canvas.winfo_height()
+        lat1, lon1 = self.map_widget.convert_canvas_coords_to_decimal_coords(0, 0)
+        lat2, lon2 = self.map_widget.convert_canvas_coords_to_decimal_coords(width, height)
+        self.region_worker.submit(lambda cancel: self.router.show_region(lat1, lon1, lat2, lon2),
+                                  lambda seq, changed: None)
     
-    @lru_cache(maxsize=128)
+    def when_region_ready(self, start_point, goal_point, action):
+        """
+        Gọi action() trên luồng chính khi đồ thị đã có các ô quanh hai điểm (lat, lon). Khung nhìn
+        quá rộng thì ô ở đây có thể chưa nạp: nạp trên luồng riêng để giao diện không bị treo.
+        """
+        if self.router.region_ready(start_point, goal_point):
+            action()
+            return
+        self.status_label.configure(text="Đang nạp bản đồ khu vực này...", text_color="orange")
+
+        def load():
+            self.router.prepare_route(start_point, goal_point)
+            self.after(0, lambda: (self.status_label.configure(text="Bản đồ đã sẵn sàng", text_color="green"),
+                                   action()))
+
+        threading.Thread(target=load, daemon=True).start()
+
     def find_nearest_node(self, lat, lon):
-        """Tìm nút gần nhất với tọa độ đã cho, với cache để tăng hiệu suất"""
-        return self.graph.find_nearest_node_within_radius(lat, lon, initial_radius=10, step=10, max_radius=1000)
+        """Tìm nút không bị chặn gần nhất với tọa độ đã cho (một truy vấn KDTree trên tọa độ mét)"""
+        return self.graph.find_nearest_node_within_radius(lat, lon, max_radius=self.SNAP_RADIUS_M)
+
+    def snap_to_road(self, lat, lon):
+        """Điểm gần nhất trên một cạnh không bị chặn, None nếu không có đường trong SNAP_RADIUS_M"""
+        self._snap_graph = self.graph  # đồ thị có thể được dựng lại khi nạp ô: snap_node đọc cùng đồ thị
+        return self._snap_graph.snap_to_edge(lat, lon, max_distance=self.SNAP_RADIUS_M)
+
+    def snap_node(self, snap):
+        """node_id của đầu cạnh gần điểm snap hơn (snap lấy từ snap_to_road)"""
+        return int(self._snap_graph.ids[snap.u if snap.t <= 0.5 else snap.v])
 
     def run_algorithm_thread(self):
-        """Khởi chạy thuật toán trong một luồng riêng biệt"""
+        """Gửi yêu cầu tìm đường cho luồng tìm đường; yêu cầu mới hủy lần tìm cũ chưa xong"""
         if not self.start_node or not self.goal_node:
             return
-            
+        # Đọc trạng thái giao diện trên luồng chính, luồng tìm đường chỉ nhận giá trị
+        algo_name = self.alg_selector.get()
+        if algo_name not in self.ALGORITHMS:
+            self.status_label.configure(text=f"Không tìm thấy thuật toán: {algo_name}", text_color="red")
+            return
+        heuristic_kind = self.HEURISTICS.get(self.heuristic_selector.get(), 1)
+        metrics = SearchMetrics(algo_name, trace_memory=bool(self.trace_memory_switch.get()))
+        request = (algo_name, heuristic_kind, self.start_point, self.goal_point, metrics)
+
+        def submit():
+            self.route_worker.submit(lambda cancel: self.run_algorithm(*request, cancel),
+                                     lambda seq, result: self.after(0, lambda: self.show_result(seq, result)))
+
+        self.stop_animation()
+        self.run_button.configure(state="disabled")
+        if self.visualize_switch.get():
+            # Chạy từng bước trên luồng chính theo nhịp khung hình, xong thì tìm đường như thường để vẽ kết quả
+            self.status_label.configure(text="Đang minh họa quá trình tìm...", text_color="orange")
+            self.router.heuristic_kind = heuristic_kind
+
+            def visualize():
+                if self.start_node is None or self.goal_node is None:
+                    self.update_run_button()
+                    return  # đã xóa lựa chọn trong lúc nạp ô
+                # Bản chụp riêng: ô bản đồ được dựng lại giữa chừng không đổi chỉ số node của các bước
+                graph = self.graph.snapshot()
+                try:
+                    steps = self.router.steps(algo_name, self.start_node, self.goal_node, graph=graph,
+                                              batch=self.VISUALIZE_BATCH)
+                except Exception as e:
+                    self.animation_failed(e)
+                    return
+                self._animation = self.after(0, lambda: self.animate_search(steps, graph, submit))
+
+            self.when_region_ready(self.start_point, self.goal_point, visualize)
+            return
+
         # Hiển thị trạng thái đang tìm đường
         self.status_label.configure(text="Đang tìm đường...", text_color="orange")
-        self.run_button.configure(state="disabled")
-        
-        # Khởi chạy thuật toán trong một luồng riêng
-        thread = threading.Thread(target=self.run_algorithm)
-        thread.daemon = True
-        thread.start()
+        submit()
 
-    def run_algorithm(self):
+    def animate_search(self, steps, graph, on_finish):
+        """Vẽ một bước (algorithm.SearchStep) mỗi FRAME_MS; hết bước thì gọi on_finish. graph: đồ thị steps chạy trên đó"""
         try:
-            algo_name = self.alg_selector.get()
-            algorithm_creator = self.ALGORITHMS.get(algo_name)
-            if not algorithm_creator:
-                self.after(0, lambda: self.status_label.configure(
-                    text=f"Không tìm thấy thuật toán: {algo_name}", 
-                    text_color="red"
-                ))
-                return
-                
-            algo = algorithm_creator(self)
-            # Cần điều chỉnh hàm run() trong các lớp thuật toán để trả về cả path và stats
-            # Nhưng hiện tại lớp thuật toán có thể chỉ trả về path, nên chúng ta cần xử lý cả hai trường hợp
-            time_start = time.time()
-            result = algo.run(self.start_node, self.goal_node, self.graph)
-            time_total = (time.time() - time_start) * 1000
-            
-            # Kiểm tra kết quả trả về
-            if isinstance(result, tuple) and len(result) == 2:
-                count_nodes, path = result
-                stats = {"distance": self.calculate_path_distance(path) if path else 0, "expanded_nodes": count_nodes, "time": time_total}
-            else:
-                path = result
-                stats = {"distance": self.calculate_path_distance(path) if path else 0, "expanded_nodes": "N/A", "time": time_total}
-            
-            if path:
-                # Cập nhật UI trên luồng chính
-                self.after(0, lambda: self.draw_path(path, stats))
-                self.after(0, lambda: self.status_label.configure(
-                    text=f"Đã tìm thấy đường đi ({algo_name})", 
-                    text_color="green"
-                ))
-            else:
-                self.after(0, lambda: self.status_label.configure(
-                    text="Không tìm thấy đường đi", 
-                    text_color="red"
-                ))
+            step = next(steps, None)
+            if step is not None:
+                points = [(kind, graph.indices_of(nodes)) for kind, nodes in
+                          (("frontier", step.frontier), ("closed", step.closed))]
+        except Exception as e:
+            self.animation_failed(e)
+            return
+        if step is None:
+            self._animation = None
+            self.status_label.configure(text="Đang tìm đường...", text_color="orange")
+            on_finish()
+            return
+        for kind, idx in points:
+            self.layers.exploration.add(kind, graph.lat[idx], graph.lon[idx])
+        self._animation = self.after(self.FRAME_MS, lambda: self.animate_search(steps, graph, on_finish))
+
+    def animation_failed(self, error):
+        """Minh họa bị lỗi: báo lỗi và cho phép bấm tìm đường lại"""
+        self._animation = None
+        self.status_label.configure(text=f"Lỗi: {str(error)[:50]}...", text_color="red")
+        self.update_run_button()
+
+    def stop_animation(self):
+        """Dừng minh họa đang chạy (nếu có) và xóa các node đã vẽ"""
+        if self._animation is not None:
+            self.after_cancel(self._animation)
+            self._animation = None
+        self.layers.exploration.clear()
+
+    def run_algorithm(self, algo_name, heuristic_kind, start_point, goal_point, metrics=None, cancel=None):
+        """Chạy trên luồng tìm đường; trả về kết quả cho show_result, ném SearchCancelled nếu bị hủy"""
+        try:
+            self.router.heuristic_kind = heuristic_kind
+            time_start = time.perf_counter()
+            # Mỗi lần tìm dùng một bản chụp: vật cản thêm/xóa trong lúc này không làm sai kết quả.
+            # Điểm đã chọn được gắn lại lên cạnh gần nhất (vật cản mới có thể đã chặn cạnh cũ),
+            # các ô bản đồ cần cho đường đi được nạp thêm khi cần
+            graph, start, goal, count_nodes, path, cost, cached = self.router.route_points(
+                algo_name, start_point, goal_point, self.SNAP_RADIUS_M, cancel=cancel, metrics=metrics)
+            time_total = (time.perf_counter() - time_start) * 1000
+            if metrics is not None and not cached:
+                count_nodes = metrics.popped  # cùng một ý nghĩa cho mọi thuật toán
+            stats = {"distance": cost, "expanded_nodes": count_nodes, "time": time_total, "metrics": metrics}
+            if metrics is not None:
+                metrics.extra = {"heuristic": heuristic_kind, "start": start_point, "goal": goal_point,
+                                 "found": path is not None, "cost": cost if path is not None else None,
+                                 "request_ms": time_total}
+                self.metrics_log.append(metrics)
+            if cached:
+                algo_name += ", từ cache"
+            coords = None
+            if path is not None:
+                # Đường vẽ từ điểm trên cạnh đầu, qua các node (kể cả node giữa của cạnh đã co), tới điểm trên cạnh cuối
+                coords = route_coords(graph, start, goal, path)
+            return {"algo_name": algo_name, "coords": coords, "stats": stats, "error": None}
+        except SearchCancelled:
+            raise
         except Exception as e:
-            
             error_message = f"Lỗi: {str(e)[:50]}..."
             print(error_message)
-            self.after(2000, lambda lbl=self.status_label, msg=error_message: lbl.configure(text=msg))
-        
-        # Kích hoạt lại nút tìm đường
-        self.after(0, lambda: self.run_button.configure(state="normal"))
+            return {"algo_name": algo_name, "coords": None, "stats": None, "error": error_message}
+
+    def show_result(self, seq, result):
+        """Cập nhật giao diện (luồng chính), chỉ với kết quả của yêu cầu mới nhất"""
+        if seq != self.route_worker.latest:
+            return
+        self.run_button.configure(state="normal")
+        if result["error"]:
+            self.status_label.configure(text=result["error"], text_color="red")
+        elif result["coords"] is not None:
+            self.draw_path(result["coords"], result["stats"])
+            self.status_label.configure(text=f"Đã tìm thấy đường đi ({result['algo_name']})", text_color="green")
+        else:
+            self.status_label.configure(text="Không tìm thấy đường đi", text_color="red")
 
     def clear_selection(self):
         """Xóa tất cả các điểm đã chọn và đường đi"""
@@ -459,52 +618,44 @@ class App(customtkinter.CTk):
                 marker.delete()
         self.start_node = None
         self.goal_node = None
-        self.map_widget.delete_all_path()
+        self.start_point = None
+        self.goal_point = None
+        self.route_worker.cancel()  # kết quả đang tìm (nếu có) không còn cần vẽ
+        self.stop_animation()
+        self.layers.path.clear()
         # Đặt lại nhãn thông tin
         self.distance_label.configure(text="Khoảng cách: N/A")
         self.nodes_label.configure(text="Số nút đã duyệt: N/A")
         self.time_label.configure(text="Thời gian tìm kiếm: N/A")
+        self.metrics_label.configure(text="")
         self.status_label.configure(text="Bản đồ đã sẵn sàng", text_color="green")
         
         # Cập nhật trạng thái nút tìm đường
         self.update_run_button()
 
-    @lru_cache(maxsize=128)
-    def distance(self, u, v):
-        """Tính khoảng cách giữa hai nút, với cache để tăng hiệu suất"""
-        return self.graph.heuristic1(u, v) # Sử dụng hàm heuristic của đồ thị
-        
-    def calculate_path_distance(self, path):
-        """Tính tổng khoảng cách của đường đi"""
-        if not path or len(path) < 2:
-            return 0
-            
-        total_distance = 0
-        for i in range(len(path) - 1):
-            u, v = path[i], path[i + 1]
-            total_distance += self.distance(u, v)
-
-        return total_distance
+    @property
+    def graph(self):
+        return self.router.graph
 
     def on_closing(self, event=None):
         # Đảm bảo các luồng con dừng lại khi đóng ứng dụng
         self.quit()
         self.destroy()
 
-    def draw_path(self, path, stats=None):
-        if not path:
+    def draw_path(self, coords, stats=None):
+        if len(coords) < 2:
             return
             
         # Vẽ đường đi trên bản đồ
-        coords = [self.graph.nodes[n] for n in path]
-        self.map_widget.delete_all_path()
-        self.path_line = self.map_widget.set_path(coords, color="blue", width=5)
+        self.path_line = self.layers.path.show(coords)
         
         # Cập nhật thông tin về đường đi
         if stats:
             self.distance_label.configure(text=f"Khoảng cách: {stats.get('distance', 'N/A'):.2f} m")
             self.nodes_label.configure(text=f"Số nút đã duyệt: {stats.get('expanded_nodes', 'N/A')}")
             self.time_label.configure(text=f"Thời gian tìm kiếm: {stats.get('time', 'N/A'):.3f} ms")
+            metrics = stats.get("metrics")
+            self.metrics_label.configure(text=metrics.summary() if metrics is not None else "")
             
     #Them vat can
     def add_obstacle(self, coords):
@@ -516,18 +667,17 @@ class App(customtkinter.CTk):
         if lat is None or lon is None:
             return
 
+        self.when_region_ready((lat, lon), (lat, lon), lambda: self.place_obstacle(lat, lon))
+
+    def place_obstacle(self, lat, lon):
+        """Chặn node gần (lat, lon) nhất"""
         node = self.find_nearest_node(lat, lon)
-        if node not in self.obstacles:
+        if node is not None and node not in self.obstacles:
             self.obstacles.append(node)
-            self.graph.add_obstacle(node)
+            self.router.add_obstacles([node])
             self.obstacle_stack.append(node)
-            obstacle_icon = Image.open("res\\obstacle.png")
-            obstacle_icon = obstacle_icon.resize((30, 30), Image.Resampling.LANCZOS)
-            obstacle_icon = ImageTk.PhotoImage(obstacle_icon)
-            marker = self.map_widget.set_marker(lat, lon, text="Vật cản", icon=obstacle_icon)
-            self.set_marker_color(marker, "black")
-            self.markers.append(marker)
-            self.map_widget.delete_all_path()
+            self.layers.obstacles.add(lat, lon, "Vật cản", self.OBSTACLE_ICON)
+            self.layers.path.clear()
             if self.start_node and self.goal_node:
                 self.run_algorithm_thread()
 
@@ -536,34 +686,40 @@ class App(customtkinter.CTk):
         if not self.obstacle_stack:
             return
         last_obstacle = self.obstacle_stack.pop()
-        self.graph.remove_obstacle(last_obstacle)
-        for marker in self.markers[::-1]:
-            if hasattr(marker, "text") and marker.text == "Vật cản":
-                self.markers.remove(marker)
-                marker.delete()
-                break
+        self.router.remove_obstacles([last_obstacle])
+        self.layers.obstacles.remove(self.layers.obstacles.last("Vật cản"))
         #tìm đường lại nếu có
-        self.map_widget.delete_all_path()
+        self.layers.path.clear()
         if self.start_node and self.goal_node:
             self.run_algorithm_thread()
 
     #Vung cam
     def on_region_draw_start(self,event):
+        shape = self.region_shape_selector.get()
+        if shape == "Đa giác":
+            self.add_polygon_point(event)
+            return
+        self._cancel_polygon()  # đổi sang hình khác khi đa giác chưa đóng
         self.region_start_canvas_coords=(event.x,event.y)
-        self.region_rectangle=self.map_widget.canvas.create_rectangle(
+        create = self.map_widget.canvas.create_oval if shape == "Hình tròn" else self.map_widget.canvas.create_rectangle
+        self.region_rectangle=create(
             event.x,event.y,event.x,event.y,
             outline="red",width=2,dash=(4,2)
         )
         
     def on_region_draw_motion(self,event):
+        if self.region_points:
+            return  # đa giác được vẽ bằng các lần nhấp, không kéo
         if(self.region_rectangle):
-            self.map_widget.canvas.coords(self.region_rectangle,
-                                         self.region_start_canvas_coords[0],
-                                         self.region_start_canvas_coords[1],
-                                         event.x,event.y)
+            x0, y0 = self.region_start_canvas_coords
+            if self.region_shape_selector.get() == "Hình tròn":
+                r = ((event.x - x0) ** 2 + (event.y - y0) ** 2) ** 0.5
+                self.map_widget.canvas.coords(self.region_rectangle, x0 - r, y0 - r, x0 + r, y0 + r)
+            else:
+                self.map_widget.canvas.coords(self.region_rectangle, x0, y0, event.x, event.y)
     
     def on_region_draw_end(self, event):
-        if not self.region_rectangle:
+        if not self.region_rectangle or self.region_points:
             return
 
         x1, y1 = self.region_start_canvas_coords
@@ -571,30 +727,60 @@ class App(customtkinter.CTk):
         lat1, lon1 = self.map_widget.convert_canvas_coords_to_decimal_coords(x1, y1)
         lat2, lon2 = self.map_widget.convert_canvas_coords_to_decimal_coords(x2, y2)
 
-        self.obstacle_manager.add_area_obstacles_async(lat1, lon1, lat2, lon2)
-        # self.map_widget.canvas.delete(self.region_rectangle)
+        if self.region_shape_selector.get() == "Hình tròn":
+            radius_m = float(haversine(lat1, lon1, lat2, lon2))
+            self.obstacle_manager.add_circle_obstacles_async(lat1, lon1, radius_m)
+        else:
+            self.obstacle_manager.add_area_obstacles_async(lat1, lon1, lat2, lon2)
         self.region_rectangles.append(self.region_rectangle)  # Lưu ID vùng cấm
         self.region_rectangle = None
 
+    def add_polygon_point(self, event):
+        """Chuột phải thêm một đỉnh đa giác, nhấp đúp chuột phải để đóng đa giác"""
+        if (event.x, event.y) in self.region_points:
+            return  # nhấp đúp cũng sinh một sự kiện nhấn thường tại cùng vị trí
+        self.region_points.append((event.x, event.y))
+        coords = [c for point in self.region_points for c in point]
+        if len(self.region_points) < 2:
+            return
+        if self.region_rectangle is None:
+            self.region_rectangle = self.map_widget.canvas.create_line(
+                *coords, fill="red", width=2, dash=(4, 2))
+        else:
+            self.map_widget.canvas.coords(self.region_rectangle, *coords)
+
+    def on_polygon_close(self, event):
+        if self.region_shape_selector.get() != "Đa giác" or len(self.region_points) < 3:
+            return
+        if self.region_rectangle:
+            self.map_widget.canvas.delete(self.region_rectangle)
+        polygon = self.map_widget.canvas.create_polygon(
+            *[c for point in self.region_points for c in point], outline="red", fill="", width=2, dash=(4, 2))
+        points = [self.map_widget.convert_canvas_coords_to_decimal_coords(x, y) for x, y in self.region_points]
+        self.obstacle_manager.add_polygon_obstacles_async(points)
+        self.region_rectangles.append(polygon)
+        self.region_rectangle = None
+        self.region_points = []
+
+    def _cancel_polygon(self):
+        if self.region_points and self.region_rectangle:
+            self.map_widget.canvas.delete(self.region_rectangle)
+            self.region_rectangle = None
+        self.region_points = []
+
     #Xoa vung cam
     def remove_last_region(self):
         if not self.obstacle_manager.region_stacks:
             return
-        last_region = self.obstacle_manager.region_stacks.pop()  # danh sách node
-        for node in last_region:
-            self.graph.remove_obstacle(node)
-        # nếu bạn lưu marker vùng cấm, cũng cần xóa marker tương ứng ở đây
+        last_region = self.obstacle_manager.region_stacks.pop()  # handle từ router.add_region
+        self.router.remove_region(last_region)
         # Xoá đường và chạy lại thuật toán nếu cần
         if self.region_rectangles:
             rect_id = self.region_rectangles.pop()
             self.map_widget.canvas.delete(rect_id)
-        self.map_widget.delete_all_path()
+        self.layers.path.clear()
         #xóa icon vùng cấm trên bản đồ
-        for marker in self.markers[::-1]:
-            if hasattr(marker, "text") and marker.text == "Vùng cấm":
-                self.markers.remove(marker)
-                marker.delete()
-                break
+        self.layers.obstacles.remove(self.layers.obstacles.last("Vùng cấm"))
         if self.start_node and self.goal_node:
             self.run_algorithm_thread()
     def toggle_mode(self):
@@ -609,9 +795,11 @@ class App(customtkinter.CTk):
             self.status_label_obstacle.pack_forget()
             self.alg_label.pack(pady=(5, 5))
             self.alg_selector.pack(pady=padding)
+            self.heuristic_selector.pack(pady=padding)
             self.run_button.pack(pady=padding)
             self.obstacle_button.pack_forget()
             self.select_area_button.pack_forget()
+            self.region_shape_selector.pack_forget()
             self.remove_region_button.pack_forget()
             self.remove_obstacle_button.pack_forget()
             self.clear_button.pack(pady=padding)
@@ -619,6 +807,9 @@ class App(customtkinter.CTk):
             self.distance_label.pack(pady=5,anchor="w")
             self.nodes_label.pack(pady=5,anchor="w")
             self.time_label.pack(pady=5,anchor="w")
+            self.metrics_label.pack(pady=5, anchor="w")
+            self.trace_memory_switch.pack(pady=5, anchor="w")
+            self.visualize_switch.pack(pady=5, anchor="w")
         else:
             # Hiển thị các nút trong chế độ Admin
             self.title_label.pack_forget()
@@ -627,13 +818,18 @@ class App(customtkinter.CTk):
             self.status_label_obstacle.pack(pady=padding)
             self.alg_label.pack_forget()
             self.alg_selector.pack_forget()
+            self.heuristic_selector.pack_forget()
             self.run_button.pack_forget()
             self.obstacle_button.pack(pady=10)
             self.select_area_button.pack(pady=10)
+            self.region_shape_selector.pack(pady=10)
             self.remove_region_button.pack(pady=10)
             self.remove_obstacle_button.pack(pady=10)
             self.clear_button.pack_forget()
             self.info_frame.pack_forget()
             self.distance_label.pack_forget()
             self.nodes_label.pack_forget()
-            self.time_label.pack_forget()
\ No newline at end of file
+            self.time_label.pack_forget()
+            self.metrics_label.pack_forget()
+            self.trace_memory_switch.pack_forget()
+            self.visualize_switch.pack_forget()
\ No newline at end of file
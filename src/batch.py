@@ -0,0 +1,187 @@
+"""
+Tìm đường hàng loạt cho các cặp tọa độ (lat, lon, lat, lon) không cần giao diện.
+
+    python src/batch.py pairs.csv --map KimMa --algorithm "A*" --out routes.geojson
+    python src/batch.py --random 20000 --workers 8 --out routes.csv
+
+Mỗi điểm được gắn lên cạnh gần nhất như khi nhấp trên bản đồ. Các cặp được chia thành
+từng nhóm cho ProcessPoolExecutor (đồ thị dùng chung qua shared memory), kết quả được ghi
+ra CSV/GeoJSON theo thứ tự hoàn thành nên không phải giữ toàn bộ trong bộ nhớ.
+"""
+import argparse
+import csv
+import itertools
+import json
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, wait
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np
+from parallel import graph_pool, worker_graph, default_workers
+from router import Router
+from nearest import route_coords
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MAPS = {"KimMa": os.path.join(ROOT, "res", "KimMa.osm"), "map": os.path.join(ROOT, "res", "map.osm")}
+CHUNK_SIZE = 64  # số cặp mỗi lần gửi cho tiến trình con
+SNAP_RADIUS_M = 1000  # điểm xa đường hơn thì coi như không tìm được
+CSV_FIELDS = ("id", "origin_lat", "origin_lon", "dest_lat", "dest_lon", "found", "cost_m", "expanded", "nodes", "ms")
+
+# Router của tiến trình con, dựng lần đầu trên đồ thị shared memory của pool
+_worker_router = None
+
+
+def read_pairs(path):
+    """Đọc các cặp (lat1, lon1, lat2, lon2) từ CSV: 4 cột số đầu tiên, bỏ qua dòng tiêu đề"""
+    with open(path, newline="", encoding="utf-8") as f:
+        for row in csv.reader(f):
+            try:
+                yield tuple(float(value) for value in row[:4])
+            except ValueError:
+                continue
+
+
+def random_pairs(graph, count, seed=0):
+    """count cặp tọa độ ngẫu nhiên trong khung bao của đồ thị"""
+    rng = np.random.default_rng(seed)
+    lat = rng.uniform(graph.lat.min(), graph.lat.max(), (count, 2))
+    lon = rng.uniform(graph.lon.min(), graph.lon.max(), (count, 2))
+    return np.column_stack((lat[:, 0], lon[:, 0], lat[:, 1], lon[:, 1])).tolist()
+
+
+def batch_route(router, pairs, algorithm="A*", workers=None, chunk_size=CHUNK_SIZE):
+    """
+    Generator các kết quả (dict) theo thứ tự hoàn thành; trường "id" là vị trí cặp trong pairs.
+    pairs có thể là iterable dài (đọc dần từ file): chỉ giữ vài nhóm đang chạy cho mỗi tiến trình.
+    """
+    router.algorithm(algorithm)  # dựng/ghi sẵn CH hoặc landmark một lần trước khi chia việc
+    workers = workers or default_workers()
+    rows = ((i, *map(float, pair)) for i, pair in enumerate(pairs))
+    groups = iter(lambda: list(itertools.islice(rows, chunk_size)), [])
+    if workers == 1:
+        for group in groups:
+            yield from route_rows(router, algorithm, group)
+        return
+
+    task = (router.source_path, router.heuristic_kind, algorithm)
+    with graph_pool(router.graph, workers) as pool:
+        pending = set()
+        for group in groups:
+            pending.add(pool.submit(_worker_rows, task, group))
+            if len(pending) >= workers * 2:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield from future.result()
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield from future.result()
+
+
+def route_rows(router, algorithm, rows):
+    """Gắn điểm lên cạnh và tìm đường cho các dòng (id, lat1, lon1, lat2, lon2)"""
+    graph = router.graph.snapshot()
+    results = []
+    for row_id, lat1, lon1, lat2, lon2 in rows:
+        time_start = time.perf_counter()
+        start = graph.snap_to_edge(lat1, lon1, SNAP_RADIUS_M)
+        goal = graph.snap_to_edge(lat2, lon2, SNAP_RADIUS_M)
+        expanded, path, cost = 0, None, None
+        if start is not None and goal is not None:
+            expanded, path, cost, _ = router.route_snapped(algorithm, start, goal, use_cache=False, graph=graph)
+        coords = None
+        if path is not None:
+            coords = route_coords(graph, start, goal, path)
+        results.append({
+            "id": row_id,
+            "origin": (start.lat, start.lon) if start is not None else (lat1, lon1),
+            "destination": (goal.lat, goal.lon) if goal is not None else (lat2, lon2),
+            "found": path is not None,
+            "cost": cost if path is not None else None,
+            "expanded": expanded,
+            "nodes": len(path) if path is not None else 0,
+            "ms": (time.perf_counter() - time_start) * 1000,
+            "coords": coords,
+        })
+    return results
+
+
+def _worker_rows(task, rows):
+    global _worker_router
+    source_path, heuristic_kind, algorithm = task
+    if _worker_router is None or _worker_router.graph is not worker_graph():
+        _worker_router = Router(source_path)
+        _worker_router.graph = worker_graph()
+    _worker_router.heuristic_kind = heuristic_kind
+    return route_rows(_worker_router, algorithm, rows)
+
+
+def write_csv(results, f):
+    """Ghi từng kết quả thành một dòng CSV ngay khi nhận được; trả về số dòng"""
+    writer = csv.writer(f)
+    writer.writerow(CSV_FIELDS)
+    count = 0
+    for r in results:
+        writer.writerow((r["id"], *r["origin"], *r["destination"], int(r["found"]),
+                         "" if r["cost"] is None else f"{r['cost']:.3f}", r["expanded"], r["nodes"], f"{r['ms']:.3f}"))
+        count += 1
+    return count
+
+
+def write_geojson(results, f):
+    """Ghi FeatureCollection các LineString (lon, lat) theo luồng; trả về số feature"""
+    f.write('{"type": "FeatureCollection", "features": [\n')
+    count = 0
+    for r in results:
+        geometry = None
+        if r["coords"] is not None:
+            geometry = {"type": "LineString", "coordinates": [(lon, lat) for lat, lon in r["coords"]]}
+        properties = {key: r[key] for key in ("id", "origin", "destination", "found", "cost", "expanded", "ms")}
+        f.write((",\n" if count else "") + json.dumps({"type": "Feature", "geometry": geometry,
+                                                       "properties": properties}))
+        count += 1
+    f.write("\n]}\n")
+    return count
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Tìm đường hàng loạt cho các cặp tọa độ (không cần giao diện)")
+    parser.add_argument("pairs", nargs="?", help="file CSV lat1,lon1,lat2,lon2 (mỗi dòng một cặp)")
+    parser.add_argument("--random", type=int, help="dùng N cặp tọa độ ngẫu nhiên thay cho file")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--map", default="KimMa", help="KimMa, map hoặc đường dẫn tới file .osm")
+    parser.add_argument("--algorithm", default="A*")
+    parser.add_argument("--heuristic", type=int, default=1, choices=(1, 2, 3))
+    parser.add_argument("--workers", type=int, default=default_workers(), help="số tiến trình (1: chạy tuần tự)")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    parser.add_argument("--out", default="-", help="file .csv hoặc .geojson ('-' để in CSV ra stdout)")
+    args = parser.parse_args(argv)
+    if (args.pairs is None) == (args.random is None):
+        parser.error("cần đúng một trong hai: file cặp tọa độ hoặc --random N")
+    if args.algorithm not in Router.ALGORITHMS:
+        parser.error(f"không có thuật toán: {args.algorithm}")
+
+    router = Router(MAPS.get(args.map, args.map), progress=lambda message: print(message, file=sys.stderr))
+    router.heuristic_kind = args.heuristic
+    graph = router.load_graph()
+    pairs = random_pairs(graph, args.random, args.seed) if args.random is not None else read_pairs(args.pairs)
+
+    write = write_geojson if args.out.endswith((".geojson", ".json")) else write_csv
+    time_start = time.perf_counter()
+    results = batch_route(router, pairs, args.algorithm, args.workers, args.chunk_size)
+    if args.out == "-":
+        count = write(results, sys.stdout)
+    else:
+        with open(args.out, "w", newline="", encoding="utf-8") as f:
+            count = write(results, f)
+    elapsed = time.perf_counter() - time_start
+    print(f"{count} cặp, {elapsed:.2f} s, {count / max(elapsed, 1e-9):.0f} cặp/s ({args.workers} tiến trình)",
+          file=sys.stderr)
+    return count
+
+
+if __name__ == "__main__":
+    main()
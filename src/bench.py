@@ -0,0 +1,163 @@
+"""
+Chạy thử mọi thuật toán trong Router.ALGORITHMS không cần giao diện.
+
+    python -m src.bench --map KimMa --pairs 200 --seed 0 --json bench.json
+    python src/bench.py --map res/map.osm --algorithms "A*,Dijkstra"
+
+Lấy ngẫu nhiên (theo seed) các cặp điểm đầu/đích trong thành phần liên thông mạnh lớn nhất,
+đo độ trễ (phân vị), số node đã duyệt, chi phí đường đi và độ lệch so với Dijkstra.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import connected_components
+from router import Router
+from metrics import SearchMetrics, MetricsLog, COUNTERS
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MAPS = {"KimMa": os.path.join(ROOT, "res", "KimMa.osm"), "map": os.path.join(ROOT, "res", "map.osm")}
+REFERENCE = "Dijkstra"
+GAP_TOLERANCE = 1e-9  # độ lệch tương đối nhỏ hơn coi như tối ưu (sai số làm tròn)
+
+
+def sample_pairs(graph, count, seed=0):
+    """count cặp (start, goal) khác nhau, cùng thuộc thành phần liên thông mạnh lớn nhất"""
+    indptr, indices, weights = graph.csr()
+    n = graph.num_nodes
+    _, labels = connected_components(csr_matrix((weights, indices, indptr), shape=(n, n)), connection="strong")
+    nodes = np.flatnonzero(labels == np.bincount(labels).argmax())
+    rng = np.random.default_rng(seed)
+    pairs = []
+    while len(pairs) < count and len(nodes) > 1:
+        s, t = rng.choice(nodes, 2, replace=False)
+        pairs.append((int(graph.ids[s]), int(graph.ids[t])))
+    return pairs
+
+
+def run_algorithm(router, name, pairs, budget=None, metrics_log=None):
+    """
+    Chạy một thuật toán trên các cặp; trả về thời gian tiền xử lý và kết quả từng truy vấn.
+    Dừng sớm (bỏ các cặp còn lại) khi tổng thời gian truy vấn vượt budget giây.
+    metrics_log (metrics.MetricsLog): ghi số liệu của từng truy vấn.
+    """
+    time_start = time.perf_counter()
+    algo = router.algorithm(name)
+    setup_ms = (time.perf_counter() - time_start) * 1000
+    runs = []
+    spent = 0.0
+    for start, goal in pairs:
+        if budget is not None and spent > budget:
+            break
+        algo.metrics = metrics = SearchMetrics(name)
+        time_start = time.perf_counter()
+        expanded, path = algo.run(start, goal, router.graph)
+        elapsed_ms = (time.perf_counter() - time_start) * 1000
+        spent += elapsed_ms / 1000
+        cost = router.path_cost(path) if path else None
+        if metrics_log is not None:
+            metrics.total_ms, metrics.runs = elapsed_ms, 1
+            metrics_log.append(metrics, start=start, goal=goal, cost=cost)
+        runs.append({"ms": elapsed_ms, "expanded": expanded, "cost": cost,
+                     "metrics": {counter: getattr(metrics, counter) for counter in COUNTERS + ("peak_frontier",)}})
+    return setup_ms, runs
+
+
+def summarize(name, setup_ms, runs, reference):
+    ms = np.array([r["ms"] for r in runs])
+    found = [r for r in runs if r["cost"] is not None]
+    # Đường đi dùng cạnh không tồn tại (chi phí inf) được đếm riêng, không tính vào chi phí/độ lệch
+    valid = [(r, ref) for r, ref in zip(runs, reference) if r["cost"] is not None and r["cost"] < float("inf")]
+    gaps = [r["cost"] / ref["cost"] - 1 for r, ref in valid if ref["cost"]]
+    return {
+        "algorithm": name,
+        "runs": len(runs),
+        "setup_ms": setup_ms,
+        "latency_ms": {"p50": float(np.percentile(ms, 50)), "p90": float(np.percentile(ms, 90)),
+                       "p99": float(np.percentile(ms, 99)), "mean": float(ms.mean()), "max": float(ms.max())},
+        "expanded_mean": float(np.mean([r["expanded"] for r in runs])),
+        # Cùng ý nghĩa cho mọi thuật toán (expanded là giá trị riêng mỗi thuật toán trả về)
+        "metrics_mean": {counter: float(np.mean([r["metrics"][counter] for r in runs])) for counter in runs[0]["metrics"]},
+        "cost_mean": float(np.mean([r["cost"] for r, _ in valid])) if valid else None,
+        "found": len(found),
+        "invalid": len(found) - len(valid),
+        "gap_mean": float(np.mean(gaps)) if gaps else None,
+        "gap_max": float(np.max(gaps)) if gaps else None,
+        "suboptimal": sum(gap > GAP_TOLERANCE for gap in gaps),
+    }
+
+
+def print_table(report):
+    print(f"{report['map']}: {report['nodes']} nút, {report['edges']} cạnh, "
+          f"{report['pairs']} cặp (seed {report['seed']})")
+    header = f"{'Thuật toán':<26}{'số cặp':>8}{'setup ms':>10}{'p50 ms':>11}{'p90 ms':>11}{'p99 ms':>11}" \
+             f"{'duyệt':>12}{'chi phí':>10}{'tìm thấy':>9}{'sai cạnh':>9}{'lệch TB':>9}{'lệch max':>9}{'≠ tối ưu':>9}"
+    print(header)
+    print("-" * len(header))
+    for r in report["results"]:
+        lat = r["latency_ms"]
+        print(f"{r['algorithm']:<26}{r['runs']:>8}{r['setup_ms']:>10.1f}{lat['p50']:>11.2f}{lat['p90']:>11.2f}{lat['p99']:>11.2f}"
+              f"{r['metrics_mean']['popped']:>12.1f}{_cell(r['cost_mean'], '>10.1f')}{r['found']:>9}{r['invalid']:>9}"
+              f"{_cell(r['gap_mean'], '>9.2%')}{_cell(r['gap_max'], '>9.2%')}{r['suboptimal']:>9}")
+
+
+def _cell(value, spec):
+    width = spec[1:spec.index(".")]
+    return format("-", ">" + width) if value is None else format(value, spec)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Đo hiệu năng các thuật toán tìm đường (không cần giao diện)")
+    parser.add_argument("--map", default="KimMa", help="KimMa, map hoặc đường dẫn tới file .osm")
+    parser.add_argument("--pairs", type=int, default=100, help="số cặp điểm đầu/đích")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--algorithms", help="danh sách tên thuật toán, cách nhau bởi dấu phẩy (mặc định: tất cả)")
+    parser.add_argument("--budget", type=float, default=60,
+                        help="thời gian tối đa (giây) cho mỗi thuật toán, các cặp còn lại bị bỏ qua")
+    parser.add_argument("--heuristic", type=int, default=1, choices=(1, 2, 3))
+    parser.add_argument("--json", help="ghi kết quả JSON ra file ('-' để in ra stdout)")
+    parser.add_argument("--metrics", help="ghi số liệu từng truy vấn (JSONL) ra file")
+    args = parser.parse_args(argv)
+
+    names = [name.strip() for name in args.algorithms.split(",")] if args.algorithms else list(Router.ALGORITHMS)
+    unknown = [name for name in names if name not in Router.ALGORITHMS]
+    if unknown:
+        parser.error(f"không có thuật toán: {', '.join(unknown)}")
+
+    source_path = MAPS.get(args.map, args.map)
+    router = Router(source_path, progress=lambda message: print(message, file=sys.stderr))
+    router.heuristic_kind = args.heuristic
+    graph = router.load_graph()
+    pairs = sample_pairs(graph, args.pairs, args.seed)
+
+    metrics_log = MetricsLog(args.metrics) if args.metrics else None
+    runs = {}
+    for name in [REFERENCE] + [name for name in names if name != REFERENCE]:
+        print(f"Đang chạy {name}...", file=sys.stderr)
+        runs[name] = run_algorithm(router, name, pairs, None if name == REFERENCE else args.budget, metrics_log)
+    reference = runs[REFERENCE][1]
+
+    report = {
+        "map": os.path.basename(source_path), "nodes": graph.num_nodes, "edges": graph.num_edges,
+        "pairs": len(pairs), "seed": args.seed, "heuristic": args.heuristic,
+        "results": [summarize(name, *runs[name], reference) for name in names],
+    }
+    if args.json == "-":
+        json.dump(report, sys.stdout, ensure_ascii=False, indent=2)
+        print()
+    else:
+        print_table(report)
+        if args.json:
+            with open(args.json, "w", encoding="utf-8") as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+    return report
+
+
+if __name__ == "__main__":
+    main()
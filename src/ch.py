@@ -0,0 +1,318 @@
+import os
+from time import perf_counter
+from heapq import heappush, heappop, heapify
+import numpy as np
+from algorithm import Algorithm, SearchSpace
+from parallel import graph_pool, worker_graph, chunks, default_workers
+
+WITNESS_SETTLE_LIMIT = 60  # số node tối đa một lần tìm đường chứng (witness search) được duyệt
+PARALLEL_MIN_NODES = 20000  # đồ thị nhỏ hơn thì tính thứ tự ban đầu trên một tiến trình
+
+
+class ContractionHierarchy:
+    """
+    Đồ thị phân cấp sau khi co node (Contraction Hierarchies).
+
+    rank[i] là thứ tự co của node i. Cạnh (kể cả cạnh tắt) được lưu thành hai CSR:
+    up   : tại u, các cạnh u -> v với rank[v] > rank[u] (dùng cho tìm kiếm xuôi)
+    down : tại v, các cạnh u -> v với rank[u] > rank[v], lưu u (dùng cho tìm kiếm ngược)
+    middle = -1 với cạnh gốc, ngược lại là node bị co tạo ra cạnh tắt.
+    """
+
+    FIELDS = ("rank", "up_indptr", "up_indices", "up_weights", "up_middle",
+              "down_indptr", "down_indices", "down_weights", "down_middle")
+
+    def __init__(self, fingerprint, rank, up_indptr, up_indices, up_weights, up_middle,
+                 down_indptr, down_indices, down_weights, down_middle):
+        self.fingerprint = fingerprint
+        self.rank = rank
+        self.up = (up_indptr, up_indices, up_weights, up_middle)
+        self.down = (down_indptr, down_indices, down_weights, down_middle)
+
+    @property
+    def num_nodes(self):
+        return len(self.rank)
+
+    @property
+    def num_shortcuts(self):
+        return int(np.count_nonzero(self.up[3] >= 0) + np.count_nonzero(self.down[3] >= 0))
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = path + ".tmp.npz"
+        arrays = dict(zip(self.FIELDS, (self.rank, *self.up, *self.down)))
+        np.savez(tmp_path, fingerprint=np.array(self.fingerprint), **arrays)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(str(data["fingerprint"]), *(data[name] for name in cls.FIELDS))
+
+    def query(self, s, t, algorithm=None):
+        """
+        Tìm kiếm hai phía chỉ đi lên theo rank. Trả về (số node đã lấy khỏi heap,
+        danh sách chỉ số node của đường đi đã bung cạnh tắt hoặc None).
+        algorithm: Algorithm nhận số liệu tìm kiếm (record), None nếu không cần.
+        """
+        if s == t:
+            return 0, [s]
+        time_start = perf_counter()
+        forward, backward = SearchSpace(s, 0.0), SearchSpace(t, 0.0)
+        middle = ({s: -1}, {t: -1})  # node -> middle của cạnh dẫn tới node đó
+        mu, meeting = float("inf"), None
+        sides = ((forward, backward, self.up, middle[0]), (backward, forward, self.down, middle[1]))
+        done = [False, False]
+        turn = 0
+        relaxed = 0
+        time_search = perf_counter()
+        while not all(done):
+            space, other, (indptr, indices, weights, middles), mid = sides[turn]
+            if not done[turn]:
+                # Một phía dừng khi khóa nhỏ nhất của nó đã không nhỏ hơn mu
+                if space.top_key() >= mu:
+                    done[turn] = True
+                else:
+                    u = space.pop()
+                    g_u = space.g[u]
+                    if u in other.g and g_u + other.g[u] < mu:
+                        mu, meeting = g_u + other.g[u], u
+                    if not self._stalled(u, g_u, space.g, sides[1 - turn][2]):
+                        a, b = indptr[u], indptr[u + 1]
+                        relaxed += b - a
+                        for v, w, m in zip(indices[a:b].tolist(), weights[a:b].tolist(), middles[a:b].tolist()):
+                            g_v = g_u + w
+                            if g_v < space.g.get(v, float("inf")):
+                                space.push(v, g_v, g_v, u)
+                                mid[v] = m
+            turn = 1 - turn
+
+        count_node = forward.popped + backward.popped
+        time_path = perf_counter()
+        path = self._unpack_path(s, meeting, forward, backward, middle) if meeting is not None else None
+        if algorithm is not None:
+            algorithm.record([forward, backward], int(relaxed), phases={
+                "setup": time_search - time_start, "search": time_path - time_search,
+                "path": perf_counter() - time_path})
+        return count_node, path
+
+    def _unpack_path(self, s, meeting, forward, backward, middle):
+        """Đường đi chỉ số node gốc qua điểm gặp, bung các cạnh tắt"""
+        path = [s]
+        up_chain = forward.path_to(meeting)
+        for a, b in zip(up_chain, up_chain[1:]):
+            path.extend(self._unpack(a, b, middle[0][b])[1:])
+        down_chain = backward.path_to(meeting)[::-1]
+        for a, b in zip(down_chain, down_chain[1:]):
+            # backward.parent[a] == b: cạnh gốc có chiều a -> b
+            path.extend(self._unpack(a, b, middle[1][a])[1:])
+        return path
+
+    def _stalled(self, u, g_u, g, reverse_csr):
+        """Stall-on-demand: bỏ mở rộng u nếu có node cao hơn đi tới u rẻ hơn"""
+        indptr, indices, weights, _ = reverse_csr
+        a, b = indptr[u], indptr[u + 1]
+        for v, w in zip(indices[a:b].tolist(), weights[a:b].tolist()):
+            if g.get(v, float("inf")) + w < g_u:
+                return True
+        return False
+
+    def _unpack(self, a, b, middle):
+        """Bung cạnh a -> b (có thể là cạnh tắt) thành dãy node gốc"""
+        if middle < 0:
+            return [a, b]
+        left = self._unpack(a, middle, self._middle_of(self.down, middle, a))
+        right = self._unpack(middle, b, self._middle_of(self.up, middle, b))
+        return left + right[1:]
+
+    @staticmethod
+    def _middle_of(csr, row, col):
+        indptr, indices, _, middles = csr
+        a, b = indptr[row], indptr[row + 1]
+        hit = np.flatnonzero(indices[a:b] == col)
+        return int(middles[a + hit[0]])
+
+
+class _Contractor:
+    """Đồ thị còn lại trong lúc co node: out[u] = {v: (w, middle)}, inn[v] = {u: (w, middle)}"""
+
+    def __init__(self, graph):
+        indptr, indices, weights = graph.indptr, graph.indices, graph.weights  # chi phí gốc, không tính vật cản
+        n = graph.num_nodes
+        self.out = [dict() for _ in range(n)]
+        self.inn = [dict() for _ in range(n)]
+        us = np.repeat(np.arange(n), np.diff(indptr)).tolist()
+        for u, v, w in zip(us, indices.tolist(), weights.tolist()):
+            if u != v:
+                self.out[u][v] = (w, -1)
+                self.inn[v][u] = (w, -1)
+
+    def shortcuts(self, v):
+        """Các cạnh tắt (u, w, chi phí) cần thêm nếu co v"""
+        result = []
+        out_v = self.out[v]
+        for u, (w_uv, _) in self.inn[v].items():
+            targets = {w: w_uv + w_vw for w, (w_vw, _) in out_v.items() if w != u}
+            if not targets:
+                continue
+            dist = self._witness(u, v, targets, max(targets.values()))
+            for w, need in targets.items():
+                if dist.get(w, float("inf")) > need:
+                    result.append((u, w, need))
+        return result
+
+    def _witness(self, source, excluded, targets, max_dist):
+        """
+        Dijkstra giới hạn từ source, không đi qua excluded. Đồ thị đang co là dict nên không dùng được
+        vòng lặp CSR của BestFirstSearch, nhưng heap xóa lười vẫn là SearchSpace dùng chung.
+        """
+        space = SearchSpace(source, 0.0)
+        dist, push = space.g, space.push
+        remaining = len(targets)
+        while remaining and space.popped < WITNESS_SETTLE_LIMIT:
+            u = space.pop()
+            if u is None:
+                break
+            d = dist[u]
+            if d > max_dist:
+                break
+            if u in targets:
+                remaining -= 1
+            for v, (w, _) in self.out[u].items():
+                if v == excluded:
+                    continue
+                nd = d + w
+                if nd < dist.get(v, float("inf")):
+                    push(v, nd, nd, u)
+        return dist
+
+    def priority(self, v, deleted):
+        """Edge difference + số láng giềng đã bị co"""
+        return len(self.shortcuts(v)) - len(self.inn[v]) - len(self.out[v]) + deleted[v]
+
+
+_worker_contractor = None
+
+
+def _initial_priorities(nodes):
+    """Chạy trong tiến trình con: edge difference của một phần các node"""
+    global _worker_contractor
+    graph = worker_graph()
+    if _worker_contractor is None:
+        _worker_contractor = _Contractor(graph)
+    deleted = [0] * graph.num_nodes
+    return [(_worker_contractor.priority(v, deleted), v) for v in nodes]
+
+
+def build_hierarchy(graph, workers=None, progress=None):
+    """
+    Tiền xử lý Contraction Hierarchies trên đồ thị không tính vật cản.
+    Thứ tự ban đầu (phần đắt nhất: mô phỏng co mọi node) được chia cho nhiều tiến trình;
+    sau đó co lần lượt với cập nhật ưu tiên lười.
+    """
+    report = progress or (lambda message: None)
+    n = graph.num_nodes
+    contractor = _Contractor(graph)
+    deleted = [0] * n
+
+    workers = workers or default_workers()
+    nodes = list(range(n))
+    if workers > 1 and n >= PARALLEL_MIN_NODES:
+        with graph_pool(graph, workers) as pool:
+            heap = [item for part in pool.map(_initial_priorities, chunks(nodes, workers * 4)) for item in part]
+    else:
+        heap = [(contractor.priority(v, deleted), v) for v in nodes]
+    heapify(heap)
+
+    rank = np.full(n, -1, dtype=np.int32)
+    up_edges, down_edges = [], []  # (hàng, cột, chi phí, middle)
+    level = 0
+    while heap:
+        _, v = heappop(heap)
+        if rank[v] >= 0:
+            continue
+        # Cập nhật ưu tiên lười: chỉ co nếu v vẫn tốt nhất sau khi tính lại
+        p = contractor.priority(v, deleted)
+        if heap and p > heap[0][0]:
+            heappush(heap, (p, v))
+            continue
+
+        for u, w, need in contractor.shortcuts(v):
+            if need < contractor.out[u].get(w, (float("inf"),))[0]:
+                contractor.out[u][w] = (need, v)
+                contractor.inn[w][u] = (need, v)
+        for w, (cost, mid) in contractor.out[v].items():
+            up_edges.append((v, w, cost, mid))
+            del contractor.inn[w][v]
+            deleted[w] += 1
+        for u, (cost, mid) in contractor.inn[v].items():
+            down_edges.append((v, u, cost, mid))
+            del contractor.out[u][v]
+            deleted[u] += 1
+        contractor.out[v] = {}
+        contractor.inn[v] = {}
+        rank[v] = level
+        level += 1
+        if level % 2000 == 0:
+            report(f"Đang co node: {level}/{n}")
+
+    return ContractionHierarchy(graph.fingerprint(), rank, *_to_csr(up_edges, n), *_to_csr(down_edges, n))
+
+
+def _to_csr(edges, n):
+    rows = np.array([e[0] for e in edges], dtype=np.int64)
+    cols = np.array([e[1] for e in edges], dtype=np.int32)
+    costs = np.array([e[2] for e in edges], dtype=np.float64)
+    mids = np.array([e[3] for e in edges], dtype=np.int32)
+    order = np.argsort(rows, kind="stable")
+    indptr = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=n), out=indptr[1:])
+    return indptr, cols[order], costs[order], mids[order]
+
+
+def load_or_build_hierarchy(graph, path, progress=None):
+    """Đọc hierarchy đã lưu nếu khớp với đồ thị hiện tại, nếu không thì dựng lại và lưu"""
+    try:
+        hierarchy = ContractionHierarchy.load(path)
+        if hierarchy.fingerprint == graph.fingerprint():
+            return hierarchy
+    except (OSError, KeyError, ValueError):
+        pass
+    hierarchy = build_hierarchy(graph, progress=progress)
+    try:
+        hierarchy.save(path)
+    except OSError as e:
+        print(f"Không ghi được Contraction Hierarchies: {e}")
+    return hierarchy
+
+
+class ContractionHierarchies(Algorithm):
+    """
+    Truy vấn trên ContractionHierarchy. Hierarchy được dựng khi không có vật cản,
+    nên nếu đường tìm được đi qua node đang bị chặn (hoặc đồ thị đã đổi) thì
+    chuyển sang thuật toán dự phòng trên đồ thị hiện tại.
+    """
+
+    def __init__(self, hierarchy, fallback, graph=None):
+        super().__init__()
+        self.hierarchy = hierarchy
+        self.fallback = fallback
+        self.graph = graph
+
+    def run(self, start, goal, graph):
+        s, t = self.endpoints(start, goal, graph)
+        if s is None:
+            return 0, None
+        self.fallback.cancel = self.cancel
+        self.fallback.metrics = self.metrics
+        if self.hierarchy.num_nodes != graph.num_nodes or self.hierarchy.fingerprint != graph.fingerprint():
+            return self.fallback.run(start, goal, graph)
+        count_node, path = self.hierarchy.query(s, t, self)
+        if path is not None and graph.num_obstacles and graph.blocked[graph.expand_indices(path)].any():
+            # Đường ngắn nhất khi không có vật cản bị chặn: tìm lại trên đồ thị hiện tại
+            fallback_count, fallback_path = self.fallback.run(start, goal, graph)
+            return count_node + fallback_count, fallback_path
+        if path is None:
+            # Không đi được khi chưa có vật cản thì cũng không đi được khi có
+            return count_node, None
+        return count_node, graph.ids[path].tolist()
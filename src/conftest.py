@@ -0,0 +1,78 @@
+import numpy as np
+import pytest
+from graph import Graph
+from contract import contract_chains
+from osm_loader import haversine
+
+
+def build_city(size=12, seed=0, one_way=0.15, contract=True):
+    """
+    Lưới size x size giao lộ cách nhau ~110 m, mỗi đoạn phố có hai node giữa (co lại nếu contract).
+    Chi phí mỗi đoạn = chiều dài haversine x hệ số ngẫu nhiên 1..2 của cả phố (đường đông),
+    một phần one_way số phố chỉ đi một chiều. id giao lộ (r, c) là 1 + r * size + c.
+    """
+    rng = np.random.default_rng(seed)
+    lat0, lon0, step = 21.02, 105.81, 0.001
+    coords = {1 + i: (lat0 + step * (i // size), lon0 + step * (i % size)) for i in range(size * size)}
+    us, vs, ws = [], [], []
+    next_id = 10_000
+    for r in range(size):
+        for c in range(size):
+            for r2, c2 in ((r + 1, c), (r, c + 1)):
+                if r2 >= size or c2 >= size:
+                    continue
+                a, b = 1 + r * size + c, 1 + r2 * size + c2
+                chain = [a, next_id, next_id + 1, b]
+                (lat_a, lon_a), (lat_b, lon_b) = coords[a], coords[b]
+                for k in (1, 2):
+                    coords[next_id] = (lat_a + (lat_b - lat_a) * k / 3, lon_a + (lon_b - lon_a) * k / 3)
+                    next_id += 1
+                factor = rng.uniform(1.0, 2.0)
+                both = rng.random() >= one_way
+                for p, q in zip(chain, chain[1:]):
+                    w = float(haversine(*coords[p], *coords[q])) * factor
+                    us.append(p), vs.append(q), ws.append(w)
+                    if both:
+                        us.append(q), vs.append(p), ws.append(w)
+    graph = Graph()
+    ids = list(coords)
+    graph.add_nodes(ids, [coords[i][0] for i in ids], [coords[i][1] for i in ids])
+    graph.add_edges(us, vs, ws)
+    graph.freeze()
+    return contract_chains(graph) if contract else graph
+
+
+def largest_component(graph):
+    """node_id các node trong thành phần liên thông mạnh lớn nhất"""
+    from scipy.sparse import csr_matrix
+    from scipy.sparse.csgraph import connected_components
+    indptr, indices, weights = graph.csr()
+    n = graph.num_nodes
+    _, labels = connected_components(csr_matrix((weights, indices, indptr), shape=(n, n)), connection="strong")
+    return graph.ids[labels == np.bincount(labels).argmax()]
+
+
+def sample_pairs(graph, count, seed=0):
+    """count cặp (start, goal) khác nhau trong thành phần liên thông mạnh lớn nhất"""
+    nodes = largest_component(graph)
+    rng = np.random.default_rng(seed)
+    return [tuple(int(x) for x in rng.choice(nodes, 2, replace=False)) for _ in range(count)]
+
+
+def true_distances(graph, target):
+    """d(v, target) với mọi v (theo chỉ số, có tính vật cản), Dijkstra của scipy trên cạnh ngược"""
+    from scipy.sparse import csr_matrix
+    from scipy.sparse.csgraph import dijkstra
+    indptr, indices, weights = graph.csr()
+    n = graph.num_nodes
+    weights = np.where(graph.blocked[indices] | graph.blocked[np.repeat(np.arange(n), np.diff(indptr))],
+                       np.inf, weights)
+    keep = np.isfinite(weights)
+    u = np.repeat(np.arange(n), np.diff(indptr))[keep]
+    matrix = csr_matrix((weights[keep], (indices[keep], u)), shape=(n, n))
+    return dijkstra(matrix, indices=graph.index_of(target))
+
+
+@pytest.fixture
+def city():
+    return build_city()
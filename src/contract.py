@@ -0,0 +1,114 @@
+import numpy as np
+from graph import Graph
+
+
+def contract_chains(graph):
+    """
+    Co các chuỗi node bậc 2 (node chỉ nối tiếp hai đoạn của cùng một con đường) thành một cạnh
+    có chi phí bằng tổng chi phí các đoạn, tương tự simplify của osmnx nhưng giữ hình dạng:
+    các node giữa được ghi theo thứ tự đi vào Graph.chain_nodes để vẽ và snap đúng đường,
+    và vẫn là node của đồ thị (không có cạnh) nên vẫn chọn làm vật cản được.
+
+    Node giữa là node có đúng hai láng giềng p, q và hoặc đi được cả hai chiều, hoặc chỉ
+    p -> x -> q. Chuỗi khép kín, chuỗi thành vòng tự thân hoặc trùng hai đầu với cạnh khác
+    được giữ lại node ở giữa để đồ thị vẫn không có cạnh song song. Trả về Graph mới.
+    """
+    indptr, indices, weights = graph.indptr, graph.indices, graph.weights
+    rev_indptr, sources, _ = graph.reverse_csr()
+    chain_ptr, chain_nodes = graph.chain_ptr, graph.chain_nodes
+    n = graph.num_nodes
+    keep = ~_candidates(indptr, indices, rev_indptr, sources)
+
+    while True:
+        edges, visited = _chain_edges(keep, indptr, indices, weights, chain_ptr, chain_nodes)
+        promote = _conflicts(edges)
+        # Vòng chỉ gồm node giữa (không đi tới từ node giữ lại nào): giữ một node mỗi vòng
+        for x in np.flatnonzero(~keep & ~visited).tolist():
+            if not visited[x]:
+                keep[x] = True
+                _, _, middle = _walk(x, indptr[x], keep, indptr, indices, weights, chain_ptr, chain_nodes)
+                visited[middle] = True
+                promote.append(x)
+        if not promote:
+            break
+        keep[promote] = True
+
+    edges.sort(key=lambda edge: (edge[0], edge[1]))
+    new_indptr = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(np.array([a for a, _, _, _ in edges], dtype=np.int64), minlength=n),
+              out=new_indptr[1:])
+    new_indices = np.array([b for _, b, _, _ in edges], dtype=np.int32)
+    new_weights = np.array([cost for _, _, cost, _ in edges], dtype=np.float64)
+    new_chain_ptr = np.zeros(len(edges) + 1, dtype=np.int64)
+    np.cumsum([len(middle) for _, _, _, middle in edges], out=new_chain_ptr[1:])
+    new_chain_nodes = np.array([x for _, _, _, middle in edges for x in middle], dtype=np.int32)
+
+    contracted = Graph.from_arrays(graph.ids, graph.lat, graph.lon, new_indptr, new_indices, new_weights,
+                                   new_chain_ptr, new_chain_nodes)
+    if graph.num_obstacles:
+        contracted.block_indices(np.flatnonzero(graph.blocked))
+    return contracted
+
+
+def _candidates(indptr, indices, rev_indptr, sources):
+    """Mặt nạ các node có thể co: đúng hai láng giềng, hai chiều hoặc một chiều đi qua"""
+    out_deg, in_deg = np.diff(indptr), np.diff(rev_indptr)
+    candidate = np.zeros(len(out_deg), dtype=bool)
+    for x in np.flatnonzero(((out_deg == 1) & (in_deg == 1)) | ((out_deg == 2) & (in_deg == 2))).tolist():
+        out = set(indices[indptr[x]:indptr[x + 1]].tolist())
+        inn = set(sources[rev_indptr[x]:rev_indptr[x + 1]].tolist())
+        if x in out or x in inn:
+            continue
+        candidate[x] = out == inn if len(out) == 2 else out != inn
+    return candidate
+
+
+def _walk(a, k, keep, indptr, indices, weights, chain_ptr, chain_nodes):
+    """Đi từ cạnh thứ k (ra khỏi node a) qua các node giữa tới node giữ lại: (node cuối, chi phí, node giữa)"""
+    prev, x, cost = a, int(indices[k]), float(weights[k])
+    middle = chain_nodes[chain_ptr[k]:chain_ptr[k + 1]].tolist()  # đồ thị đã co từ trước
+    while not keep[x]:
+        middle.append(x)
+        # Node hai chiều: đi tiếp sang láng giềng còn lại; node một chiều chỉ có một cạnh ra
+        for j in range(indptr[x], indptr[x + 1]):
+            if indices[j] != prev:
+                break
+        middle += chain_nodes[chain_ptr[j]:chain_ptr[j + 1]].tolist()
+        prev, x = x, int(indices[j])
+        cost += float(weights[j])
+    return x, cost, middle
+
+
+def _chain_edges(keep, indptr, indices, weights, chain_ptr, chain_nodes):
+    """Các cạnh (a, b, chi phí, node giữa) giữa các node giữ lại, và mặt nạ node giữa đã đi qua"""
+    edges = []
+    visited = np.zeros(len(keep), dtype=bool)
+    for a in np.flatnonzero(keep).tolist():
+        for k in range(indptr[a], indptr[a + 1]):
+            b, cost, middle = _walk(a, k, keep, indptr, indices, weights, chain_ptr, chain_nodes)
+            visited[middle] = True
+            edges.append((a, b, cost, middle))
+    return edges, visited
+
+
+def _conflicts(edges):
+    """Node giữa cần giữ lại để bỏ vòng tự thân và các cạnh trùng hai đầu"""
+    promote = []
+    by_pair = {}
+    for a, b, _, middle in edges:
+        if a == b:
+            if middle:
+                promote.append(_middle(middle))
+        else:
+            by_pair.setdefault((a, b), []).append(middle)
+    for middles in by_pair.values():
+        if len(middles) > 1:
+            # Giữ cạnh gốc hoặc chuỗi ngắn nhất; xếp như nhau ở cả hai chiều của một con đường
+            middles.sort(key=lambda middle: (len(middle), min(middle, default=-1)))
+            promote += [_middle(middle) for middle in middles[1:]]
+    return promote
+
+
+def _middle(middle):
+    """Node ở giữa chuỗi, chọn như nhau khi đi theo chiều ngược lại"""
+    return min(middle[(len(middle) - 1) // 2], middle[len(middle) // 2])
@@ -0,0 +1,78 @@
+import numpy as np
+from algorithm import Dijkstra
+from parallel import graph_pool, worker_graph, chunks, default_workers
+
+PARALLEL_MIN_SOURCES = 64  # ít nguồn hơn thì chạy trên một tiến trình (tránh chi phí tạo pool)
+
+
+def distance_matrix(graph, sources, targets, predecessors=False, workers=None):
+    """
+    Ma trận chi phí đường đi ngắn nhất từ mỗi node nguồn tới mỗi node đích (theo node_id).
+
+    Mỗi nguồn chạy một Dijkstra một-tới-nhiều, dừng ngay khi mọi đích đã được chốt,
+    các nguồn được chia cho nhiều tiến trình. Có tính vật cản; cặp không đi được là inf.
+    Node giữa của cạnh đã co (Graph.chain_nodes) không có cạnh riêng nên không làm nguồn/đích
+    được (ValueError).
+    Trả về mảng float64 kích thước (len(sources), len(targets)); nếu predecessors=True trả
+    thêm mảng int32 (len(sources), num_nodes) chứa chỉ số node cha (-1 nếu không có),
+    dùng path_from_predecessors() để dựng lại đường đi.
+    """
+    src = graph.indices_of(sources)
+    dst = graph.indices_of(targets)
+    graph.check_endpoints(src)
+    graph.check_endpoints(dst)
+    workers = workers or default_workers()
+    jobs = [(int(s), predecessors) for s in src]
+
+    if workers > 1 and len(jobs) >= PARALLEL_MIN_SOURCES:
+        with graph_pool(graph, workers) as pool:
+            parts = pool.map(_worker_rows, [(part, dst) for part in chunks(jobs, workers * 4)])
+            rows = [row for part in parts for row in part]
+    else:
+        rows = [_one_to_many(graph, s, dst, with_pred) for s, with_pred in jobs]
+
+    dist = np.array([row[0] for row in rows], dtype=np.float64).reshape(len(src), len(dst))
+    if not predecessors:
+        return dist
+    pred = np.full((len(src), graph.num_nodes), -1, dtype=np.int32)
+    for i, (_, parent) in enumerate(rows):
+        if parent:
+            nodes = np.fromiter(parent.keys(), dtype=np.int64, count=len(parent))
+            pred[i, nodes] = np.fromiter(parent.values(), dtype=np.int32, count=len(parent))
+    return dist, pred
+
+
+def path_from_predecessors(graph, pred_row, source, target):
+    """Đường đi (danh sách node_id) từ source tới target theo một hàng predecessors, None nếu không tới được"""
+    s, node = graph.index_of(source), graph.index_of(target)
+    path = [node]
+    while pred_row[node] >= 0:
+        node = int(pred_row[node])
+        path.append(node)
+    if node != s:
+        return None
+    return graph.ids[path[::-1]].tolist()
+
+
+def _worker_rows(args):
+    jobs, dst = args
+    graph = worker_graph()
+    return [_one_to_many(graph, s, dst, with_pred) for s, with_pred in jobs]
+
+
+def _one_to_many(graph, source, targets, with_pred=False):
+    """Dijkstra từ source (chỉ số) tới khi chốt hết targets; trả về (chi phí, dict cha)"""
+    targets = targets.tolist()
+    row = [float('inf')] * len(targets)
+    blocked = graph.blocked if graph.num_obstacles else None
+    if blocked is not None and blocked[source]:
+        return row, {}
+    # Đích bị chặn không bao giờ được lấy ra: không chờ chúng
+    remaining = {t for t in targets if blocked is None or not blocked[t]}
+    space = Dijkstra().explore(graph, source, targets=remaining)
+    g = space.g
+    for j, t in enumerate(targets):
+        row[j] = g.get(t, row[j])  # node đích đã lấy ra (hoặc heap đã rỗng) nên g là chi phí cuối
+    parent = space.parent
+    del parent[source]
+    return row, (parent if with_pred else None)
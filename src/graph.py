@@ -1,54 +1,586 @@
+import hashlib
 import math
+import threading
+from collections import deque
+from itertools import count
 from math import radians, sin, cos, sqrt, atan2
-from scipy.spatial import KDTree
-from geopy.distance import geodesic
+from collections.abc import Mapping
+import numpy as np
+from spatial import GridIndex
+from nearest import NearestIndex
+
+EARTH_RADIUS_M = 6371009  # cùng bán kính dùng để tính chiều dài cạnh
+CHANGE_LOG_SIZE = 256  # số lần thay đổi vật cản gần nhất được ghi lại cho changes_since()
+_graph_uids = count(1)
+
+
+def _frozen(array):
+    """Đánh dấu mảng chỉ đọc: vật cản được thay bằng mảng mới, không sửa tại chỗ"""
+    array.flags.writeable = False
+    return array
+
+
+class NodeView(Mapping):
+    """node_id -> (lat, lon), đọc trực tiếp từ mảng tọa độ của Graph"""
+
+    def __init__(self, graph):
+        self._graph = graph
+
+    def __getitem__(self, node_id):
+        i = self._graph.index_of(node_id)
+        return float(self._graph.lat[i]), float(self._graph.lon[i])
+
+    def __contains__(self, node_id):
+        return self._graph.find_index(node_id) is not None
+
+    def __iter__(self):
+        return iter(self._graph.ids.tolist())
+
+    def __len__(self):
+        return self._graph.num_nodes
+
+
+class AdjacencyView(Mapping):
+    """node_id -> list of (neighbor_id, cost), tạo từ hàng CSR khi được đọc"""
+
+    def __init__(self, graph):
+        self._graph = graph
+
+    def __getitem__(self, node_id):
+        g = self._graph
+        i = g.index_of(node_id)
+        a, b = g.indptr[i], g.indptr[i + 1]
+        return list(zip(g.ids[g.indices[a:b]].tolist(), g.weights[a:b].tolist()))
+
+    def __contains__(self, node_id):
+        return self._graph.find_index(node_id) is not None
+
+    def __iter__(self):
+        return iter(self._graph.ids.tolist())
+
+    def __len__(self):
+        return self._graph.num_nodes
+
+
+class EdgeView:
+    """Danh sách (u, v, cost) của mọi cạnh, không lưu thêm bản sao nào"""
+
+    def __init__(self, graph):
+        self._graph = graph
+
+    def __iter__(self):
+        g = self._graph
+        us = np.repeat(g.ids, np.diff(g.indptr)).tolist()
+        vs = g.ids[g.indices].tolist()
+        return zip(us, vs, g.weights.tolist())
+
+    def __len__(self):
+        return self._graph.num_edges
+
+
+class ObstacleView:
+    """Tập node_id là vật cản, đọc từ mảng bool blocked của Graph"""
+
+    def __init__(self, graph):
+        self._graph = graph
+
+    def __contains__(self, node_id):
+        i = self._graph.find_index(node_id)
+        return i is not None and bool(self._graph.blocked[i])
+
+    def __iter__(self):
+        g = self._graph
+        return iter(g.ids[g.blocked].tolist())
+
+    def __len__(self):
+        return self._graph.num_obstacles
+
+    def __bool__(self):
+        return self._graph.num_obstacles > 0
+
 
 class Graph:
+    """
+    Đồ thị đường đi lưu dạng CSR (compressed sparse row).
+
+    Node được đánh chỉ số liên tục 0..n-1 theo thứ tự id OSM tăng dần, nên tra
+    id -> chỉ số chỉ cần searchsorted, không cần dict. Cạnh ra của node i nằm
+    trong indices[indptr[i]:indptr[i+1]] với chi phí tương ứng trong weights.
+    nodes / node_coords / adj_list / edges chỉ là view trên các mảng này.
+
+    Vật cản là mảng bool blocked theo chỉ số node, các thuật toán bỏ qua node bị chặn khi mở rộng.
+    Mảng này không bao giờ bị sửa tại chỗ: thêm/xóa vật cản tạo mảng mới rồi mới gắn vào
+    đồ thị (copy-on-write), nên snapshot() lấy trước đó vẫn thấy đúng trạng thái cũ.
+
+    Đồ thị có thể đã co chuỗi node bậc 2 (contract.contract_chains): cạnh e khi đó thay cho
+    cả một đoạn đường, các node giữa (theo thứ tự đi) nằm trong
+    chain_nodes[chain_ptr[e]:chain_ptr[e+1]]. Node giữa vẫn có tọa độ và có thể bị chặn
+    nhưng không có cạnh; chặn nó làm cạnh chứa nó có chi phí inf trong csr().
+    """
+
     def __init__(self):
-        self.nodes = {}  # node_id -> (lat, lon)
-        self.adj_list = {}  # node_id -> list of (neighbor_id, cost)
-        self.edges = []  # (u, v, cost) cho Bellman-Ford
-        self.node_coords = {} # Dictionary để lưu tọa độ các node (nút)
-        self.obstacles=set() # tap hop cac node_id la vat can
-        self._removed_edges={}  # node_id->list of(u,v,cost)
+        self._ids = np.empty(0, dtype=np.int64)  # chỉ số -> node_id (đã sắp xếp)
+        self._lat = np.empty(0, dtype=np.float64)
+        self._lon = np.empty(0, dtype=np.float64)
+        self._indptr = np.zeros(1, dtype=np.int64)
+        self._indices = np.empty(0, dtype=np.int32)
+        self._weights = np.empty(0, dtype=np.float64)
+        self._chain_ptr = np.zeros(1, dtype=np.int64)  # cạnh -> đoạn trong _chain_nodes
+        self._chain_nodes = np.empty(0, dtype=np.int32)  # chỉ số các node giữa của cạnh đã co
+        self._live_weights = None  # weights khi có cạnh đã co bị chặn giữa chừng (None: như weights)
+        self._live_reverse = None  # (live weights, weights ngược tương ứng)
+        self._blocked = _frozen(np.zeros(0, dtype=bool))
+        self.num_obstacles = 0
+        # version tăng mỗi khi vật cản hoặc cấu trúc đồ thị thay đổi
+        self.version = 0
+        self._structure_version = 0
+        # version chỉ so được trong cùng một đồ thị: cache kiểm tra thêm uid (bản chụp giữ uid của gốc)
+        self.uid = next(_graph_uids)
+        self._changes = deque(maxlen=CHANGE_LOG_SIZE)  # (version, chỉ số đổi trạng thái, bỏ chặn?)
+        # Chỉ các thao tác sửa giữ khóa; tìm đường chạy trên snapshot() nên không cần khóa
+        self._write_lock = threading.RLock()
+        self.base = self  # đồ thị gốc (chính nó, hoặc đồ thị mà bản chụp được lấy từ đó)
+        self._make_views()
+
+        # Node/cạnh thêm vào được gom lại (từng cái hoặc theo mảng), dựng CSR một lần khi cần đọc
+        self._pending_nodes = ([], [], [])
+        self._pending_edges = ([], [], [])
+        self._node_chunks = []
+        self._edge_chunks = []
+
+        # Dữ liệu dẫn xuất từ cấu trúc (fingerprint, CSR ngược, tọa độ ENU, chỉ mục không gian),
+        # dựng khi cần; dùng chung với các bản chụp, freeze() thay bằng dict mới
+        self._derived = {}
+
+    def _make_views(self):
+        self.nodes = NodeView(self)  # node_id -> (lat, lon)
+        self.node_coords = self.nodes
+        self.adj_list = AdjacencyView(self)  # node_id -> list of (neighbor_id, cost)
+        self.edges = EdgeView(self)  # (u, v, cost) của mọi cạnh
+        self.obstacles = ObstacleView(self)  # tap hop cac node_id la vat can
+
+    @classmethod
+    def from_arrays(cls, ids, lat, lon, indptr, indices, weights, chain_ptr=None, chain_nodes=None):
+        """Tạo đồ thị trực tiếp từ các mảng CSR (ids phải tăng dần), không sao chép"""
+        graph = cls()
+        graph._ids, graph._lat, graph._lon = ids, lat, lon
+        graph._indptr, graph._indices, graph._weights = indptr, indices, weights
+        if chain_nodes is not None and len(chain_nodes):
+            graph._chain_ptr, graph._chain_nodes = chain_ptr, chain_nodes
+        else:
+            graph._chain_ptr = np.zeros(len(indices) + 1, dtype=np.int64)
+        graph._blocked = _frozen(np.zeros(len(ids), dtype=bool))
+        return graph
+
+    def snapshot(self):
+        """
+        Bản chụp chỉ đọc của đồ thị ở version hiện tại, dùng cho một lần tìm đường.
+        Không sao chép mảng nào: CSR, mảng vật cản (bất biến) và dữ liệu dẫn xuất được dùng
+        chung, thay đổi vật cản hay cấu trúc sau đó chỉ gắn mảng mới vào đồ thị gốc.
+        """
+        if self.base is not self:
+            return self
+        self._sync()
+        with self._write_lock:
+            snap = Graph.__new__(Graph)
+            snap.__dict__.update(self.__dict__)
+            snap._changes = tuple(self._changes)
+        snap._pending_nodes = snap._pending_edges = ((), (), ())
+        snap._node_chunks = snap._edge_chunks = ()
+        snap._make_views()
+        return snap
+
+    def _check_writable(self):
+        if self.base is not self:
+            raise TypeError("Bản chụp đồ thị chỉ đọc, hãy sửa trên đồ thị gốc")
+
+    def _cached(self, key, build):
+        value = self._derived.get(key)
+        if value is None:
+            value = self._derived.setdefault(key, build())
+        return value
+
+    # Các mảng CSR chỉ được đọc sau khi đã gộp hết node/cạnh đang chờ
+    @property
+    def ids(self):
+        self._sync()
+        return self._ids
+
+    @property
+    def lat(self):
+        self._sync()
+        return self._lat
+
+    @property
+    def lon(self):
+        self._sync()
+        return self._lon
+
+    @property
+    def indptr(self):
+        self._sync()
+        return self._indptr
+
+    @property
+    def indices(self):
+        self._sync()
+        return self._indices
+
+    @property
+    def weights(self):
+        self._sync()
+        return self._weights
+
+    @property
+    def chain_ptr(self):
+        self._sync()
+        return self._chain_ptr
+
+    @property
+    def chain_nodes(self):
+        self._sync()
+        return self._chain_nodes
 
-        self._kd_tree = None  # KDTree for nearest neighbor search
-        self._node_ids = []  # list of node ids for KDTree
+    @property
+    def blocked(self):
+        self._sync()
+        return self._blocked
+
+    def fingerprint(self):
+        """sha1 của cấu trúc đồ thị (id, CSR, chiều dài cạnh) để kiểm tra dữ liệu tiền xử lý còn khớp"""
+        self._sync()
+
+        def build():
+            sha1 = hashlib.sha1()
+            arrays = (self._ids, self._indptr, self._indices, self._weights)
+            if len(self._chain_nodes):
+                arrays += (self._chain_ptr, self._chain_nodes)
+            for arr in arrays:
+                sha1.update(np.ascontiguousarray(arr).tobytes())
+            return sha1.hexdigest()
+        return self._cached("fingerprint", build)
+
+    @property
+    def xy(self):
+        """Tọa độ (x, y) theo mét trong hệ ENU đặt tại tâm đồ thị, mảng (n, 2)"""
+        return self._cached("xy", lambda: self.to_xy(self.lat, self.lon))
+
+    def to_xy(self, lat, lon):
+        """
+        Chiếu (lat, lon) lên mặt phẳng tiếp xúc ENU tại gốc (trái đất cầu, cùng bán kính
+        với chiều dài cạnh). Hình chiếu không làm dài khoảng cách nên khoảng cách
+        Euclid trên mặt phẳng luôn <= khoảng cách vòng tròn lớn: heuristic chấp nhận được.
+        """
+        origin = self._cached("origin", lambda: (float(self.lat.mean()), float(self.lon.mean()))
+                              if self.num_nodes else (0.0, 0.0))
+        lat0, lon0 = np.radians(origin)
+        lat, lon = np.radians(lat), np.radians(lon)
+        cos_lat = np.cos(lat)
+        x, y, z = cos_lat * np.cos(lon), cos_lat * np.sin(lon), np.sin(lat)
+        east = -np.sin(lon0) * x + np.cos(lon0) * y
+        north = -np.sin(lat0) * np.cos(lon0) * x - np.sin(lat0) * np.sin(lon0) * y + np.cos(lat0) * z
+        return np.stack((east, north), axis=-1) * EARTH_RADIUS_M
+
+    def heuristic_table(self, target, kind=1):
+        """
+        Giá trị heuristic từ mọi node tới node có chỉ số target, tính một lần bằng numpy.
+        kind = 1, 2, 3 tương ứng heuristic1/2/3.
+        """
+        if kind == 1:
+            d = self.xy - self.xy[target]
+            return np.hypot(d[:, 0], d[:, 1])
+        lat, lon = self.lat, self.lon
+        lat_t, lon_t = lat[target], lon[target]
+        dx = (lon_t - lon) * 111320 * np.cos(np.radians((lat + lat_t) / 2))
+        dy = (lat_t - lat) * 111320
+        dist = np.hypot(dx, dy)
+        if kind == 2:
+            return dist
+        multiplier = np.minimum(1 + np.abs(np.arctan2(dy, dx)) / (math.pi / 4), 2)
+        return dist * multiplier
+
+    def csr(self):
+        """
+        (indptr, indices, weights) để các thuật toán duyệt trực tiếp theo chỉ số.
+        weights là chi phí tìm đường hiện tại: cạnh đã co đi qua node bị chặn có chi phí inf.
+        """
+        self._sync()
+        live = self._live_weights
+        return self._indptr, self._indices, self._weights if live is None else live
+
+    def distance_matrix(self, sources, targets, predecessors=False, workers=None):
+        """Ma trận chi phí đường đi ngắn nhất nhiều-tới-nhiều (xem distance_matrix.distance_matrix)"""
+        from distance_matrix import distance_matrix  # distance_matrix -> parallel -> graph
+        return distance_matrix(self, sources, targets, predecessors, workers)
+
+    def reverse_csr(self):
+        """(indptr, indices, weights) của đồ thị ngược: hàng i chứa các cạnh đi vào node i"""
+        self._sync()
+
+        def build():
+            n = self.num_nodes
+            sources = np.repeat(np.arange(n, dtype=np.int32), np.diff(self._indptr))
+            order = np.argsort(self._indices, kind='stable')
+            indptr = np.zeros(n + 1, dtype=np.int64)
+            np.cumsum(np.bincount(self._indices, minlength=n), out=indptr[1:])
+            return indptr, sources[order], self._weights[order], order
+        indptr, sources, weights, order = self._cached("reverse", build)
+        live = self._live_weights
+        if live is not None:
+            # Chi phí ngược tính lại một lần cho mỗi mảng live weights
+            memo = self._live_reverse
+            if memo is None or memo[0] is not live:
+                memo = self._live_reverse = (live, live[order])
+            weights = memo[1]
+        return indptr, sources, weights
+
+    def _sync(self):
+        if self._pending_nodes[0] or self._pending_edges[0] or self._node_chunks or self._edge_chunks:
+            self.freeze()
+
+    @property
+    def num_nodes(self):
+        return len(self.ids)
+
+    @property
+    def num_edges(self):
+        return len(self.indices)
 
     def add_node(self, node_id, lat, lon):
-        
-        self.nodes[node_id] = (lat, lon)
-        self.adj_list[node_id] = []
-        self.kd_tree = None  # Reset KDTree when adding a new node
-        self._node_ids.append(node_id)
-        self.node_coords[node_id] = (lat, lon)
+        self._check_writable()
+        ids, lats, lons = self._pending_nodes
+        ids.append(node_id)
+        lats.append(lat)
+        lons.append(lon)
 
     def add_edge(self, u, v, cost):
-        if u in self.obstacles or v in self.obstacles:
-            return # Khong them canh neu u va v la vat can
-        self.adj_list[u].append((v, cost))
-        self.edges.append((u, v, cost))
+        self._check_writable()
+        us, vs, costs = self._pending_edges
+        us.append(u)
+        vs.append(v)
+        costs.append(cost)
+
+    def add_nodes(self, node_ids, lats, lons):
+        """Thêm nhiều node một lúc (mảng hoặc list)"""
+        self._check_writable()
+        self._node_chunks.append((np.asarray(node_ids, dtype=np.int64),
+                                  np.asarray(lats, dtype=np.float64),
+                                  np.asarray(lons, dtype=np.float64)))
+
+    def add_edges(self, us, vs, costs):
+        """Thêm nhiều cạnh một lúc (mảng hoặc list)"""
+        self._check_writable()
+        self._edge_chunks.append((np.asarray(us, dtype=np.int64),
+                                  np.asarray(vs, dtype=np.int64),
+                                  np.asarray(costs, dtype=np.float64)))
+
+    def freeze(self):
+        """Gộp các node/cạnh đang chờ vào mảng CSR"""
+        with self._write_lock:
+            self._freeze()
+
+    def _freeze(self):
+        ids, lat, lon = self._ids, self._lat, self._lon
+        indptr, indices, weights = self._indptr, self._indices, self._weights
+        node_chunks = [(ids, lat, lon), *self._node_chunks,
+                       self._as_arrays(self._pending_nodes, (np.int64, np.float64, np.float64))]
+        edge_chunks = [(np.repeat(ids, np.diff(indptr)), ids[indices], weights), *self._edge_chunks,
+                       self._as_arrays(self._pending_edges, (np.int64, np.int64, np.float64))]
+        chain_ptr, chain_nodes = self._chain_ptr, self._chain_nodes
+
+        # Node: sắp xếp theo id, node thêm sau ghi đè tọa độ node trùng id
+        all_ids, all_lat, all_lon = (np.concatenate(col) for col in zip(*node_chunks))
+        order = np.argsort(all_ids, kind='stable')
+        all_ids = all_ids[order]
+        keep = np.ones(len(all_ids), dtype=bool)
+        keep[:-1] = all_ids[:-1] != all_ids[1:]
+        order = order[keep]
+        ids_sorted = all_ids[keep]
+
+        # Cạnh: đưa về id, nối thêm cạnh mới rồi ánh xạ sang chỉ số mới
+        edge_u, edge_v, edge_w = (np.concatenate(col) for col in zip(*edge_chunks))
+        u_idx = self._lookup(ids_sorted, edge_u)
+        v_idx = self._lookup(ids_sorted, edge_v)
+        # Cạnh cũ giữ chuỗi node giữa của nó, cạnh mới thêm không có (-1)
+        edge_chain = np.full(len(edge_u), -1, dtype=np.int64)
+        edge_chain[:len(indices)] = np.arange(len(indices))
+
+        # Cạnh song song (MultiDiGraph của OSM) chỉ giữ cạnh ngắn nhất
+        order_e = np.lexsort((edge_w, v_idx, u_idx))
+        u_idx, v_idx, edge_w = u_idx[order_e], v_idx[order_e], edge_w[order_e]
+        first = np.ones(len(u_idx), dtype=bool)
+        first[1:] = (u_idx[1:] != u_idx[:-1]) | (v_idx[1:] != v_idx[:-1])
+        u_idx, v_idx, edge_w = u_idx[first], v_idx[first], edge_w[first]
+        edge_chain = edge_chain[order_e][first]
+
+        n = len(ids_sorted)
+        new_indptr = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(np.bincount(u_idx, minlength=n), out=new_indptr[1:])
+
+        self._ids = ids_sorted
+        self._lat = all_lat[order]
+        self._lon = all_lon[order]
+        self._indptr = new_indptr
+        self._indices = v_idx.astype(np.int32)
+        self._weights = edge_w
+        self._chain_ptr, self._chain_nodes = self._remap_chains(
+            chain_ptr, chain_nodes, edge_chain, np.searchsorted(ids_sorted, ids))
+        # Giữ nguyên vật cản theo node_id khi chỉ số thay đổi
+        blocked = np.zeros(n, dtype=bool)
+        blocked[np.searchsorted(ids_sorted, ids[self._blocked])] = True
+        self._blocked = _frozen(blocked)
+        self._live_weights = self._chain_cut(self._blocked)
+        self._live_reverse = None
+        self.version += 1
+        self._structure_version = self.version
+        self._changes.clear()
+        self._derived = {}
+        self._pending_nodes = ([], [], [])
+        self._pending_edges = ([], [], [])
+        self._node_chunks = []
+        self._edge_chunks = []
+
+    @staticmethod
+    def _remap_chains(chain_ptr, chain_nodes, edge_chain, new_index):
+        """Chuỗi node giữa của các cạnh sau freeze: edge_chain là cạnh cũ tương ứng (-1: không có)"""
+        new_ptr = np.zeros(len(edge_chain) + 1, dtype=np.int64)
+        if not len(chain_nodes):
+            return new_ptr, np.empty(0, dtype=np.int32)
+        lengths = np.where(edge_chain >= 0, np.diff(chain_ptr)[np.maximum(edge_chain, 0)], 0)
+        np.cumsum(lengths, out=new_ptr[1:])
+        # Vị trí trong chain_nodes cũ của từng phần tử chuỗi mới
+        offset = np.repeat(chain_ptr[np.maximum(edge_chain, 0)] - new_ptr[:-1], lengths)
+        old = chain_nodes[offset + np.arange(new_ptr[-1])]
+        return new_ptr, new_index[old].astype(np.int32)
+
+    def _chain_cut(self, blocked):
+        """Chi phí tìm đường khi có node giữa bị chặn: cạnh đã co chứa node đó thành inf (None nếu không có)"""
+        nodes = self._chain_nodes
+        if not len(nodes):
+            return None
+        inside = blocked[nodes]
+        if not inside.any():
+            return None
+        count = np.zeros(len(nodes) + 1, dtype=np.int64)
+        np.cumsum(inside, out=count[1:])
+        cut = count[self._chain_ptr[1:]] > count[self._chain_ptr[:-1]]
+        return _frozen(np.where(cut, np.inf, self._weights))
+
+    @staticmethod
+    def _as_arrays(columns, dtypes):
+        return tuple(np.asarray(col, dtype=dtype) for col, dtype in zip(columns, dtypes))
+
+    @staticmethod
+    def _lookup(ids, query):
+        idx = np.searchsorted(ids, query)
+        idx[idx == len(ids)] = 0
+        missing = ids[idx] != query if len(ids) else np.ones(len(query), dtype=bool)
+        if missing.any():
+            raise KeyError(int(query[missing][0]))
+        return idx
+
+    def find_index(self, node_id):
+        """Chỉ số của node_id trong mảng CSR, None nếu không có"""
+        ids = self.ids
+        i = int(np.searchsorted(ids, node_id))
+        if i < len(ids) and ids[i] == node_id:
+            return i
+        return None
+
+    def indices_of(self, node_list):
+        """Chỉ số của nhiều node_id cùng lúc (KeyError nếu có node không tồn tại)"""
+        return self._lookup(self.ids, np.asarray(node_list, dtype=np.int64).reshape(-1))
+
+    def index_of(self, node_id):
+        i = self.find_index(node_id)
+        if i is None:
+            raise KeyError(node_id)
+        return i
 
     def neighbors(self, node):
-        return [v for v, _ in self.adj_list.get(node, []) if v not in self.obstacles ]
+        i = self.find_index(node)
+        if i is None:
+            return []
+        a, b = self.indptr[i], self.indptr[i + 1]
+        row = self.indices[a:b]
+        if self.num_obstacles:
+            free = ~self._blocked[row]
+            if self._live_weights is not None:
+                free &= np.isfinite(self._live_weights[a:b])
+            row = row[free]
+        return self.ids[row].tolist()
 
     def cost(self, u, v):
-        if v in self.obstacles:
+        i, j = self.find_index(u), self.find_index(v)
+        if i is None or j is None or self._blocked[j]:
+            return float('inf')
+        e = self.edge_index(i, j)
+        if e is None:
             return float('inf')
-        for neighbor, cost in self.adj_list.get(u, []):
-            if neighbor == v:
-                return cost
-        return float('inf')
-    
+        return float(self.csr()[2][e])
+
+    def edge_index(self, i, j):
+        """Vị trí cạnh i -> j (chỉ số node) trong mảng CSR, None nếu không có"""
+        a, b = self.indptr[i], self.indptr[i + 1]
+        hit = np.flatnonzero(self.indices[a:b] == j)
+        return int(a + hit[0]) if len(hit) else None
+
+    def expand_indices(self, path_idx):
+        """Chỉ số node của đường đi (chỉ số) kèm các node giữa của cạnh đã co, theo thứ tự đi"""
+        path_idx = np.asarray(path_idx, dtype=np.int64).reshape(-1)
+        if not len(self.chain_nodes) or len(path_idx) < 2:
+            return path_idx
+        ptr, nodes = self._chain_ptr, self._chain_nodes
+        parts = [path_idx[:1]]
+        for i, j in zip(path_idx[:-1].tolist(), path_idx[1:].tolist()):
+            e = self.edge_index(i, j)
+            if e is not None and ptr[e + 1] > ptr[e]:
+                parts.append(nodes[ptr[e]:ptr[e + 1]])
+            parts.append(np.array([j]))
+        return np.concatenate(parts).astype(np.int64)
+
+    def expand_path(self, path):
+        """Như expand_indices nhưng theo node_id: đường đi đầy đủ hình dạng để vẽ"""
+        if not path:
+            return path
+        return self.ids[self.expand_indices(self.indices_of(path))].tolist()
+
+    def edges_through(self, idx):
+        """Vị trí các cạnh đã co có node giữa thuộc idx (chỉ số node)"""
+        nodes = self.chain_nodes
+        if not len(nodes):
+            return np.empty(0, dtype=np.int64)
+        owner = self._cached("chain_owner", lambda: np.repeat(
+            np.arange(self.num_edges, dtype=np.int64), np.diff(self._chain_ptr)))
+        return np.unique(owner[np.isin(nodes, idx)])
+
+    def check_endpoints(self, idx):
+        """
+        ValueError nếu có node trong idx (chỉ số) là node giữa của cạnh đã co: node đó không có
+        cạnh nên không làm điểm đầu/đích khi tìm đường theo node_id được
+        """
+        nodes = self.chain_nodes
+        if not len(nodes):
+            return
+        interior = self._cached("interior", lambda: np.bincount(nodes, minlength=self.num_nodes) > 0)
+        idx = np.asarray(idx, dtype=np.int64).reshape(-1)
+        hit = idx[interior[idx]]
+        if len(hit):
+            raise ValueError(f"Node {int(self.ids[hit[0]])} nằm giữa một cạnh đã co, không có cạnh riêng; "
+                             "hãy tìm đường theo tọa độ của nó (Router.route_points, Graph.snap_to_edge)")
+
     def has_edge(self, u, v):
         return v in self.neighbors(u)
-    
+
     def heuristic(self, u, v):
         # Sử dụng hàm heuristic1 làm mặc định
         return self.heuristic1(u, v)
 
     def heuristic1(self, u, v):
-        return geodesic(self.nodes[u], self.nodes[v]).meters
+        # Khoảng cách đường chim bay trên tọa độ đã chiếu (xem heuristic_table)
+        xy = self.xy
+        (x1, y1), (x2, y2) = xy[self.index_of(u)], xy[self.index_of(v)]
+        return sqrt((x2 - x1)**2 + (y2 - y1)**2)
 
     def heuristic2(self, u, v):
         lat1, lon1 = self.nodes[u]
@@ -57,7 +589,7 @@ class Graph:
         dx = (lon2 - lon1) * 111320 * cos(lat_mean)
         dy = (lat2 - lat1) * 111320
         return sqrt(dx**2 + dy**2)
-    
+
     def heuristic3(self, u, v):
         # Ưu tiên đi theo góc lệch so với thẳng tắp từ u đến v
         lat1, lon1 = self.nodes[u]
@@ -69,99 +601,110 @@ class Graph:
         multiplier = min(1 + abs(angle) / (math.pi / 4), 2)  # Giới hạn tối đa gấp đôi
         return sqrt(dx**2 + dy**2) * multiplier
 
-    def find_nearest_node(self, lat, lon):
-        nearest_node = None
-        min_distance = float('inf')
+    def nearest_index(self):
+        return self._cached("nearest", lambda: NearestIndex(self))
 
-        for node_id, _ in self.nodes.items():
-            distance = self.heuristic(node_id, (lat, lon))
-            if distance < min_distance:
-                min_distance = distance
-                nearest_node = node_id
+    def find_nearest_node(self, lat, lon):
+        """node_id không bị chặn gần (lat, lon) nhất, None nếu không có"""
+        idx, _ = self.nearest_index().nearest_node(lat, lon, self.blocked)
+        return None if idx is None else int(self.ids[idx])
 
-        return nearest_node
-    
     def find_nearest_node_within_radius(self, lat, lon, initial_radius=10, step=10, max_radius=1000):
-        if not self._kd_tree:
-            self._build_kdtree()
-        radius = initial_radius
-        while radius <= max_radius:
-            approx_radius_deg = radius / 111320  # Đổi mét sang độ
-            idxs = self._kd_tree.query_ball_point([lat, lon], r=approx_radius_deg)
-
-            if idxs:
-                candidates = []
-                for idx in idxs:
-                    node_id = self._node_ids[idx]
-                    if node_id in self.obstacles:
-                        continue
-                    node_lat, node_lon = self.nodes[node_id]
-                    distance_m = geodesic((lat, lon), (node_lat, node_lon)).meters
-                    candidates.append((distance_m, node_id))
-
-                if not candidates:
-                    return None
-                candidates.sort()
-                return candidates[0][1]
-            radius += step
-        return None
+        """Như find_nearest_node nhưng None nếu node gần nhất xa quá max_radius mét"""
+        idx, _ = self.nearest_index().nearest_node(lat, lon, self.blocked, max_distance=max_radius)
+        return None if idx is None else int(self.ids[idx])
+
+    def snap_to_edge(self, lat, lon, max_distance=float('inf')):
+        """Điểm gần nhất trên một cạnh không bị chặn (nearest.Snap theo chỉ số node), None nếu không có"""
+        return self.nearest_index().nearest_edge(lat, lon, self.blocked, max_distance)
 
-    def _build_kdtree(self):
-        self._node_ids = list(self.nodes.keys())
-        coords = [self.nodes[node_id] for node_id in self._node_ids]
-        self._kd_tree = KDTree(coords)
+    def spatial_index(self):
+        return self._cached("grid", lambda: GridIndex(self.lat, self.lon))
+
+    def nodes_in_rect(self, lat1, lon1, lat2, lon2):
+        """Chỉ số các node trong hình chữ nhật lat/lon"""
+        return self.spatial_index().rect(lat1, lon1, lat2, lon2)
+
+    def nodes_in_polygon(self, points):
+        """Chỉ số các node trong đa giác [(lat, lon), ...]"""
+        return self.spatial_index().polygon(points)
+
+    def nodes_in_circle(self, lat, lon, radius_m):
+        """Chỉ số các node cách (lat, lon) không quá radius_m mét"""
+        return self.spatial_index().circle(lat, lon, radius_m, EARTH_RADIUS_M)
 
 
 #------------Bo sung them----------------
 
     #Ham them vat can
     def add_obstacle(self,node_id):
-        """Đánh dấu node là vật cản và loại bỏ các cạnh liên quan"""
-        if node_id not in self.nodes:
+        """Đánh dấu node là vật cản; neighbors()/cost() tự bỏ qua node này"""
+        i = self.find_index(node_id)
+        if i is None:
             raise ValueError(f"Node {node_id} không tồn tại.")
-        self.obstacles.add(node_id)
-        removed=[] # danh sach cac canh bi xoa
-        #Xóa các cạnh đi từ node này
-        for v, cost in self.adj_list.get(node_id,[]):
-            removed.append((node_id,v,cost))
-        if node_id in self.adj_list:
-            self.adj_list[node_id]=[]
-        #Xoa cac canh den node_id
-        for u in self.adj_list:
-            new_neighbors=[]
-            for v,cost in self.adj_list[u]:
-                if v==node_id:
-                    removed.append((u,v,cost))
-                else:
-                    new_neighbors.append((v,cost))
-            self.adj_list[u]=new_neighbors
-        #Xoa cac canh lien quan trong self.edges
-        self.edges=[(u,v,c) for (u,v,c) in self.edges if u!=node_id and v!=node_id]
-        #Luu lai cac canh da bi loai bo
-        self._removed_edges[node_id]=removed
-        self._kd_tree=None  # reset neu dung KDTree
+        self.block_indices(np.array([i]))
 
     def add_obstacles(self, node_list):
-        for node_id in node_list:
-            self.add_obstacle(node_id)
+        """Chặn nhiều node một lần, trả về mảng các node_id mới bị chặn"""
+        try:
+            idx = self.indices_of(node_list)
+        except KeyError as e:
+            raise ValueError(f"Node {e.args[0]} không tồn tại.")
+        return self.ids[self.block_indices(idx)]
 
     def remove_obstacle(self, node_id):
-        """Go node khoi danh sach va khoi phuc lai cac canh da xoa """
-        self.obstacles.discard(node_id)     # Xoa vat can
-        if node_id in self._removed_edges:
-            for u,v,cost in self._removed_edges[node_id]:
-                if u in self.nodes and v in self.nodes:
-                    if not any(v2 == v for v2,_ in self.adj_list[u]):
-                        self.adj_list[u].append((v,cost))
-                        self.edges.append((u,v,cost))
-            del self._removed_edges[node_id]
-        self._kd_tree= None
+        """Go node khoi danh sach vat can, cac canh cua node tu dong dung lai duoc"""
+        i = self.find_index(node_id)
+        if i is not None:
+            self.unblock_indices(np.array([i]))
 
     def remove_obstacles(self,node_list):
-        for node_id in node_list:
-            self.remove_obstacle(node_id)
+        """Bỏ chặn nhiều node một lần, trả về mảng các node_id được bỏ chặn"""
+        ids = self.ids
+        query = np.asarray(node_list, dtype=np.int64).reshape(-1)
+        idx = np.minimum(np.searchsorted(ids, query), max(len(ids) - 1, 0))
+        idx = idx[ids[idx] == query] if len(ids) else idx[:0]
+        return self.ids[self.unblock_indices(idx)]
 
     def is_obstacle(self,node_id):
-        return node_id in self.obstacles    # kiem tra co phai vat can hay khong 
+        return node_id in self.obstacles    # kiem tra co phai vat can hay khong
+
+    def block_indices(self, idx):
+        """Chặn các node theo chỉ số, trả về các chỉ số trước đó chưa bị chặn"""
+        return self._set_blocked(idx, True)
+
+    def unblock_indices(self, idx):
+        """Bỏ chặn các node theo chỉ số, trả về các chỉ số trước đó đang bị chặn"""
+        return self._set_blocked(idx, False)
+
+    def _set_blocked(self, idx, value):
+        self._check_writable()
+        self._sync()
+        with self._write_lock:
+            idx = np.unique(idx)
+            changed = idx[self._blocked[idx] != value]
+            if len(changed):
+                # Mảng mới thay cho mảng cũ: bản chụp đang dùng mảng cũ không bị ảnh hưởng
+                blocked = self._blocked.copy()
+                blocked[changed] = value
+                self._blocked = _frozen(blocked)
+                self._live_weights = self._chain_cut(blocked)
+                self.num_obstacles += len(changed) if value else -len(changed)
+                self.version += 1
+                self._changes.append((self.version, changed, not value))
+            return changed
 
-  
\ No newline at end of file
+    def changes_since(self, version):
+        """
+        Thay đổi vật cản kể từ version: (chỉ số các node đã bị chặn, chỉ số các node đã được bỏ chặn).
+        None nếu không còn đủ lịch sử (cấu trúc đồ thị đã đổi hoặc log đã bị cắt bớt).
+        """
+        empty = np.empty(0, dtype=np.int64)
+        if version == self.version:
+            return empty, empty
+        if version < self._structure_version or not self._changes or version < self._changes[0][0] - 1:
+            return None
+        blocked = [idx for v, idx, unblocked in self._changes if v > version and not unblocked]
+        unblocked = [idx for v, idx, unblocked in self._changes if v > version and unblocked]
+        return (np.concatenate(blocked) if blocked else empty,
+                np.concatenate(unblocked) if unblocked else empty)
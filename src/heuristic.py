@@ -0,0 +1,16 @@
+class GeoHeuristic:
+    """
+    Heuristic đường chim bay cho A*, Greedy và Bidirectional A*.
+
+    Thay vì gọi hàm heuristic(u, v) ở mỗi lần mở rộng node, thuật toán gọi
+    table(graph, target) một lần khi bắt đầu truy vấn và nhận về giá trị
+    heuristic tới target của mọi node (tra theo chỉ số node).
+    kind = 1, 2, 3 tương ứng Graph.heuristic1/2/3.
+    """
+
+    def __init__(self, kind=1):
+        self.kind = kind
+
+    def table(self, graph, target, backward=False):
+        # Khoảng cách đường chim bay đối xứng nên không phân biệt chiều
+        return graph.heuristic_table(target, self.kind).tolist()
@@ -0,0 +1,216 @@
+from heapq import heappush, heappop
+import threading
+from time import perf_counter
+import numpy as np
+from algorithm import Algorithm, SearchCancelled, CANCEL_CHECK_INTERVAL
+
+INF = float('inf')
+# Khóa chênh nhau dưới mức này coi như bằng nhau: heuristic chim bay có thể lớn hơn chiều dài
+# cạnh haversine khoảng 1e-10 m do làm tròn, nếu so khóa chặt thì có thể dừng trước khi xử lý hết
+# các node có g cũ. Lấy thêm vài node khỏi hàng đợi không bao giờ làm sai kết quả.
+KEY_TOLERANCE = 1e-6
+
+
+class LPAStar(Algorithm):
+    """
+    Lifelong Planning A* (Koenig & Likhachev): giữ trạng thái tìm kiếm giữa các lần gọi run().
+
+    Khi start/goal không đổi, lần chạy sau chỉ lấy các node đã đổi trạng thái vật cản từ
+    Graph.changes_since() và sửa lại g/rhs quanh chúng thay vì tìm lại từ đầu. Đổi start/goal,
+    đổi đồ thị hoặc mất lịch sử thay đổi thì khởi tạo lại (tương đương một lần A*).
+    Một lần sửa tốn hơn cả lần tìm đầy đủ gần nhất (vật cản sát start làm mất gần hết cây
+    tìm kiếm) thì bỏ và tìm lại từ đầu, nên một lần gọi không bao giờ tốn quá khoảng hai lần A*.
+    Số node trả về là số node được lấy ra khỏi hàng đợi trong lần gọi đó.
+    Heuristic phải nhất quán (GeoHeuristic(1) hoặc Landmarks).
+    Dùng chung cho nhiều luồng qua session(): mỗi lần tìm có cancel/metrics riêng.
+    """
+
+    def __init__(self, heuristic=None):
+        super().__init__()
+        self.heuristic = heuristic
+        self._lock = threading.RLock()  # một đối tượng dùng chung cho nhiều lần tìm đường
+        self._graph = None
+        self._query = None
+        self._version = None
+        self._full_popped = 0  # số node của lần tìm đầy đủ gần nhất, giới hạn cho một lần sửa
+
+    def session(self):
+        """Algorithm dùng trạng thái của planner này nhưng có cancel/metrics riêng (tạo mỗi lần tìm)"""
+        return LPASession(self)
+
+    def run(self, start, goal, graph):
+        with self._lock:
+            s, t = self.endpoints(start, goal, graph)
+            if s is None:
+                return 0, None
+            self._pushed = self._stale = self._relaxed = self._peak = 0  # số liệu cho self.metrics
+            self._heuristic_calls = 0
+            time_start = perf_counter()
+            try:
+                repaired = self._repair(graph, s, t)
+                time_search = perf_counter()
+                popped = self._compute_shortest_path(limit=self._full_popped) if repaired else None
+                if popped is None:
+                    wasted = self._full_popped if repaired else 0
+                    self._reset(graph, s, t)
+                    self._full_popped = self._compute_shortest_path()
+                    popped = wasted + self._full_popped
+            except SearchCancelled:
+                self._graph = None  # trạng thái dở dang: lần sau tìm lại từ đầu
+                raise
+            self._version = graph.version
+            time_path = perf_counter()
+            path = self._path()
+            self.record_counts(popped=popped, pushed=self._pushed, relaxed=self._relaxed,
+                               heuristic_calls=self._heuristic_calls, duplicate_pops=self._stale,
+                               peak_frontier=self._peak,
+                               phases={"setup": time_search - time_start, "search": time_path - time_search,
+                                       "path": perf_counter() - time_path})
+            return popped, path
+
+    def _reset(self, graph, s, t):
+        self._graph = graph
+        self._query = (s, t)
+        self._csr = graph.csr()
+        self._reverse = graph.reverse_csr()
+        self._blocked = graph.blocked
+        h = self.heuristic_for(graph, t)
+        self._h = h if h is not None else [0.0] * graph.num_nodes
+        self._g = {}
+        self._rhs = {s: 0.0}
+        self._open = {}  # node -> khóa hiện tại; heap chứa cả các bản ghi cũ (xóa lười)
+        self._heap = []
+        self._insert(s)
+
+    def _repair(self, graph, s, t):
+        """Cập nhật các node đổi trạng thái kể từ lần chạy trước; False nếu phải tìm lại từ đầu"""
+        # Mỗi lần tìm nhận một bản chụp mới: so theo đồ thị gốc của bản chụp
+        if self._graph is None or graph.base is not self._graph.base or self._query != (s, t):
+            return False
+        changes = graph.changes_since(self._version)  # None nếu cấu trúc đồ thị đã đổi
+        if changes is None:
+            return False
+        self._graph = graph
+        self._blocked = graph.blocked
+        self._csr = graph.csr()
+        self._reverse = graph.reverse_csr()  # chi phí cạnh đã co đổi theo node giữa bị chặn
+        indptr, indices, _ = self._csr
+        changed = np.unique(np.concatenate(changes))
+        for v in changed.tolist():
+            self._update_vertex(v)
+            for w in indices[indptr[v]:indptr[v + 1]].tolist():
+                self._update_vertex(w)
+        # Node giữa của cạnh đã co không có cạnh: cập nhật node cuối của các cạnh chứa nó
+        for w in np.unique(indices[graph.edges_through(changed)]).tolist():
+            self._update_vertex(w)
+        return True
+
+    def _key(self, v):
+        self._heuristic_calls += 1
+        m = min(self._g.get(v, INF), self._rhs.get(v, INF))
+        return (m + self._h[v], m)
+
+    def _insert(self, v):
+        key = self._key(v)
+        self._open[v] = key
+        heappush(self._heap, (key, v))
+        self._pushed += 1
+        if len(self._heap) > self._peak:
+            self._peak = len(self._heap)
+
+    def _top(self):
+        """Khóa nhỏ nhất còn hợp lệ trong hàng đợi"""
+        heap, open_ = self._heap, self._open
+        while heap and open_.get(heap[0][1]) != heap[0][0]:
+            heappop(heap)
+            self._stale += 1
+        return heap[0][0] if heap else (INF, INF)
+
+    def _update_vertex(self, v):
+        s = self._query[0]
+        if v != s:
+            if self._blocked[v]:
+                rhs = INF
+            else:
+                # rhs(v) = min qua các cạnh vào (u, v) của g(u) + c(u, v), bỏ qua node bị chặn
+                indptr, sources, weights = self._reverse
+                a, b = indptr[v], indptr[v + 1]
+                self._relaxed += int(b - a)
+                g, blocked = self._g, self._blocked
+                rhs = min((g.get(u, INF) + w for u, w in zip(sources[a:b].tolist(), weights[a:b].tolist())
+                           if not blocked[u]), default=INF)
+            if rhs < INF:
+                self._rhs[v] = rhs
+            else:
+                self._rhs.pop(v, None)
+        self._open.pop(v, None)
+        if self._g.get(v, INF) != self._rhs.get(v, INF):
+            self._insert(v)
+
+    def _compute_shortest_path(self, limit=None):
+        """Số node đã lấy ra khỏi hàng đợi, None nếu vượt quá limit (trạng thái dở dang)"""
+        t = self._query[1]
+        indptr, indices, _ = self._csr
+        g, rhs = self._g, self._rhs
+        cancel = self.cancel
+        popped = 0
+        while True:
+            top = self._top()
+            if top[0] == INF or (top[0] > self._key(t)[0] + KEY_TOLERANCE and rhs.get(t, INF) == g.get(t, INF)):
+                break
+            _, u = heappop(self._heap)
+            del self._open[u]
+            popped += 1
+            if limit is not None and popped > limit:
+                return None
+            if cancel is not None and popped % CANCEL_CHECK_INTERVAL == 0:
+                cancel.check()
+            if g.get(u, INF) > rhs.get(u, INF):
+                g[u] = rhs[u]
+            else:
+                g.pop(u, None)
+                self._update_vertex(u)
+            for w in indices[indptr[u]:indptr[u + 1]].tolist():
+                self._update_vertex(w)
+        return popped
+
+    def _path(self):
+        """Đi ngược từ goal theo cạnh vào cho g(u) + c(u, v) nhỏ nhất"""
+        s, t = self._query
+        g, blocked = self._g, self._blocked
+        if g.get(t, INF) == INF:
+            return None
+        indptr, sources, weights = self._reverse
+        ids = self._graph.ids
+        path = [t]
+        seen = {t}
+        v = t
+        while v != s:
+            a, b = indptr[v], indptr[v + 1]
+            best, v = min(((g.get(u, INF) + w, u) for u, w in zip(sources[a:b].tolist(), weights[a:b].tolist())
+                           if not blocked[u]), default=(INF, None))
+            if best == INF or v in seen:
+                return None
+            path.append(v)
+            seen.add(v)
+        return ids[path[::-1]].tolist()
+
+
+class LPASession(Algorithm):
+    """
+    Một lần dùng LPAStar chung: cancel/metrics của lần này chỉ được gắn vào planner trong lúc
+    giữ khóa của nó, nên luồng khác không ghi đè được và token đã hủy không bị dùng lại.
+    """
+
+    def __init__(self, planner):
+        super().__init__()
+        self.planner = planner
+
+    def run(self, start, goal, graph):
+        planner = self.planner
+        with planner._lock:
+            planner.cancel, planner.metrics = self.cancel, self.metrics
+            try:
+                return planner.run(start, goal, graph)
+            finally:
+                planner.cancel = planner.metrics = None
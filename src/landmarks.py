@@ -0,0 +1,184 @@
+import os
+import numpy as np
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import dijkstra, connected_components
+
+STRATEGIES = ("farthest", "avoid")
+LANDMARKS_VERSION = 2  # 2: chỉ chọn landmark trong thành phần liên thông mạnh lớn nhất
+
+
+class Landmarks:
+    """
+    Heuristic ALT (A*, Landmarks, Triangle inequality).
+
+    dist_from[k, v] = d(L_k, v) và dist_to[k, v] = d(v, L_k) được tính trước trên đồ thị
+    không có vật cản. Với mọi v, t:
+        d(v, t) >= d(L, t) - d(L, v)   và   d(v, t) >= d(v, L) - d(t, L)
+    nên max theo các landmark là cận dưới chấp nhận được và nhất quán (lấy thêm max với
+    khoảng cách chim bay, cũng nhất quán). Vật cản chỉ làm khoảng cách tăng lên nên cận
+    vẫn đúng khi có vật cản. Cận bằng inf nghĩa là node không thể tới được target.
+    Dùng được thay cho GeoHeuristic trong AStar / BidirectionalAStar.
+    """
+
+    def __init__(self, fingerprint, landmarks, dist_from, dist_to, strategy="farthest", count=None):
+        self.fingerprint = fingerprint
+        self.count = len(landmarks) if count is None else count  # số landmark đã yêu cầu
+        self.landmarks = landmarks
+        self.dist_from = dist_from
+        self.dist_to = dist_to
+        self.strategy = strategy
+        # Sai số làm tròn float32 (lưu trữ + phép trừ), trừ đi để cận không vượt quá khoảng cách thật
+        finite = dist_from[np.isfinite(dist_from)]
+        self.slack = 2 * float(np.spacing(finite.max())) if finite.size else 0.0
+
+    def table(self, graph, target, backward=False):
+        """
+        Cận dưới của d(v, target) với mọi v; backward=True cho cận dưới của d(target, v)
+        (phía tìm kiếm ngược của Bidirectional A*). Bảng của đồ thị khác (chỉ số node không
+        khớp) thì chỉ dùng khoảng cách chim bay.
+        """
+        if self.fingerprint != graph.fingerprint():
+            return graph.heuristic_table(target, 1).tolist()
+        from_t = self.dist_from[:, target:target + 1]
+        to_t = self.dist_to[:, target:target + 1]
+        with np.errstate(invalid="ignore"):
+            if backward:
+                bounds = np.maximum(self.dist_from - from_t, to_t - self.dist_to)
+            else:
+                bounds = np.maximum(from_t - self.dist_from, self.dist_to - to_t)
+        # inf - inf (cả hai cùng không tới được landmark) không cho thông tin gì
+        bounds[np.isnan(bounds)] = 0.0
+        bounds = np.maximum(bounds.max(axis=0).astype(np.float64) - self.slack, graph.heuristic_table(target, 1))
+        return bounds.tolist()
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = path + ".tmp.npz"
+        np.savez(tmp_path, version=np.array(LANDMARKS_VERSION),
+                 fingerprint=np.array(self.fingerprint), strategy=np.array(self.strategy),
+                 count=np.array(self.count), landmarks=self.landmarks, dist_from=self.dist_from, dist_to=self.dist_to)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        """Bảng đã lưu; ValueError nếu ghi bởi phiên bản chọn landmark khác"""
+        with np.load(path) as data:
+            if "version" not in data.files or int(data["version"]) != LANDMARKS_VERSION:
+                raise ValueError("Bảng landmark của phiên bản cũ")
+            return cls(str(data["fingerprint"]), data["landmarks"], data["dist_from"],
+                       data["dist_to"], str(data["strategy"]), int(data["count"]))
+
+
+def build_landmarks(graph, count=16, strategy="farthest", seed=0):
+    """
+    Chọn landmark và chạy Dijkstra một-tới-tất-cả từ/tới từng landmark (scipy csgraph).
+    Node gốc và landmark chỉ lấy trong thành phần liên thông mạnh lớn nhất: node giữa của
+    cạnh đã co (không có cạnh) hay một nhánh cụt nhỏ không cho cận dưới nào có ích.
+    """
+    if strategy not in STRATEGIES:
+        raise ValueError(f"Chiến lược chọn landmark không hợp lệ: {strategy}")
+    indptr, indices, weights = graph.indptr, graph.indices, graph.weights  # chi phí gốc, không tính vật cản
+    n = graph.num_nodes
+    forward = csr_matrix((weights, indices, indptr), shape=(n, n))
+    backward = forward.T.tocsr()
+    rng = np.random.default_rng(seed)
+    requested = count
+    candidates = _largest_component(forward)
+    count = min(count, len(candidates))
+
+    chosen, dist_from, dist_to = [], [], []
+
+    def add(landmark):
+        chosen.append(landmark)
+        dist_from.append(dijkstra(forward, indices=landmark))
+        dist_to.append(dijkstra(backward, indices=landmark))
+
+    # Landmark đầu tiên: node xa nhất tính từ một node ngẫu nhiên
+    root = int(rng.choice(candidates))
+    add(_farthest(dijkstra(forward, indices=root) + dijkstra(backward, indices=root), candidates))
+    attempts = 0
+    while len(chosen) < count and attempts < 4 * count:
+        attempts += 1
+        if strategy == "farthest":
+            # Node xa nhất (theo cả hai chiều) tới landmark gần nó nhất
+            spread = np.min([f + t for f, t in zip(dist_from, dist_to)], axis=0)
+            landmark = _farthest(spread, candidates)
+            if landmark in chosen or not 0 < spread[landmark] < np.inf:
+                break  # node xa nhất đã là landmark (hoặc không tới được): chọn tiếp chỉ lặp lại nó
+        else:
+            landmark = _avoid(forward, int(rng.choice(candidates)), np.array(dist_from), np.array(dist_to),
+                              chosen, candidates)
+        if landmark not in chosen:
+            add(landmark)
+
+    return Landmarks(graph.fingerprint(), np.array(chosen, dtype=np.int32),
+                     np.array(dist_from, dtype=np.float32), np.array(dist_to, dtype=np.float32),
+                     strategy, requested)
+
+
+def _largest_component(forward):
+    """Chỉ số các node thuộc thành phần liên thông mạnh lớn nhất (có cạnh ra nếu đồ thị có cạnh)"""
+    _, labels = connected_components(forward, connection="strong")
+    return np.flatnonzero(labels == np.bincount(labels).argmax())
+
+
+def _farthest(dist, candidates):
+    """Node trong candidates có dist hữu hạn lớn nhất"""
+    finite = np.where(np.isfinite(dist[candidates]), dist[candidates], -1.0)
+    return int(candidates[np.argmax(finite)])
+
+
+def _avoid(forward, root, dist_from, dist_to, chosen, candidates):
+    """
+    Chiến lược "avoid" (Goldberg & Werneck): trong cây đường đi ngắn nhất từ root, trọng số
+    của node là phần cận hiện tại còn thiếu d(root, v) - lb(root, v). Đi từ root xuống
+    nhánh có tổng trọng số lớn nhất (bỏ các nhánh đã chứa landmark) tới lá.
+    """
+    dist, pred = dijkstra(forward, indices=root, return_predecessors=True)
+    reachable = np.isfinite(dist)
+    with np.errstate(invalid="ignore"):
+        lower = np.maximum(dist_from - dist_from[:, root:root + 1], dist_to[:, root:root + 1] - dist_to)
+    lower = np.nan_to_num(lower, nan=0.0, posinf=0.0, neginf=0.0).max(axis=0)
+    size = np.where(reachable, np.maximum(dist - lower, 0.0), 0.0)
+    outside = np.ones(len(dist), dtype=bool)
+    outside[candidates] = False
+    size[outside] = 0.0  # node đi tới được từ root nhưng không quay về được: không làm landmark
+    has_landmark = np.zeros(len(dist), dtype=bool)
+    has_landmark[chosen] = True
+
+    # Cộng dồn trọng số cây con, duyệt từ node xa nhất về gốc
+    order = np.argsort(-np.where(reachable, dist, -1.0))
+    for v in order[:np.count_nonzero(reachable)].tolist():
+        p = pred[v]
+        if p >= 0:
+            size[p] += size[v]
+            has_landmark[p] |= has_landmark[v]
+    size[has_landmark] = 0.0
+
+    children = {}
+    for v in np.flatnonzero(pred >= 0).tolist():
+        children.setdefault(int(pred[v]), []).append(v)
+    node = root
+    while children.get(node):
+        best = max(children[node], key=lambda c: size[c])
+        if size[best] <= 0:
+            break
+        node = best
+    return node
+
+
+def load_or_build_landmarks(graph, path, count=16, strategy="farthest"):
+    """Đọc bảng landmark đã lưu nếu khớp đồ thị và cấu hình, nếu không thì tính lại và lưu"""
+    try:
+        landmarks = Landmarks.load(path)
+        if landmarks.fingerprint == graph.fingerprint() and landmarks.strategy == strategy \
+                and landmarks.count == count:
+            return landmarks
+    except (OSError, KeyError, ValueError):
+        pass
+    landmarks = build_landmarks(graph, count, strategy)
+    try:
+        landmarks.save(path)
+    except OSError as e:
+        print(f"Không ghi được bảng landmark: {e}")
+    return landmarks
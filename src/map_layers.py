@@ -0,0 +1,301 @@
+"""
+Các lớp vẽ lên TkinterMapView sao cho thời gian vẽ không tăng theo số đối tượng:
+đường đi được rút gọn Douglas–Peucker theo mức zoom (sai lệch < SIMPLIFY_PX pixel),
+marker vật cản chỉ được tạo khi nằm trong khung nhìn và được gộp theo ô màn hình,
+ảnh icon được đọc và thu nhỏ một lần. Các node đã duyệt khi minh họa quá trình tìm
+được vẽ thẳng lên canvas thành các ô vuông nhỏ.
+"""
+import math
+from collections import namedtuple
+import numpy as np
+from PIL import Image, ImageTk
+
+TILE_SIZE = 256  # pixel mỗi ô bản đồ; cả thế giới rộng TILE_SIZE * 2^zoom pixel
+SIMPLIFY_PX = 1.0  # sai lệch tối đa (pixel) của đường đã rút gọn so với đường gốc
+CLUSTER_PX = 40  # các marker cùng loại trong một ô cỡ này được gộp thành một
+VIEW_MARGIN = 0.25  # vẽ thêm marker ngoài khung nhìn (tỉ lệ theo kích thước khung) để kéo bản đồ không bị trống
+REFRESH_MS = 100  # chu kỳ kiểm tra khung nhìn đã đổi (pan/zoom) chưa
+ICON_SIZE = (30, 30)
+
+# Góc trên trái / dưới phải theo mercator [0, 1], mức zoom và kích thước canvas (pixel)
+Viewport = namedtuple("Viewport", "x0 y0 x1 y1 zoom width height")
+
+
+def mercator(lat, lon):
+    """Tọa độ Web Mercator chuẩn hóa về [0, 1] (như ô bản đồ OSM), nhận số hoặc mảng"""
+    lat = np.radians(np.clip(lat, -85.0511, 85.0511))
+    x = (np.asarray(lon, dtype=np.float64) + 180.0) / 360.0
+    y = (1.0 - np.log(np.tan(lat) + 1.0 / np.cos(lat)) / math.pi) / 2.0
+    return x, y
+
+
+def simplify(points, tolerance):
+    """
+    Douglas–Peucker không đệ quy trên mảng (n, 2); trả về chỉ số các điểm được giữ
+    (luôn gồm điểm đầu và cuối).
+    """
+    n = len(points)
+    if n < 3:
+        return np.arange(n)
+    keep = np.zeros(n, dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, n - 1)]
+    while stack:
+        i, j = stack.pop()
+        if j - i < 2:
+            continue
+        a, d = points[i], points[j] - points[i]
+        rel = points[i + 1:j] - a
+        length = math.hypot(d[0], d[1])
+        if length == 0.0:
+            dist = np.hypot(rel[:, 0], rel[:, 1])
+        else:
+            dist = np.abs(d[0] * rel[:, 1] - d[1] * rel[:, 0]) / length
+        k = int(np.argmax(dist))
+        if dist[k] > tolerance:
+            k += i + 1
+            keep[k] = True
+            stack.append((i, k))
+            stack.append((k, j))
+    return np.flatnonzero(keep)
+
+
+def viewport(map_widget):
+    """Khung nhìn hiện tại của map_widget, None nếu canvas chưa hiển thị"""
+    width, height = map_widget.canvas.winfo_width(), map_widget.canvas.winfo_height()
+    if width <= 1 or height <= 1:
+        return None
+    lat0, lon0 = map_widget.convert_canvas_coords_to_decimal_coords(0, 0)
+    lat1, lon1 = map_widget.convert_canvas_coords_to_decimal_coords(width, height)
+    x0, y0 = mercator(lat0, lon0)
+    x1, y1 = mercator(lat1, lon1)
+    return Viewport(float(x0), float(y0), float(x1), float(y1), round(map_widget.zoom), width, height)
+
+
+class IconCache:
+    """PhotoImage đã đọc và thu nhỏ, theo (đường dẫn, kích thước); giữ tham chiếu để Tk không xóa ảnh"""
+
+    def __init__(self):
+        self._icons = {}
+
+    def get(self, path, size=ICON_SIZE):
+        key = (path, size)
+        icon = self._icons.get(key)
+        if icon is None:
+            with Image.open(path) as img:
+                icon = self._icons[key] = ImageTk.PhotoImage(img.resize(size, Image.Resampling.LANCZOS))
+        return icon
+
+
+class PathLayer:
+    """Một đường đi trên bản đồ, vẽ lại bằng bản rút gọn của mức zoom mỗi khi zoom đổi"""
+
+    def __init__(self, map_widget, color="blue", width=5):
+        self.map_widget = map_widget
+        self.color = color
+        self.width = width
+        self.line = None  # CanvasPath đang vẽ
+        self._coords = None
+        self._xy = None
+        self._levels = {}  # zoom -> danh sách tọa độ đã rút gọn
+        self._zoom = None
+
+    def show(self, coords, view=None):
+        """Vẽ đường qua coords [(lat, lon), ...]"""
+        self.clear()
+        if len(coords) < 2:
+            return None
+        self._coords = np.asarray(coords, dtype=np.float64)
+        self._xy = np.column_stack(mercator(self._coords[:, 0], self._coords[:, 1]))
+        self._draw(view.zoom if view is not None else round(self.map_widget.zoom))
+        return self.line
+
+    def clear(self):
+        if self.line is not None:
+            self.line.delete()
+        self.line = None
+        self._coords = self._xy = None
+        self._levels = {}
+        self._zoom = None
+
+    def refresh(self, view):
+        if self._coords is not None and view.zoom != self._zoom:
+            self._draw(view.zoom)
+
+    def level(self, zoom):
+        """Tọa độ đã rút gọn cho mức zoom (tính một lần mỗi mức)"""
+        coords = self._levels.get(zoom)
+        if coords is None:
+            keep = simplify(self._xy, SIMPLIFY_PX / (TILE_SIZE * 2 ** zoom))
+            coords = self._levels[zoom] = [tuple(point) for point in self._coords[keep].tolist()]
+        return coords
+
+    def _draw(self, zoom):
+        if self.line is not None:
+            self.line.delete()
+        self._zoom = zoom
+        self.line = self.map_widget.set_path(self.level(zoom), color=self.color, width=self.width)
+
+
+class MarkerLayer:
+    """
+    Các marker có icon (vật cản, vùng cấm) giữ dưới dạng dữ liệu; chỉ những điểm trong khung nhìn
+    (cộng lề VIEW_MARGIN) mới có marker Tk, các điểm cùng loại trong một ô CLUSTER_PX pixel được
+    gộp thành một marker "tên (số lượng)". Mỗi lần cập nhật chỉ tạo/xóa các marker thay đổi.
+    """
+
+    def __init__(self, map_widget, icons, color="black"):
+        self.map_widget = map_widget
+        self.icons = icons
+        self.color = color
+        self._items = {}  # id -> (lat, lon, text, icon_path)
+        self._next_id = 0
+        self._arrays = None  # (ids, x, y) mercator của các item, dựng lại khi item đổi
+        self._shown = {}  # khóa -> (marker, (lat, lon, nhãn))
+        self._view = None
+
+    def add(self, lat, lon, text, icon_path):
+        """Thêm một điểm; trả về id để xóa sau"""
+        item_id = self._next_id
+        self._next_id += 1
+        self._items[item_id] = (lat, lon, text, icon_path)
+        self._arrays = None
+        self.refresh()
+        return item_id
+
+    def remove(self, item_id):
+        if self._items.pop(item_id, None) is not None:
+            self._arrays = None
+            self.refresh()
+
+    def last(self, text):
+        """id của điểm được thêm gần nhất có nhãn text, None nếu không có"""
+        return max((item_id for item_id, item in self._items.items() if item[2] == text), default=None)
+
+    def __len__(self):
+        return len(self._items)
+
+    def refresh(self, view=None):
+        """Cập nhật marker theo khung nhìn view (mặc định: khung nhìn lần trước)"""
+        view = view or self._view
+        if view is None:
+            return
+        self._view = view
+        wanted = self._wanted(view)
+        for key in [key for key, (_, label) in self._shown.items() if wanted.get(key, (None,))[0] != label]:
+            self._shown.pop(key)[0].delete()
+        for key, (label, icon_path) in wanted.items():
+            if key not in self._shown:
+                lat, lon, text = label
+                marker = self.map_widget.set_marker(lat, lon, text=text, icon=self.icons.get(icon_path))
+                if hasattr(marker, "canvas_id"):
+                    self.map_widget.canvas.itemconfig(marker.canvas_id, fill=self.color)
+                self._shown[key] = (marker, label)
+
+    def _wanted(self, view):
+        """khóa -> ((lat, lon, nhãn), icon) của các marker cần có trong khung nhìn"""
+        if not self._items:
+            return {}
+        if self._arrays is None:
+            ids = np.fromiter(self._items.keys(), dtype=np.int64, count=len(self._items))
+            lat = np.array([self._items[i][0] for i in ids.tolist()])
+            lon = np.array([self._items[i][1] for i in ids.tolist()])
+            self._arrays = (ids, *mercator(lat, lon))
+        ids, x, y = self._arrays
+        mx, my = (view.x1 - view.x0) * VIEW_MARGIN, (view.y1 - view.y0) * VIEW_MARGIN
+        inside = (x >= view.x0 - mx) & (x <= view.x1 + mx) & (y >= view.y0 - my) & (y <= view.y1 + my)
+        cell_size = CLUSTER_PX / (TILE_SIZE * 2 ** view.zoom)  # ô cố định theo thế giới: kéo bản đồ không làm đổi nhóm
+        cells = {}
+        for item_id, cx, cy in zip(ids[inside].tolist(), (x[inside] // cell_size).tolist(),
+                                   (y[inside] // cell_size).tolist()):
+            text = self._items[item_id][2]
+            cells.setdefault((text, cx, cy), []).append(item_id)
+        wanted = {}
+        for (text, cx, cy), members in cells.items():
+            icon_path = self._items[members[0]][3]
+            if len(members) == 1:
+                lat, lon = self._items[members[0]][:2]
+                wanted[("item", members[0])] = ((lat, lon, text), icon_path)
+            else:
+                lat = sum(self._items[i][0] for i in members) / len(members)
+                lon = sum(self._items[i][1] for i in members) / len(members)
+                wanted[("cluster", text, cx, cy)] = ((lat, lon, f"{text} ({len(members)})"), icon_path)
+        return wanted
+
+
+class ExplorationLayer:
+    """
+    Các node đã duyệt (closed) và đã vào tập mở (frontier) của lần tìm đang minh họa.
+    Vẽ thẳng lên canvas với tag "path" để TkinterMapView giữ chúng trên lớp ô bản đồ;
+    khi pan/zoom thì vẽ lại toàn bộ từ tọa độ đã lưu.
+    """
+    COLORS = {"frontier": "#3498db", "closed": "#e67e22"}
+
+    def __init__(self, map_widget, size=3):
+        self.map_widget = map_widget
+        self.size = size
+        self._points = {kind: ([], []) for kind in self.COLORS}  # kind -> (x, y) mercator
+        self._items = []
+        self._view = None
+
+    def add(self, kind, lat, lon):
+        """Thêm các điểm (mảng lat, lon) loại kind ("closed" hoặc "frontier")"""
+        if not len(lat):
+            return
+        x, y = mercator(np.asarray(lat), np.asarray(lon))
+        xs, ys = self._points[kind]
+        xs.extend(x.tolist())
+        ys.extend(y.tolist())
+        if self._view is not None:
+            self._draw(kind, x, y)
+
+    def clear(self):
+        for item in self._items:
+            self.map_widget.canvas.delete(item)
+        self._items = []
+        self._points = {kind: ([], []) for kind in self.COLORS}
+
+    def refresh(self, view):
+        self._view = view
+        for item in self._items:
+            self.map_widget.canvas.delete(item)
+        self._items = []
+        for kind, (xs, ys) in self._points.items():
+            self._draw(kind, np.asarray(xs), np.asarray(ys))
+
+    def _draw(self, kind, x, y):
+        view = self._view
+        px = (x - view.x0) / (view.x1 - view.x0) * view.width
+        py = (y - view.y0) / (view.y1 - view.y0) * view.height
+        inside = (px >= 0) & (px <= view.width) & (py >= 0) & (py <= view.height)
+        create, r, color = self.map_widget.canvas.create_rectangle, self.size / 2, self.COLORS[kind]
+        for cx, cy in zip(px[inside].tolist(), py[inside].tolist()):
+            self._items.append(create(cx - r, cy - r, cx + r, cy + r, fill=color, outline="", tags="path"))
+
+
+class MapLayers:
+    """
+    Đường đi + marker vật cản của App; theo dõi pan/zoom bằng cách kiểm tra khung nhìn định kỳ.
+    on_view(view) được gọi mỗi khi khung nhìn đổi (ví dụ để nạp các ô bản đồ đang xem).
+    """
+
+    def __init__(self, map_widget, on_view=None):
+        self.map_widget = map_widget
+        self.on_view = on_view
+        self.icons = IconCache()
+        self.path = PathLayer(map_widget)
+        self.obstacles = MarkerLayer(map_widget, self.icons)
+        self.exploration = ExplorationLayer(map_widget)
+        self._view = None
+        self._poll()
+
+    def _poll(self):
+        view = viewport(self.map_widget)
+        if view is not None and view != self._view:
+            self._view = view
+            self.path.refresh(view)
+            self.obstacles.refresh(view)
+            self.exploration.refresh(view)
+            if self.on_view is not None:
+                self.on_view(view)
+        self.map_widget.after(REFRESH_MS, self._poll)
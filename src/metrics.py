@@ -0,0 +1,91 @@
+import json
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+# Các bộ đếm chung cho mọi thuật toán (cộng dồn khi một yêu cầu gồm nhiều lần tìm)
+COUNTERS = ("popped", "pushed", "relaxed", "heuristic_calls", "duplicate_pops")
+
+
+class SearchMetrics:
+    """
+    Số liệu của một yêu cầu tìm đường, cùng ý nghĩa cho mọi thuật toán:
+    popped: số node được lấy ra để mở rộng; pushed: số lần đưa node vào hàng đợi/tập mở;
+    relaxed: số cạnh đã xét khi mở rộng; peak_frontier: kích thước lớn nhất của hàng đợi;
+    heuristic_calls: số lần tra heuristic; duplicate_pops: bản ghi cũ bị bỏ khi lấy ra (xóa lười);
+    phases_ms: thời gian từng giai đoạn (setup, search, path); memory_peak_kb: đỉnh bộ nhớ cấp
+    phát trong lúc tìm, chỉ đo khi trace_memory=True (tracemalloc làm chậm đáng kể).
+    """
+
+    def __init__(self, algorithm="", trace_memory=False):
+        self.algorithm = algorithm
+        self.trace_memory = trace_memory
+        self.popped = self.pushed = self.relaxed = self.heuristic_calls = self.duplicate_pops = 0
+        self.peak_frontier = 0
+        self.phases_ms = {}
+        self.memory_peak_kb = None
+        self.total_ms = 0.0
+        self.runs = 0  # số lần chạy thuật toán (tìm từ điểm giữa cạnh có thể cần tới 4 lần)
+        self.cached = 0  # số lần lấy kết quả từ cache, không chạy thuật toán
+        self.extra = {}  # thông tin của người gọi (điểm đầu/cuối, chi phí, ...)
+
+    def add(self, phases=None, peak_frontier=0, **counts):
+        """Cộng các bộ đếm và thời gian giai đoạn (giây) của một lần chạy"""
+        for name, value in counts.items():
+            setattr(self, name, getattr(self, name) + value)
+        self.peak_frontier = max(self.peak_frontier, peak_frontier)
+        for name, seconds in (phases or {}).items():
+            self.phases_ms[name] = self.phases_ms.get(name, 0.0) + seconds * 1000
+
+    @contextmanager
+    def measure(self):
+        """Đo tổng thời gian (và đỉnh bộ nhớ nếu trace_memory) của một lần chạy thuật toán"""
+        tracing = self.trace_memory and not tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.start()
+        time_start = time.perf_counter()
+        try:
+            yield self
+        finally:
+            self.total_ms += (time.perf_counter() - time_start) * 1000
+            self.runs += 1
+            if self.trace_memory and tracemalloc.is_tracing():
+                peak_kb = tracemalloc.get_traced_memory()[1] / 1024
+                self.memory_peak_kb = max(self.memory_peak_kb or 0.0, peak_kb)
+            if tracing:
+                tracemalloc.stop()
+
+    def to_dict(self):
+        data = {"algorithm": self.algorithm, **{name: getattr(self, name) for name in COUNTERS},
+                "peak_frontier": self.peak_frontier, "phases_ms": self.phases_ms,
+                "memory_peak_kb": self.memory_peak_kb, "total_ms": self.total_ms,
+                "runs": self.runs, "cached": self.cached}
+        data.update(self.extra)
+        return data
+
+    def summary(self):
+        """Vài dòng ngắn để hiển thị trên giao diện"""
+        lines = [f"Lấy ra: {self.popped}, đẩy vào: {self.pushed}, trùng: {self.duplicate_pops}",
+                 f"Cạnh đã xét: {self.relaxed}, frontier max: {self.peak_frontier}",
+                 f"Gọi heuristic: {self.heuristic_calls}"]
+        if self.phases_ms:
+            lines.append(", ".join(f"{name} {ms:.1f} ms" for name, ms in self.phases_ms.items()))
+        if self.memory_peak_kb is not None:
+            lines.append(f"Bộ nhớ đỉnh: {self.memory_peak_kb:.0f} KB")
+        return "\n".join(lines)
+
+
+class MetricsLog:
+    """Ghi mỗi SearchMetrics thành một dòng JSON (JSONL) vào file, dùng được từ nhiều luồng"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def append(self, metrics, **fields):
+        record = {"time": time.time(), **metrics.to_dict(), **fields}
+        line = json.dumps(record, ensure_ascii=False)
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
@@ -0,0 +1,221 @@
+from collections import namedtuple
+import numpy as np
+from scipy.spatial import KDTree
+
+# Điểm trên cạnh gần vị trí nhấp nhất: đoạn u-v, t in [0, 1] tính từ u, tọa độ điểm chiếu và
+# khoảng cách (mét). w_uv / w_vu là chi phí cạnh u->v / v->u (None nếu không có chiều đó).
+# seg là số thứ tự đoạn trong NearestIndex (hai cạnh đã co có thể cùng hai đầu u, v).
+Snap = namedtuple("Snap", "u v t lat lon distance w_uv w_vu seg")
+
+
+class NearestIndex:
+    """
+    Chỉ mục tìm node / cạnh gần nhất trên tọa độ phẳng ENU (mét) của Graph.
+
+    Dựng một lần cho mỗi cấu trúc đồ thị; vật cản được xử lý bằng mảng blocked truyền vào lúc
+    truy vấn nên thêm/xóa vật cản không phải dựng lại. Cạnh hai chiều chỉ được lưu một đoạn.
+    Cạnh đã co (Graph.chain_nodes) được chia thành các mảnh theo node giữa để snap đúng
+    hình dạng đường; t của đoạn tính theo chiều dài dọc các mảnh.
+    """
+
+    def __init__(self, graph):
+        self.graph = graph
+        xy = graph.xy
+        self.node_tree = KDTree(xy)
+
+        # Chi phí gốc: chỉ mục dùng cho mọi trạng thái vật cản
+        indptr, indices, weights = graph.indptr, graph.indices, graph.weights
+        n = graph.num_nodes
+        u = np.repeat(np.arange(n, dtype=np.int64), np.diff(indptr))
+        v = indices.astype(np.int64)
+        edge = np.arange(len(v), dtype=np.int64)
+        # Gộp hai chiều của cùng một đoạn đường: khóa (min, max), giữ chi phí từng chiều
+        lo, hi = np.minimum(u, v), np.maximum(u, v)
+        key = lo * n + hi
+        order = np.argsort(key, kind='stable')
+        key, u, v, w, edge = key[order], u[order], v[order], weights[order], edge[order]
+        first = np.ones(len(key), dtype=bool)
+        first[1:] = key[1:] != key[:-1]
+        chain_ptr, chain_nodes = graph.chain_ptr, graph.chain_nodes
+        if len(chain_nodes):
+            # Hai chiều chỉ là một đoạn nếu đi qua cùng các node giữa (ngược thứ tự)
+            for k in np.flatnonzero(~first):
+                e1, e2 = edge[k - 1], edge[k]
+                if not np.array_equal(chain_nodes[chain_ptr[e1]:chain_ptr[e1 + 1]],
+                                      chain_nodes[chain_ptr[e2]:chain_ptr[e2 + 1]][::-1]):
+                    first[k] = True
+        seg = np.cumsum(first) - 1
+        self.seg_u, self.seg_v = lo[order][first], hi[order][first]
+        self.w_forward = np.full(len(self.seg_u), np.nan)  # seg_u -> seg_v
+        self.w_backward = np.full(len(self.seg_u), np.nan)  # seg_v -> seg_u
+        forward = u < v
+        self.w_forward[seg[forward]] = w[forward]
+        self.w_backward[seg[~forward]] = w[~forward]
+
+        # Node trên mỗi đoạn theo chiều seg_u -> seg_v: seg_nodes[seg_ptr[s]:seg_ptr[s + 1]]
+        edge, forward = edge[first], forward[first]
+        lengths = np.diff(chain_ptr)[edge] + 2
+        self.seg_ptr = np.zeros(len(edge) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=self.seg_ptr[1:])
+        if len(chain_nodes):
+            seq = []
+            for s, (e, fwd) in enumerate(zip(edge.tolist(), forward.tolist())):
+                middle = chain_nodes[chain_ptr[e]:chain_ptr[e + 1]]
+                seq += [self.seg_u[s:s + 1], middle if fwd else middle[::-1], self.seg_v[s:s + 1]]
+            self.seg_nodes = np.concatenate(seq).astype(np.int64)
+        else:
+            self.seg_nodes = np.stack((self.seg_u, self.seg_v), axis=-1).reshape(-1)
+
+        # Mảnh: cặp node liên tiếp trên một đoạn, t0 / t1 là vị trí hai đầu mảnh trong đoạn
+        inner = np.ones(len(self.seg_nodes), dtype=bool)
+        inner[self.seg_ptr[1:] - 1] = False  # node cuối đoạn không mở mảnh mới
+        self.piece_p = self.seg_nodes[inner]
+        self.piece_q = self.seg_nodes[np.flatnonzero(inner) + 1]
+        self.piece_seg = np.repeat(np.arange(len(edge), dtype=np.int64), lengths - 1)
+        piece_ptr = self.seg_ptr - np.arange(len(edge) + 1)
+        a, b = xy[self.piece_p], xy[self.piece_q]
+        length = np.hypot(*(b - a).T)
+        cum = np.zeros(len(length) + 1)
+        np.cumsum(length, out=cum[1:])
+        total = cum[piece_ptr[1:]] - cum[piece_ptr[:-1]]
+        before = cum[:-1] - cum[piece_ptr[:-1]][self.piece_seg]
+        scale = np.divide(1.0, total, out=np.zeros_like(total), where=total > 0)[self.piece_seg]
+        self.piece_t0 = before * scale
+        self.piece_t1 = (before + length) * scale
+        self.piece_a, self.piece_d = a, b - a
+        self.piece_tree = KDTree((a + b) / 2) if len(a) else None
+        self.max_half = float(length.max() / 2) if len(a) else 0.0
+
+    def nearest_node(self, lat, lon, blocked, max_distance=np.inf):
+        """(chỉ số, khoảng cách mét) của node không bị chặn gần nhất, (None, inf) nếu không có"""
+        graph = self.graph
+        p = graph.to_xy(lat, lon)
+        n = graph.num_nodes
+        k = 1
+        while n:
+            dist, idx = self.node_tree.query(p, k=min(k, n), distance_upper_bound=max_distance)
+            dist, idx = np.atleast_1d(dist), np.atleast_1d(idx)
+            valid = idx < n  # KDTree trả về n khi vượt distance_upper_bound
+            free = valid & ~blocked[np.minimum(idx, n - 1)]
+            if free.any():
+                i = int(np.argmax(free))
+                return int(idx[i]), float(dist[i])
+            if not valid.all() or k >= n:
+                break
+            k *= 8  # các node gần nhất đều bị chặn: mở rộng số ứng viên
+        return None, np.inf
+
+    def nearest_edge(self, lat, lon, blocked, max_distance=np.inf):
+        """Snap tới điểm gần nhất trên một đoạn đường không có node nào bị chặn, None nếu không có"""
+        graph = self.graph
+        if self.piece_tree is None:
+            return None
+        p = graph.to_xy(lat, lon)
+        # Node tự do gần nhất thường nằm trên một đoạn tự do nên cho cận trên khoảng cách tới đoạn gần
+        # nhất; mảnh cách p không quá d thì trung điểm cách p không quá d + nửa độ dài mảnh dài nhất.
+        _, bound = self.nearest_node(lat, lon, blocked, max_distance)
+        if bound == np.inf:
+            return None
+        radius = bound + self.max_half + 1e-6
+        while True:
+            near = np.asarray(self.piece_tree.query_ball_point(p, radius), dtype=np.int64)
+            cand = near[self._free_segments(blocked, self.piece_seg[near])]
+            if len(cand) or len(near) == len(self.piece_seg) or radius > max_distance + self.max_half:
+                break
+            radius *= 2  # các đoạn quanh node tự do gần nhất đều bị chặn ở chỗ khác
+        if len(cand) == 0:
+            return None
+
+        a, d = self.piece_a[cand], self.piece_d[cand]
+        length2 = np.einsum('ij,ij->i', d, d)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            t = np.clip(np.einsum('ij,ij->i', p - a, d) / length2, 0.0, 1.0)
+        t = np.nan_to_num(t)
+        proj = a + t[:, None] * d
+        dist = np.hypot(*(proj - p).T)
+        best = int(np.argmin(dist))
+        if dist[best] > max_distance:
+            return None
+        k, tb = cand[best], float(t[best])
+        s = int(self.piece_seg[k])
+        i, j = self.piece_p[k], self.piece_q[k]
+        lat_p = graph.lat[i] + tb * (graph.lat[j] - graph.lat[i])
+        lon_p = graph.lon[i] + tb * (graph.lon[j] - graph.lon[i])
+        t_seg = float(self.piece_t0[k] + tb * (self.piece_t1[k] - self.piece_t0[k]))
+        w_uv, w_vu = self.w_forward[s], self.w_backward[s]
+        return Snap(int(self.seg_u[s]), int(self.seg_v[s]), t_seg, float(lat_p), float(lon_p), float(dist[best]),
+                    None if np.isnan(w_uv) else float(w_uv), None if np.isnan(w_vu) else float(w_vu), s)
+
+    def _free_segments(self, blocked, segs):
+        """Mặt nạ các đoạn segs không có node nào (kể cả node giữa) bị chặn"""
+        free = np.ones(len(segs), dtype=bool)
+        ptr, nodes = self.seg_ptr, self.seg_nodes
+        for s in np.unique(segs).tolist():
+            if blocked[nodes[ptr[s]:ptr[s + 1]]].any():
+                free[segs == s] = False
+        return free
+
+    def segment_points(self, s, t0, t1):
+        """(lat, lon) các node giữa của đoạn s nằm giữa vị trí t0 và t1, theo thứ tự đi từ t0"""
+        graph = self.graph
+        lo, hi = min(t0, t1), max(t0, t1)
+        a, b = self._pieces(s)
+        # node thứ k + 1 của đoạn là đầu cuối của mảnh k
+        t = self.piece_t1[a:b - 1]
+        middle = self.piece_q[a:b - 1][(t > lo) & (t < hi)]
+        if t1 < t0:
+            middle = middle[::-1]
+        return list(zip(graph.lat[middle].tolist(), graph.lon[middle].tolist()))
+
+    def _pieces(self, s):
+        """Khoảng mảnh [a, b) của đoạn s"""
+        return int(self.seg_ptr[s] - s), int(self.seg_ptr[s + 1] - s - 1)
+
+
+def snap_exits(snap):
+    """Các (chỉ số node, chi phí) có thể đi tới từ điểm snap theo chiều cho phép của cạnh"""
+    exits = []
+    if snap.w_uv is not None:
+        exits.append((snap.v, (1 - snap.t) * snap.w_uv))
+    if snap.w_vu is not None:
+        exits.append((snap.u, snap.t * snap.w_vu))
+    return exits
+
+
+def snap_entries(snap):
+    """Các (chỉ số node, chi phí) từ đó có thể đi tới điểm snap theo chiều cho phép của cạnh"""
+    entries = []
+    if snap.w_uv is not None:
+        entries.append((snap.u, snap.t * snap.w_uv))
+    if snap.w_vu is not None:
+        entries.append((snap.v, (1 - snap.t) * snap.w_vu))
+    return entries
+
+
+def direct_cost(start, goal):
+    """Chi phí đi thẳng trên cùng một cạnh từ start tới goal, None nếu không đi được"""
+    if start.seg != goal.seg:
+        return None
+    if goal.t >= start.t and start.w_uv is not None:
+        return (goal.t - start.t) * start.w_uv
+    if goal.t <= start.t and start.w_vu is not None:
+        return (start.t - goal.t) * start.w_vu
+    return None
+
+
+def route_coords(graph, start, goal, path):
+    """
+    (lat, lon) để vẽ đường đi từ điểm snap start qua path (node_id) tới điểm snap goal,
+    theo đúng hình dạng đường: gồm các node giữa của cạnh đã co và của hai cạnh dở dang.
+    """
+    index = graph.nearest_index()
+    coords = [(start.lat, start.lon)]
+    if not path:
+        coords += index.segment_points(start.seg, start.t, goal.t)
+    else:
+        idx = graph.expand_indices(graph.indices_of(path))
+        coords += index.segment_points(start.seg, start.t, 1.0 if idx[0] == start.v else 0.0)
+        coords += zip(graph.lat[idx].tolist(), graph.lon[idx].tolist())
+        coords += index.segment_points(goal.seg, 1.0 if idx[-1] == goal.v else 0.0, goal.t)
+    coords.append((goal.lat, goal.lon))
+    return coords
@@ -1,5 +1,4 @@
 import threading
-from PIL import Image, ImageTk
 
 class ObstacleManager:
     def __init__(self, app):
@@ -7,30 +6,33 @@ class ObstacleManager:
         self.region_stacks = []
 
     def add_area_obstacles_async(self, lat1, lon1, lat2, lon2):
+        """Chặn các node trong hình chữ nhật lat/lon"""
+        self._start(lambda graph: graph.nodes_in_rect(lat1, lon1, lat2, lon2),
+                    (lat1 + lat2) / 2, (lon1 + lon2) / 2)
+
+    def add_polygon_obstacles_async(self, points):
+        """Chặn các node trong đa giác [(lat, lon), ...]"""
+        lat_c = sum(p[0] for p in points) / len(points)
+        lon_c = sum(p[1] for p in points) / len(points)
+        self._start(lambda graph: graph.nodes_in_polygon(points), lat_c, lon_c)
+
+    def add_circle_obstacles_async(self, lat, lon, radius_m):
+        """Chặn các node cách tâm (lat, lon) không quá radius_m mét"""
+        self._start(lambda graph: graph.nodes_in_circle(lat, lon, radius_m), lat, lon)
+
+    def _start(self, select, lat_c, lon_c):
         threading.Thread(
-            target=self._process_area, args=(lat1, lon1, lat2, lon2), daemon=True
+            target=self._process_area, args=(select, lat_c, lon_c), daemon=True
         ).start()
 
-    def _process_area(self, lat1, lon1, lat2, lon2):
-        lat_min, lat_max = min(lat1, lat2), max(lat1, lat2)
-        lon_min, lon_max = min(lon1, lon2), max(lon1, lon2)
-        affected = [
-            node for node, (lat, lon) in self.app.graph.node_coords.items()
-            if lat_min <= lat <= lat_max and lon_min <= lon <= lon_max
-            and not self.app.graph.is_obstacle(node)
-        ]
-        self.region_stacks.append(affected)
-        self.app.graph.add_obstacles(affected)
-        self.app.map_widget.after(0, lambda: self._add_area_marker(lat1, lon1, lat2, lon2))
+    def _process_area(self, select, lat_c, lon_c):
+        # Lấy node trong vùng qua lưới không gian, chỉ lọc chính xác các ô giao với vùng;
+        # router giữ select để chọn lại node trên đồ thị dựng lại khi nạp ô
+        self.region_stacks.append(self.app.router.add_region(select))
+        self.app.map_widget.after(0, lambda: self._add_area_marker(lat_c, lon_c))
 
-    def _add_area_marker(self, lat1, lon1, lat2, lon2):
-        lat_c = (lat1 + lat2) / 2
-        lon_c = (lon1 + lon2) / 2
-        img = Image.open("res\\house-flood-water-solid.png").resize((30, 30), Image.Resampling.LANCZOS)
-        icon = ImageTk.PhotoImage(img)
-        marker = self.app.map_widget.set_marker(lat_c, lon_c, text="Vùng cấm", icon=icon)
-        self.app.set_marker_color(marker, "black")
-        self.app.markers.append(marker)
-        self.app.map_widget.delete_all_path()
+    def _add_area_marker(self, lat_c, lon_c):
+        self.app.layers.obstacles.add(lat_c, lon_c, "Vùng cấm", self.app.REGION_ICON)
+        self.app.layers.path.clear()
         if self.app.start_node and self.app.goal_node:
-            self.app.after(600, self.app.run_algorithm_thread)  # Delay chút để tránh lag
+            self.app.run_algorithm_thread()  # luồng tìm đường tự gộp các yêu cầu dồn dập
@@ -0,0 +1,134 @@
+from array import array
+import xml.etree.ElementTree as ET
+import numpy as np
+from graph import Graph, EARTH_RADIUS_M  # cùng bán kính osmnx dùng để tính 'length'
+from contract import contract_chains
+
+# Các giá trị highway không đi được (đường đang quy hoạch/xây dựng, sân ga, ...)
+NON_ROUTABLE_HIGHWAYS = {
+    "proposed", "construction", "abandoned", "disused", "razed", "no",
+    "platform", "raceway", "bus_guideway", "escape", "elevator", "corridor",
+    "bus_stop", "rest_area", "services",
+}
+ONEWAY_FORWARD = {"yes", "true", "1"}
+ONEWAY_REVERSE = {"-1", "reverse"}
+
+PROGRESS_EVERY = 5000  # số phần tử XML giữa 2 lần báo tiến độ
+
+
+def load_osm(source_path, progress=None, simplify=True):
+    """
+    Đọc file OSM XML theo luồng (iterparse) và dựng Graph trực tiếp.
+
+    Node chỉ được giữ trong các mảng array (id, lat, lon), mỗi phần tử XML bị
+    xóa ngay sau khi đọc. Chỉ các way có tag highway đi được mới sinh cạnh;
+    chiều dài cạnh được tính vectorized bằng haversine ở cuối.
+    simplify: co các chuỗi node bậc 2 thành một cạnh giữ hình dạng (contract.contract_chains).
+    progress(message) được gọi định kỳ để báo tiến độ.
+    """
+    report = progress or (lambda message: None)
+    node_ids, node_lat, node_lon = array("q"), array("d"), array("d")
+    edge_u, edge_v = array("q"), array("q")
+    count_nodes = count_ways = 0
+
+    context = ET.iterparse(source_path, events=("start", "end"))
+    _, root = next(context)
+    for event, elem in context:
+        if event != "end":
+            continue
+        tag = elem.tag
+        if tag == "node":
+            if elem.get("visible") != "false":
+                node_ids.append(int(elem.get("id")))
+                node_lat.append(float(elem.get("lat")))
+                node_lon.append(float(elem.get("lon")))
+            count_nodes += 1
+        elif tag == "way":
+            _add_way(elem, edge_u, edge_v)
+            count_ways += 1
+        elif tag != "relation":
+            continue
+        # Giải phóng phần tử đã đọc để bộ nhớ không tăng theo kích thước file
+        root.clear()
+        if (count_nodes + count_ways) % PROGRESS_EVERY == 0:
+            report(f"Đang đọc bản đồ: {count_nodes} nút, {count_ways} đường...")
+
+    report("Đang dựng đồ thị...")
+    graph = _build_graph(node_ids, node_lat, node_lon, edge_u, edge_v)
+    if simplify:
+        report("Đang rút gọn đồ thị...")
+        graph = contract_chains(graph)
+    return graph
+
+
+def _add_way(elem, edge_u, edge_v):
+    refs = []
+    tags = {}
+    for child in elem:
+        if child.tag == "nd":
+            refs.append(int(child.get("ref")))
+        elif child.tag == "tag":
+            tags[child.get("k")] = child.get("v")
+
+    highway = tags.get("highway")
+    if highway is None or highway in NON_ROUTABLE_HIGHWAYS or tags.get("area") == "yes":
+        return
+    if len(refs) < 2:
+        return
+
+    oneway = tags.get("oneway", "").lower()
+    if oneway in ONEWAY_REVERSE:
+        forward, backward = False, True
+    elif oneway in ONEWAY_FORWARD or tags.get("junction") == "roundabout":
+        forward, backward = True, False
+    else:
+        forward, backward = True, True
+    if forward:
+        edge_u.extend(refs[:-1])
+        edge_v.extend(refs[1:])
+    if backward:
+        edge_u.extend(refs[1:])
+        edge_v.extend(refs[:-1])
+
+
+def _build_graph(node_ids, node_lat, node_lon, edge_u, edge_v):
+    ids = np.frombuffer(node_ids, dtype=np.int64)
+    lat = np.frombuffer(node_lat, dtype=np.float64)
+    lon = np.frombuffer(node_lon, dtype=np.float64)
+    u = np.frombuffer(edge_u, dtype=np.int64)
+    v = np.frombuffer(edge_v, dtype=np.int64)
+
+    order = np.argsort(ids, kind="stable")
+    ids, lat, lon = ids[order], lat[order], lon[order]
+
+    # Bỏ các đoạn trỏ tới node không có trong file (file cắt theo vùng) và vòng tự thân
+    u_idx, u_ok = _find(ids, u)
+    v_idx, v_ok = _find(ids, v)
+    keep = u_ok & v_ok & (u != v)
+    u_idx, v_idx = u_idx[keep], v_idx[keep]
+
+    # Chỉ giữ các node thuộc đường đi được
+    used = np.zeros(len(ids), dtype=bool)
+    used[u_idx] = True
+    used[v_idx] = True
+
+    lengths = haversine(lat[u_idx], lon[u_idx], lat[v_idx], lon[v_idx])
+    graph = Graph()
+    graph.add_nodes(ids[used], lat[used], lon[used])
+    graph.add_edges(ids[u_idx], ids[v_idx], lengths)
+    graph.freeze()
+    return graph
+
+
+def _find(sorted_ids, query):
+    idx = np.searchsorted(sorted_ids, query)
+    idx[idx == len(sorted_ids)] = 0
+    found = sorted_ids[idx] == query if len(sorted_ids) else np.zeros(len(query), dtype=bool)
+    return idx, found
+
+
+def haversine(lat1, lon1, lat2, lon2):
+    """Khoảng cách vòng tròn lớn (mét) giữa các cặp tọa độ, tính theo mảng"""
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
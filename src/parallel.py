@@ -0,0 +1,89 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import numpy as np
+from graph import Graph
+
+# Đồ thị của tiến trình con, gắn vào shared memory một lần trong initializer của pool
+_worker_graph = None
+_worker_blocks = []  # giữ các khối shared memory mở khi mảng của đồ thị còn dùng
+
+
+def default_workers():
+    return max(1, (os.cpu_count() or 1) - 1)
+
+
+class GraphPool(ProcessPoolExecutor):
+    """
+    ProcessPoolExecutor mà mỗi tiến trình con có sẵn một bản Graph (lấy bằng worker_graph()).
+    Các mảng CSR nằm trong shared memory: tiến trình con chỉ nhận tên khối và dựng Graph
+    trên chính vùng nhớ đó, không pickle hay sao chép. Vật cản lấy theo thời điểm tạo pool.
+    Các khối được giải phóng khi pool shutdown (kể cả khi ra khỏi with).
+    """
+
+    def __init__(self, graph, workers=None):
+        arrays = (graph.ids, graph.lat, graph.lon, graph.indptr, graph.indices, graph.weights,
+                  graph.chain_ptr, graph.chain_nodes)
+        self._blocks, specs = share_arrays(arrays)
+        try:
+            super().__init__(max_workers=workers or default_workers(), initializer=_init_worker,
+                             initargs=(specs, np.flatnonzero(graph.blocked)))
+        except BaseException:
+            release_arrays(self._blocks)
+            raise
+
+    def shutdown(self, wait=True, *, cancel_futures=False):
+        super().shutdown(wait=wait, cancel_futures=cancel_futures)
+        release_arrays(self._blocks)
+        self._blocks = []
+
+
+def graph_pool(graph, workers=None):
+    return GraphPool(graph, workers)
+
+
+def worker_graph():
+    return _worker_graph
+
+
+def _init_worker(specs, blocked):
+    global _worker_graph, _worker_blocks
+    _worker_blocks, arrays = attach_arrays(specs)
+    _worker_graph = Graph.from_arrays(*arrays)
+    _worker_graph.block_indices(blocked)
+
+
+def share_arrays(arrays):
+    """Chép các mảng vào các khối shared memory mới; trả về (các khối, [(tên, shape, dtype)])"""
+    blocks, specs = [], []
+    try:
+        for array in arrays:
+            array = np.ascontiguousarray(array)
+            block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+            blocks.append(block)
+            np.ndarray(array.shape, array.dtype, buffer=block.buf)[...] = array
+            specs.append((block.name, array.shape, array.dtype.str))
+    except BaseException:
+        release_arrays(blocks)
+        raise
+    return blocks, specs
+
+
+def attach_arrays(specs):
+    """Mở các khối theo specs của share_arrays; trả về (các khối, các mảng dùng chung vùng nhớ)"""
+    blocks = [shared_memory.SharedMemory(name=name) for name, _, _ in specs]
+    arrays = [np.ndarray(shape, np.dtype(dtype), buffer=block.buf)
+              for block, (_, shape, dtype) in zip(blocks, specs)]
+    return blocks, arrays
+
+
+def release_arrays(blocks):
+    for block in blocks:
+        block.close()
+        block.unlink()
+
+
+def chunks(items, count):
+    """Chia items thành tối đa count phần gần bằng nhau"""
+    size = max(1, -(-len(items) // max(1, count)))
+    return [items[i:i + size] for i in range(0, len(items), size)]
@@ -0,0 +1,64 @@
+from collections import OrderedDict
+import threading
+import numpy as np
+
+
+class RouteCache:
+    """
+    LRU các kết quả tìm đường, khóa (thuật toán, heuristic, start, goal) và gắn với Graph.uid,
+    Graph.version; kết quả của đồ thị khác (vd. dựng lại khi nạp ô) không bao giờ được dùng.
+
+    Khi version đã đổi, kết quả vẫn dùng lại được nếu từ lúc đó chỉ có thêm vật cản và không
+    node mới bị chặn nào nằm trên đường đi: chặn thêm node chỉ làm các đường khác dài ra (hoặc
+    mất đi) nên đường đã tìm vẫn đi được và vẫn tối ưu. Bỏ chặn hoặc đổi cấu trúc đồ thị
+    (không còn đủ lịch sử) thì kết quả bị bỏ.
+    """
+
+    def __init__(self, maxsize=256):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()  # key -> (uid, version, expanded, path, chỉ số node trên path)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, graph, key):
+        """(expanded, path) nếu còn hợp lệ với trạng thái vật cản hiện tại, None nếu không có"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] != graph.uid:
+                del self._entries[key]
+                entry = None
+            elif entry is not None and entry[1] != graph.version:
+                entry = self._revalidate(graph, key, entry)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[2], entry[3]
+
+    def put(self, graph, key, version, expanded, path):
+        """Lưu kết quả tính trên đồ thị ở version (lấy trước khi chạy thuật toán)"""
+        path_idx = graph.expand_indices(graph.indices_of(path)) if path else np.empty(0, dtype=np.int64)
+        with self._lock:
+            self._entries[key] = (graph.uid, version, expanded, path, path_idx)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _revalidate(self, graph, key, entry):
+        uid, version, expanded, path, path_idx = entry
+        changes = graph.changes_since(version)
+        if changes is None or len(changes[1]) or np.isin(changes[0], path_idx).any():
+            del self._entries[key]
+            return None
+        entry = (uid, graph.version, expanded, path, path_idx)
+        self._entries[key] = entry
+        return entry
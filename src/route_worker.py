@@ -0,0 +1,71 @@
+import threading
+from algorithm import CancelToken, SearchCancelled
+
+DEBOUNCE_S = 0.05  # chờ thêm khoảng này để gộp các yêu cầu gửi dồn dập (nhấp liên tục)
+
+
+class RouteWorker:
+    """
+    Một luồng tìm đường duy nhất với hàng đợi gộp: chỉ giữ yêu cầu mới nhất.
+
+    submit() hủy lần tìm đang chạy (CancelToken, các vòng lặp tìm kiếm tự kiểm tra) và thay
+    yêu cầu đang chờ bằng yêu cầu mới. Kết quả của yêu cầu đã bị thay thế được bỏ; on_done
+    nhận (seq, kết quả), người gọi so seq với latest để bỏ kết quả đến muộn.
+    """
+
+    def __init__(self, debounce=DEBOUNCE_S):
+        self.debounce = debounce
+        self.latest = 0  # seq của yêu cầu mới nhất đã gửi
+        self._cond = threading.Condition()
+        self._pending = None  # (seq, job, on_done) chưa chạy
+        self._token = None  # CancelToken của lần tìm đang chạy
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+
+    def submit(self, job, on_done):
+        """job(cancel_token) chạy trên luồng tìm đường; trả về seq của yêu cầu"""
+        with self._cond:
+            self.latest += 1
+            self._pending = (self.latest, job, on_done)
+            if self._token is not None:
+                self._token.cancel()
+            self._cond.notify()
+            return self.latest
+
+    def cancel(self):
+        """Bỏ yêu cầu đang chờ và hủy lần tìm đang chạy"""
+        with self._cond:
+            self.latest += 1
+            self._pending = None
+            if self._token is not None:
+                self._token.cancel()
+
+    def _loop(self):
+        while True:
+            with self._cond:
+                while self._pending is None:
+                    self._cond.wait()
+                # Debounce: đợi tới khi không còn yêu cầu mới trong khoảng debounce
+                seq = self._pending[0]
+                while True:
+                    self._cond.wait(self.debounce)
+                    if self._pending is None or self._pending[0] == seq:
+                        break
+                    seq = self._pending[0]
+                if self._pending is None:
+                    continue
+                seq, job, on_done = self._pending
+                self._pending = None
+                token = self._token = CancelToken()
+            try:
+                result = job(token)
+            except SearchCancelled:
+                continue
+            except Exception as e:  # job tự báo lỗi cho giao diện; chỉ giữ cho luồng không chết
+                print(f"Lỗi tìm đường: {e}")
+                continue
+            finally:
+                with self._cond:
+                    self._token = None
+            if seq == self.latest:
+                on_done(seq, result)
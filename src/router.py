@@ -0,0 +1,395 @@
+import os
+import threading
+from itertools import count
+from collections import namedtuple
+import numpy as np
+from graph import Graph
+from snapshot import load_cached_graph, snapshot_path
+from osm_loader import load_osm
+from heuristic import GeoHeuristic
+from ch import ContractionHierarchies, load_or_build_hierarchy
+from landmarks import load_or_build_landmarks
+from incremental import LPAStar
+from route_cache import RouteCache
+from tree_cache import TreeCache
+from tiles import TileStore, TILE_DEG, MAX_TILES
+from nearest import snap_exits, snap_entries, direct_cost
+from algorithm import *
+
+# Kết quả route_points: bản chụp đã dùng, Snap hai điểm (None nếu không có đường gần) và kết quả route_snapped
+PointRoute = namedtuple("PointRoute", "graph start goal expanded path cost cached")
+
+
+class Router:
+    """
+    Đồ thị + danh sách thuật toán, không phụ thuộc giao diện (dùng chung cho App và bench).
+    Các dữ liệu tiền xử lý (Contraction Hierarchies, landmark ALT) được dựng lười lần đầu dùng,
+    cho đúng đồ thị mà thuật toán sẽ chạy trên đó.
+    """
+    ALGORITHMS = {  # tên -> hàm tạo (router, đồ thị sẽ tìm trên đó)
+        "A*": lambda self, _: AStar(self.heuristic()),
+        "Dijkstra": lambda self, _: Dijkstra(trees=self.trees),
+        "Bidirectional Dijkstra": lambda *_: BidirectionalDijkstra(),
+        "Greedy": lambda self, _: Greedy(self.heuristic()),
+        "BFS": lambda *_: BFS(),
+        "DFS": lambda *_: DFS(),
+        "Bidirectional A*": lambda self, _: BidirectionalAStar(self.heuristic()),
+        "A* (ALT)": lambda self, graph: AStar(self.landmarks(graph)),
+        "Bidirectional A* (ALT)": lambda self, graph: BidirectionalAStar(self.landmarks(graph)),
+        "UCS": lambda *_: UCS(),
+        "Bellman-Ford": lambda *_: BellmanFord(),
+        "Contraction Hierarchies": lambda self, graph: ContractionHierarchies(
+            self.hierarchy(graph), fallback=AStar(GeoHeuristic(1))),
+        "LPA* (tìm lại tăng dần)": lambda self, _: self.planner.session(),
+    }
+    HEURISTICS = {
+        "Heuristic 1 (chim bay)": 1,
+        "Heuristic 2 (xấp xỉ phẳng)": 2,
+        "Heuristic 3 (theo góc)": 3,
+    }
+
+    def __init__(self, source_path, progress=None, cache_size=256, tree_cache_size=16):
+        self.source_path = source_path
+        self.progress = progress or (lambda message: None)
+        self.graph = Graph()
+        self.cache = RouteCache(cache_size)
+        self.trees = TreeCache(tree_cache_size)  # cây đường đi ngắn nhất của Dijkstra theo điểm đầu/đích
+        self.heuristic_kind = 1  # heuristic dùng cho A*, Greedy, Bidirectional A*
+        self._hierarchy = None  # Contraction Hierarchies, dựng/đọc lần đầu khi được chọn
+        self._hierarchy_lock = threading.Lock()
+        self._landmarks = None  # Bảng khoảng cách landmark cho heuristic ALT
+        self._landmarks_lock = threading.Lock()
+        # LPA* giữ trạng thái giữa các lần tìm để chỉ sửa lại phần bị vật cản ảnh hưởng;
+        # cần heuristic nhất quán nên luôn dùng khoảng cách chim bay
+        self.planner = LPAStar(GeoHeuristic(1))
+
+    def load_graph(self):
+        """Dùng snapshot nhị phân nếu file OSM chưa đổi, nếu không thì đọc OSM và ghi snapshot"""
+        self.graph = load_cached_graph(self.source_path, self.parse_osm)
+        self.cache.clear()  # kết quả cũ gắn với version của đồ thị trước
+        self.trees.clear()
+        return self.graph
+
+    def parse_osm(self):
+        """Đọc file OSM theo luồng và dựng đồ thị nội bộ (CSR)"""
+        return load_osm(self.source_path, progress=self.progress)
+
+    def algorithm(self, name, graph=None):
+        """Tạo thuật toán theo tên trong ALGORITHMS để chạy trên graph (mặc định đồ thị hiện tại), None nếu không có"""
+        creator = self.ALGORITHMS.get(name)
+        return creator(self, graph if graph is not None else self.graph) if creator else None
+
+    def route(self, name, start, goal, use_cache=True, graph=None, cancel=None, metrics=None):
+        """
+        Tìm đường bằng thuật toán name; trả về (số node đã duyệt, path, lấy từ cache hay không).
+        Thuật toán chạy trên graph (bản chụp Graph.snapshot(), mặc định chụp đồ thị hiện tại)
+        nên vật cản thêm/xóa trong lúc tìm không làm sai kết quả.
+        Kết quả được dùng lại khi các thay đổi vật cản sau đó không chạm vào đường đi.
+        cancel (algorithm.CancelToken): hủy giữa chừng, khi đó ném SearchCancelled.
+        metrics (metrics.SearchMetrics): nhận số liệu tìm kiếm, cộng dồn qua nhiều lần gọi.
+        start/goal là node có cạnh: node giữa của cạnh đã co ném ValueError (tìm theo tọa độ bằng route_points).
+        """
+        graph = graph if graph is not None else self.graph.snapshot()
+        graph.check_endpoints([graph.index_of(start), graph.index_of(goal)])
+        key = (name, self.heuristic_kind, start, goal)
+        if use_cache:
+            cached = self.cache.get(graph, key)
+            if cached is not None:
+                if metrics is not None:
+                    metrics.cached += 1
+                return cached[0], cached[1], True
+        algo = self.algorithm(name, graph)
+        if algo is None:
+            raise KeyError(name)
+        algo.cancel = cancel
+        algo.metrics = metrics
+        if metrics is None:
+            expanded, path = algo.run(start, goal, graph)
+        else:
+            metrics.algorithm = name
+            with metrics.measure():
+                expanded, path = algo.run(start, goal, graph)
+        if use_cache:
+            self.cache.put(graph, key, graph.version, expanded, path)
+        return expanded, path, False
+
+    def steps(self, name, start, goal, graph=None, batch=STEP_BATCH):
+        """
+        Generator các algorithm.SearchStep của thuật toán name từ start tới goal (node_id),
+        để minh họa quá trình tìm; không dùng cache.
+        """
+        graph = graph if graph is not None else self.graph.snapshot()
+        graph.check_endpoints([graph.index_of(start), graph.index_of(goal)])
+        algo = self.algorithm(name, graph)
+        if algo is None:
+            raise KeyError(name)
+        return algo.steps(start, goal, graph, batch)
+
+    def route_snapped(self, name, start, goal, use_cache=True, graph=None, cancel=None, metrics=None):
+        """
+        Tìm đường giữa hai điểm nằm giữa cạnh (nearest.Snap từ Graph.snap_to_edge).
+        Thử các cặp node thoát khỏi cạnh đầu / đi vào cạnh cuối (tối đa 4), cộng chi phí phần
+        cạnh dở dang; bỏ qua cặp có cận dưới (chim bay) không tốt hơn kết quả đang có.
+        Trả về (số node đã duyệt, path node_id, tổng chi phí, mọi lần tìm đều lấy từ cache).
+        """
+        graph = graph if graph is not None else self.graph.snapshot()  # mọi lần tìm dùng cùng một trạng thái vật cản
+        ids, xy = graph.ids, graph.xy
+        best_cost, best_path = float('inf'), None
+        direct = direct_cost(start, goal)
+        if direct is not None:
+            best_cost, best_path = direct, []
+        pairs = sorted(((ca + cb + float(np.hypot(*(xy[a] - xy[b]))), a, ca, b, cb)
+                        for a, ca in snap_exits(start) for b, cb in snap_entries(goal)))
+        expanded_total, all_cached = 0, True
+        for bound, a, ca, b, cb in pairs:
+            if bound >= best_cost:
+                break
+            expanded, path, cached = self.route(name, int(ids[a]), int(ids[b]), use_cache, graph, cancel, metrics)
+            expanded_total += expanded
+            all_cached = all_cached and cached
+            if path:
+                cost = ca + self.path_cost(path, graph) + cb
+                if cost < best_cost:
+                    best_cost, best_path = cost, path
+        return expanded_total, best_path, best_cost, all_cached
+
+    def region_ready(self, start_point, goal_point):
+        """Đồ thị hiện tại đã đủ cho hai điểm (lat, lon) chưa; False thì gọi prepare_route (trên luồng riêng)"""
+        return True
+
+    def prepare_route(self, start_point, goal_point):
+        """Chuẩn bị đồ thị cho lần tìm giữa hai điểm (lat, lon); đồ thị đọc từ một file luôn đầy đủ"""
+
+    def route_points(self, name, start_point, goal_point, max_distance=float('inf'), use_cache=True,
+                     cancel=None, metrics=None, graph=None):
+        """
+        Gắn hai điểm (lat, lon) lên cạnh gần nhất (không xa quá max_distance mét) rồi tìm đường
+        bằng route_snapped trên cùng một bản chụp (graph, mặc định chụp đồ thị hiện tại). Trả về PointRoute.
+        """
+        graph = graph if graph is not None else self.graph.snapshot()
+        start = graph.snap_to_edge(*start_point, max_distance=max_distance)
+        goal = graph.snap_to_edge(*goal_point, max_distance=max_distance)
+        expanded, path, cost, cached = 0, None, 0, False
+        if start is not None and goal is not None:
+            expanded, path, cost, cached = self.route_snapped(name, start, goal, use_cache, graph, cancel, metrics)
+        return PointRoute(graph, start, goal, expanded, path, cost, cached)
+
+    def add_obstacles(self, node_ids):
+        """Chặn các node_id (App đặt vật cản qua đây); trả về mảng các node_id trước đó chưa bị chặn"""
+        return self.graph.add_obstacles(node_ids)
+
+    def remove_obstacles(self, node_ids):
+        """Bỏ chặn các node_id; trả về mảng các node_id trước đó đang bị chặn"""
+        return self.graph.remove_obstacles(node_ids)
+
+    def add_region(self, select):
+        """
+        Chặn vùng cấm: select(graph) trả về chỉ số các node trong vùng (vd. Graph.nodes_in_rect).
+        Trả về handle để remove_region bỏ chặn; ở đây là các node_id mới bị chặn.
+        """
+        graph = self.graph
+        return graph.ids[graph.block_indices(select(graph))]
+
+    def remove_region(self, handle):
+        """Bỏ vùng cấm đã thêm bằng add_region"""
+        self.graph.remove_obstacles(handle)
+
+    def shortest_path_tree(self, node_id, reverse=False, graph=None):
+        """
+        Cây đường đi ngắn nhất (tree_cache.ShortestPathTree) từ node_id tới mọi node,
+        reverse=True: từ mọi node tới node_id. Dùng chung với các lần tìm bằng Dijkstra.
+        """
+        graph = graph if graph is not None else self.graph.snapshot()
+        root = graph.index_of(node_id)
+        graph.check_endpoints([root])
+        return self.trees.tree(graph, root, reverse)
+
+    def cache_path(self, suffix, graph=None):
+        """Đường dẫn file dữ liệu tiền xử lý của đồ thị graph (cạnh file snapshot)"""
+        return snapshot_path(self.source_path) + suffix
+
+    def heuristic(self):
+        """Heuristic đang chọn; bảng giá trị được tính một lần cho mỗi truy vấn"""
+        return GeoHeuristic(self.heuristic_kind)
+
+    def hierarchy(self, graph=None):
+        """Contraction Hierarchies của graph (mặc định đồ thị hiện tại; đọc từ cache hoặc tiền xử lý một lần)"""
+        graph = graph if graph is not None else self.graph
+        with self._hierarchy_lock:
+            if self._hierarchy is None or self._hierarchy.fingerprint != graph.fingerprint():
+                self.progress("Đang tiền xử lý Contraction Hierarchies...")
+                self._hierarchy = load_or_build_hierarchy(
+                    graph, self.cache_path(".ch.npz", graph), progress=self.progress)
+            return self._hierarchy
+
+    def landmarks(self, graph=None):
+        """Heuristic ALT của graph (mặc định đồ thị hiện tại; đọc từ cache hoặc tính một lần)"""
+        graph = graph if graph is not None else self.graph
+        with self._landmarks_lock:
+            if self._landmarks is None or self._landmarks.fingerprint != graph.fingerprint():
+                self.progress("Đang tính bảng landmark cho ALT...")
+                self._landmarks = load_or_build_landmarks(
+                    graph, self.cache_path(".alt.npz", graph))
+            return self._landmarks
+
+    def path_cost(self, path, graph=None):
+        """Tổng chi phí các cạnh của đường đi (inf nếu có cạnh không tồn tại)"""
+        if not path or len(path) < 2:
+            return 0.0
+        graph = graph if graph is not None else self.graph
+        return sum(graph.cost(u, v) for u, v in zip(path, path[1:]))
+
+
+class TiledRouter(Router):
+    """
+    Router trên nhiều file OSM cắt thành ô (tiles.TileStore). Chỉ các ô quanh khung đang xem
+    (show_region) và quanh hai điểm đang tìm được nạp; self.graph được dựng lại khi tập ô đổi.
+    Vật cản chỉ được đặt qua add_obstacles/add_region: router giữ tập node_id bị chặn (kể cả
+    node trên ô đã bị bỏ khỏi bộ nhớ) và hàm chọn node của các vùng cấm, rồi đặt lại mặt nạ
+    vật cản theo đó cho mọi đồ thị dựng lại, nên vùng cấm phủ cả các ô nạp sau khi vẽ và thay
+    đổi vật cản trong lúc dựng không bị mất.
+
+    Khi tìm đường, đường ra khỏi vùng đã nạp phải qua một node biên mở b, nên có chi phí
+    ít nhất |s - b| + |b - t| (chim bay). Các ô chứa node biên có cận dưới này nhỏ hơn chi phí
+    đường đã tìm được nạp thêm rồi tìm lại, cho tới khi không còn ô nào như vậy.
+    """
+    ROUTE_MARGIN = 1  # số ô nới thêm quanh hai điểm trước lần tìm đầu tiên
+    # Một lần tìm chạy trên đúng đồ thị dựng từ các ô nó yêu cầu (kể cả khi vượt max_tiles),
+    # nên luồng khác nạp/bỏ ô trong lúc đó không làm sai kết quả
+
+    def __init__(self, source_paths, progress=None, tile_deg=TILE_DEG, max_tiles=MAX_TILES, **kwargs):
+        super().__init__(source_paths[0], progress, **kwargs)
+        self.source_paths = list(source_paths)
+        self.tiles = TileStore(self.source_paths, tile_deg=tile_deg, max_tiles=max_tiles, progress=self.progress)
+        self._region_lock = threading.Lock()
+        self._obstacles = np.empty(0, dtype=np.int64)  # node_id bị chặn (đã sắp xếp), giữ bởi _region_lock
+        self._regions = {}  # handle -> hàm chọn node của vùng cấm, chạy lại trên mỗi đồ thị dựng lại
+        self._region_ids = count()
+        self._graph_keys = set()  # các ô mà self.graph được dựng từ đó
+        self._generation = 0  # thế hệ tập ô (TileStore.request) của self.graph
+
+    def load_graph(self):
+        """Đọc (hoặc cắt) danh mục ô; các ô được nạp khi cần"""
+        self.tiles.open()
+        with self._region_lock:
+            self.graph = Graph()
+            self._graph_keys = set()
+            self.cache.clear()
+            self.trees.clear()
+        return self.graph
+
+    def cache_path(self, suffix, graph=None):
+        # Đồ thị đổi theo tập ô đang nạp: mỗi tập ô một file (theo fingerprint) trong thư mục ô,
+        # quay lại vùng đã xem thì đọc lại thay vì tiền xử lý lại
+        graph = graph if graph is not None else self.graph
+        return os.path.join(self.tiles.folder, "graph-" + graph.fingerprint()[:16] + suffix)
+
+    def add_obstacles(self, node_ids):
+        node_ids = np.unique(np.asarray(node_ids, dtype=np.int64))
+        with self._region_lock:
+            added = node_ids[~np.isin(node_ids, self._obstacles)]
+            self._obstacles = np.union1d(self._obstacles, added)
+            self._apply_obstacles(self.graph)
+            return added
+
+    def remove_obstacles(self, node_ids):
+        with self._region_lock:
+            removed = self._obstacles[np.isin(self._obstacles, node_ids)]
+            self._obstacles = np.setdiff1d(self._obstacles, removed)
+            self._apply_obstacles(self.graph)
+            return removed
+
+    def add_region(self, select):
+        with self._region_lock:
+            handle = next(self._region_ids)
+            self._regions[handle] = select
+            self._apply_obstacles(self.graph)
+            return handle
+
+    def remove_region(self, handle):
+        with self._region_lock:
+            self._regions.pop(handle, None)
+            self._apply_obstacles(self.graph)
+
+    def _apply_obstacles(self, graph):
+        """Đặt mặt nạ vật cản của graph theo self._obstacles và các vùng cấm (chỉ đổi các node khác đi); cần giữ _region_lock"""
+        mask = np.zeros(graph.num_nodes, dtype=bool)
+        mask[graph.indices_of(self._obstacles[np.isin(self._obstacles, graph.ids)])] = True
+        for select in self._regions.values():
+            mask[select(graph)] = True
+        graph.unblock_indices(np.flatnonzero(graph.blocked & ~mask))
+        graph.block_indices(np.flatnonzero(mask & ~graph.blocked))
+
+    def show_region(self, lat1, lon1, lat2, lon2):
+        """Nạp các ô giao với khung lat/lon; bỏ qua (False) nếu khung quá rộng"""
+        keys = self.tiles.keys_in(lat1, lon1, lat2, lon2)
+        if len(keys) > self.tiles.max_tiles // 2:
+            return False
+        self._use(keys)
+        return True
+
+    def region_ready(self, start_point, goal_point):
+        return self._route_keys(start_point, goal_point) <= self._graph_keys
+
+    def prepare_route(self, start_point, goal_point):
+        """Nạp các ô quanh hai điểm (nới ROUTE_MARGIN ô), ví dụ trước khi minh họa quá trình tìm"""
+        self._use(self._route_keys(start_point, goal_point))
+
+    def _route_keys(self, start_point, goal_point):
+        (lat1, lon1), (lat2, lon2) = start_point, goal_point
+        return self.tiles.keys_in(lat1, lon1, lat2, lon2, self.ROUTE_MARGIN)
+
+    def route_points(self, name, start_point, goal_point, max_distance=float('inf'), use_cache=True,
+                     cancel=None, metrics=None):
+        needed = self._route_keys(start_point, goal_point)
+        # Luôn yêu cầu mọi ô đã cần cho lần tìm này để đồ thị dùng có đủ chúng;
+        # mỗi vòng thêm ít nhất một ô mới nên vòng lặp dừng
+        graph, loaded = self._use(needed)
+        while True:
+            result = super().route_points(name, start_point, goal_point, max_distance, use_cache, cancel, metrics,
+                                          graph.snapshot())
+            more = self._frontier_tiles(result, loaded) - needed
+            if not more:
+                return result
+            self.progress(f"Đang nạp thêm {len(more)} ô bản đồ...")
+            needed |= more
+            graph, loaded = self._use(needed)
+
+    def _frontier_tiles(self, result, loaded):
+        """Các ô chứa node biên mở (ngoài các ô loaded của result.graph) mà đường đi qua đó có thể ngắn hơn đường đã tìm được"""
+        graph, start, goal = result.graph, result.start, result.goal
+        if start is None or goal is None:
+            return set()
+        boundary = self.tiles.open_boundary(graph, loaded)
+        if not len(boundary):
+            return set()
+        cost = result.cost if result.path is not None else np.inf
+        xy = graph.xy[boundary]
+        s, t = graph.to_xy(start.lat, start.lon), graph.to_xy(goal.lat, goal.lon)
+        bound = np.hypot(*(xy - s).T) + np.hypot(*(xy - t).T)
+        return self.tiles.tiles_of(graph, boundary[bound < cost])
+
+    def _use(self, keys):
+        """
+        Nạp các ô keys; nếu self.graph thiếu ô thì dựng lại đồ thị ngoài _region_lock (thao tác
+        vật cản trên luồng giao diện không phải chờ), đặt lại vật cản và vùng cấm dưới khóa rồi
+        mới thay self.graph, trừ khi luồng khác đã thay bằng đồ thị của tập ô mới hơn.
+        Trả về (đồ thị gốc chứa đủ keys, tập ô của nó) để tìm đường trên đúng đồ thị này.
+        """
+        keys = set(keys) & self.tiles.available
+        with self._region_lock:
+            graph, loaded = self.graph, self._graph_keys
+        if keys <= loaded:
+            self.tiles.touch(keys)
+            return graph, loaded
+        generation, tiles = self.tiles.request(keys)
+        graph, loaded = self.tiles.assemble(tiles), set(tiles)
+        if self._regions:
+            graph.spatial_index()  # vùng cấm chọn node qua chỉ mục này: dựng trước, ngoài khóa
+        with self._region_lock:
+            self._apply_obstacles(graph)
+            if generation > self._generation:
+                self.graph, self._graph_keys, self._generation = graph, loaded, generation
+                self.cache.clear()  # kết quả cũ gắn với đồ thị trước
+                self.trees.clear()
+        return graph, loaded
@@ -0,0 +1,126 @@
+import hashlib
+import json
+import os
+import struct
+import numpy as np
+from graph import Graph
+
+# Định dạng file snapshot:
+#   MAGIC (8 byte) | độ dài header (uint64) | header JSON | các mảng, mỗi mảng căn lề ALIGN byte
+# Header ghi phiên bản định dạng, dấu vân tay file .osm nguồn và vị trí/kiểu/kích thước từng mảng.
+MAGIC = b"IAGRAPH\0"
+SNAPSHOT_VERSION = 3  # 2: chỉ còn các way highway đi được (osm_loader); 3: co chuỗi node bậc 2 (contract)
+ALIGN = 64
+ARRAYS = ("ids", "lat", "lon", "indptr", "indices", "weights", "chain_ptr", "chain_nodes")
+
+
+def snapshot_path(source_path):
+    """res/KimMa.osm -> res/.cache/KimMa.osm.graph"""
+    folder, name = os.path.split(source_path)
+    return os.path.join(folder, ".cache", name + ".graph")
+
+
+def source_fingerprint(source_path):
+    """Kích thước, mtime và sha1 của file nguồn"""
+    stat = os.stat(source_path)
+    sha1 = hashlib.sha1()
+    with open(source_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            sha1.update(block)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha1": sha1.hexdigest()}
+
+
+def save_snapshot(graph, source_path, path=None):
+    """Ghi graph ra file snapshot (ghi file tạm rồi đổi tên để không bao giờ để lại file hỏng)"""
+    path = path or snapshot_path(source_path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    arrays = {name: np.ascontiguousarray(getattr(graph, name)) for name in ARRAYS}
+
+    layout = {}
+    offset = 0
+    for name, arr in arrays.items():
+        layout[name] = {"dtype": arr.dtype.str, "shape": list(arr.shape), "offset": offset}
+        offset += _aligned(arr.nbytes)
+    header = json.dumps({
+        "version": SNAPSHOT_VERSION,
+        "source": source_fingerprint(source_path),
+        "arrays": layout,
+    }).encode("utf-8")
+    data_start = _aligned(len(MAGIC) + 8 + len(header))
+
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(MAGIC)
+        f.write(struct.pack("<Q", len(header)))
+        f.write(header)
+        for name, arr in arrays.items():
+            f.seek(data_start + layout[name]["offset"])
+            f.write(arr.tobytes())
+        f.truncate(data_start + offset)
+    os.replace(tmp_path, path)
+    return path
+
+
+def load_snapshot(source_path, path=None):
+    """
+    Mở snapshot bằng numpy.memmap (không đọc dữ liệu vào RAM ngay).
+    Trả về None nếu chưa có snapshot, sai phiên bản, hỏng, hoặc file .osm đã thay đổi.
+    """
+    path = path or snapshot_path(source_path)
+    try:
+        with open(path, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                return None
+            (header_len,) = struct.unpack("<Q", f.read(8))
+            header = json.loads(f.read(header_len).decode("utf-8"))
+    except (OSError, ValueError, struct.error):
+        return None
+
+    if header.get("version") != SNAPSHOT_VERSION or not is_fresh(header.get("source", {}), source_path):
+        return None
+
+    data_start = _aligned(len(MAGIC) + 8 + header_len)
+    arrays = {}
+    for name in ARRAYS:
+        info = header["arrays"][name]
+        shape = tuple(info["shape"])
+        if 0 in shape:
+            # memmap không mở được vùng rỗng
+            arrays[name] = np.empty(shape, dtype=info["dtype"])
+        else:
+            # Bỏ lớp memmap (vẫn trỏ vào cùng vùng ánh xạ): chỉ mục trên ndarray con nhanh hơn nhiều
+            arrays[name] = np.asarray(np.memmap(path, dtype=info["dtype"], mode="r",
+                                                offset=data_start + info["offset"], shape=shape))
+    return Graph.from_arrays(**arrays)
+
+
+def load_cached_graph(source_path, build):
+    """Dùng snapshot nếu còn hợp lệ, nếu không gọi build() để dựng Graph rồi ghi snapshot mới"""
+    graph = load_snapshot(source_path)
+    if graph is not None:
+        return graph
+    graph = build()
+    graph.freeze()
+    try:
+        save_snapshot(graph, source_path)
+    except OSError as e:
+        print(f"Không ghi được snapshot đồ thị: {e}")
+    return graph
+
+
+def is_fresh(saved, source_path):
+    """
+    File nguồn còn khớp dấu vân tay đã lưu. Cùng kích thước và mtime thì tin là chưa đổi;
+    chỉ băm sha1 (đọc cả file) khi chúng khác, vd. file được chép lại với nội dung cũ.
+    """
+    try:
+        stat = os.stat(source_path)
+    except OSError:
+        return False
+    if saved.get("size") == stat.st_size and saved.get("mtime_ns") == stat.st_mtime_ns:
+        return True
+    return saved.get("size") == stat.st_size and saved.get("sha1") == source_fingerprint(source_path)["sha1"]
+
+
+def _aligned(n):
+    return (n + ALIGN - 1) // ALIGN * ALIGN
@@ -0,0 +1,102 @@
+import math
+import numpy as np
+
+NODES_PER_CELL = 8  # số node trung bình mỗi ô lưới
+
+
+class GridIndex:
+    """
+    Lưới đều trên (lat, lon) để lấy các node trong một vùng mà không duyệt cả đồ thị.
+
+    Chỉ số node được sắp theo ô (kiểu CSR): các node của ô c nằm trong
+    order[start[c]:start[c + 1]]. Truy vấn chỉ xét các ô giao với khung bao của vùng,
+    sau đó lọc chính xác bằng numpy trên các node ứng viên.
+    """
+
+    def __init__(self, lat, lon, nodes_per_cell=NODES_PER_CELL):
+        self.lat = np.asarray(lat, dtype=np.float64)
+        self.lon = np.asarray(lon, dtype=np.float64)
+        n = len(self.lat)
+        if n == 0:
+            self.lat0 = self.lon0 = 0.0
+            self.cell = 1.0
+            self.rows = self.cols = 1
+            self.order = np.empty(0, dtype=np.int32)
+            self.start = np.zeros(2, dtype=np.int64)
+            return
+        self.lat0, self.lon0 = float(self.lat.min()), float(self.lon.min())
+        lat_span = float(self.lat.max()) - self.lat0
+        lon_span = float(self.lon.max()) - self.lon0
+        # Ô vuông (theo độ) sao cho trung bình khoảng nodes_per_cell node mỗi ô
+        area = max(lat_span * lon_span, 1e-18)
+        self.cell = max(math.sqrt(area * nodes_per_cell / n), 1e-9)
+        self.rows = int(lat_span / self.cell) + 1
+        self.cols = int(lon_span / self.cell) + 1
+
+        cell_id = self._row(self.lat) * self.cols + self._col(self.lon)
+        self.order = np.argsort(cell_id, kind='stable').astype(np.int32)
+        self.start = np.zeros(self.rows * self.cols + 1, dtype=np.int64)
+        np.cumsum(np.bincount(cell_id, minlength=self.rows * self.cols), out=self.start[1:])
+
+    def _row(self, lat):
+        return np.clip(((np.asarray(lat) - self.lat0) / self.cell).astype(np.int64), 0, self.rows - 1)
+
+    def _col(self, lon):
+        return np.clip(((np.asarray(lon) - self.lon0) / self.cell).astype(np.int64), 0, self.cols - 1)
+
+    def candidates(self, lat_min, lat_max, lon_min, lon_max):
+        """Chỉ số các node thuộc các ô giao với khung bao (chưa lọc chính xác)"""
+        if len(self.order) == 0 or lat_max < self.lat0 or lon_max < self.lon0 \
+                or lat_min > self.lat0 + self.rows * self.cell or lon_min > self.lon0 + self.cols * self.cell:
+            return np.empty(0, dtype=np.int32)
+        r0, r1 = int(self._row(lat_min)), int(self._row(lat_max))
+        c0, c1 = int(self._col(lon_min)), int(self._col(lon_max))
+        # Mỗi hàng ô là một đoạn liên tiếp trong order
+        parts = [self.order[self.start[r * self.cols + c0]:self.start[r * self.cols + c1 + 1]]
+                 for r in range(r0, r1 + 1)]
+        return np.concatenate(parts)
+
+    def rect(self, lat1, lon1, lat2, lon2):
+        """Các node trong hình chữ nhật theo lat/lon (hai góc đối diện bất kỳ)"""
+        lat_min, lat_max = min(lat1, lat2), max(lat1, lat2)
+        lon_min, lon_max = min(lon1, lon2), max(lon1, lon2)
+        idx = self.candidates(lat_min, lat_max, lon_min, lon_max)
+        lat, lon = self.lat[idx], self.lon[idx]
+        inside = (lat >= lat_min) & (lat <= lat_max) & (lon >= lon_min) & (lon <= lon_max)
+        return np.sort(idx[inside])
+
+    def polygon(self, points):
+        """Các node trong đa giác [(lat, lon), ...] (quy tắc chẵn-lẻ, đa giác tự đóng)"""
+        poly = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        if len(poly) < 3:
+            return np.empty(0, dtype=np.int32)
+        idx = self.candidates(poly[:, 0].min(), poly[:, 0].max(), poly[:, 1].min(), poly[:, 1].max())
+        return np.sort(idx[points_in_polygon(self.lat[idx], self.lon[idx], poly)])
+
+    def circle(self, lat, lon, radius_m, earth_radius_m):
+        """Các node cách (lat, lon) không quá radius_m mét (khoảng cách vòng tròn lớn)"""
+        dlat = math.degrees(radius_m / earth_radius_m)
+        cos_lat = max(math.cos(math.radians(min(abs(lat) + dlat, 89.9))), 1e-6)
+        dlon = dlat / cos_lat
+        idx = self.candidates(lat - dlat, lat + dlat, lon - dlon, lon + dlon)
+        lat1, lon1 = math.radians(lat), math.radians(lon)
+        lat2, lon2 = np.radians(self.lat[idx]), np.radians(self.lon[idx])
+        a = np.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+        dist = 2 * earth_radius_m * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+        return np.sort(idx[dist <= radius_m])
+
+
+def points_in_polygon(lat, lon, poly):
+    """
+    Mảng bool: điểm (lat[i], lon[i]) có nằm trong đa giác poly (mảng (k, 2) lat/lon) không.
+    Bắn tia theo chiều lon, đếm số cạnh cắt; lặp theo cạnh, tính vectorized theo điểm.
+    """
+    inside = np.zeros(len(lat), dtype=bool)
+    y_i, x_i = poly[:, 0], poly[:, 1]
+    y_j, x_j = np.roll(y_i, 1), np.roll(x_i, 1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for yi, xi, yj, xj in zip(y_i.tolist(), x_i.tolist(), y_j.tolist(), x_j.tolist()):
+            crosses = (yi > lat) != (yj > lat)
+            x_cross = (xj - xi) * (lat - yi) / (yj - yi) + xi
+            inside ^= crosses & (lon < x_cross)
+    return inside
@@ -0,0 +1,123 @@
+import pytest
+from graph import Graph
+from algorithm import BellmanFord, Dijkstra, BidirectionalDijkstra, BidirectionalAStar
+from heuristic import GeoHeuristic
+from landmarks import build_landmarks
+from metrics import SearchMetrics
+from router import Router
+from conftest import largest_component, sample_pairs, true_distances
+
+
+def make_graph(edges, n):
+    """Đồ thị có hướng node 1..n, cạnh (u, v, chi phí)"""
+    graph = Graph()
+    graph.add_nodes(list(range(1, n + 1)), [21.03 + 0.001 * i for i in range(n)], [105.82] * n)
+    graph.add_edges([u for u, _, _ in edges], [v for _, v, _ in edges], [w for _, _, w in edges])
+    graph.freeze()
+    return graph
+
+
+def path_cost(graph, path):
+    return sum(graph.cost(u, v) for u, v in zip(path, path[1:]))
+
+
+def test_bellman_ford_matches_dijkstra(city):
+    junctions = [node for pair in sample_pairs(city, 6, seed=9) for node in pair]
+    city.add_obstacles(junctions + city.ids[city.chain_nodes[::40]].tolist())  # có cả node giữa cạnh đã co
+    for start, goal in sample_pairs(city, 30, seed=4):
+        _, path = BellmanFord().run(start, goal, city)
+        _, expected = Dijkstra().run(start, goal, city)
+        dist = true_distances(city, goal)[city.index_of(start)]
+        if expected is None:
+            assert path is None
+        else:
+            assert path[0] == start and path[-1] == goal
+            assert path_cost(city, path) == pytest.approx(dist)
+
+
+def test_bellman_ford_with_negative_edges():
+    # 1 -> 2 -> 4 tốn 5, đi vòng 1 -> 3 -> 2 -> 4 rẻ hơn nhờ cạnh âm 3 -> 2
+    graph = make_graph([(1, 2, 4.0), (2, 4, 1.0), (1, 3, 2.0), (3, 2, -3.0), (3, 4, 5.0)], 4)
+    algorithm = BellmanFord()
+    _, path = algorithm.run(1, 4, graph)
+    assert path == [1, 3, 2, 4]
+    assert path_cost(graph, path) == 0.0
+    assert not algorithm.negative_cycle
+
+
+def test_bellman_ford_detects_negative_cycle():
+    # Chu trình 2 -> 3 -> 2 có tổng -1, tới được từ 1
+    graph = make_graph([(1, 2, 1.0), (2, 3, 1.0), (3, 2, -2.0), (3, 4, 1.0)], 4)
+    algorithm = BellmanFord()
+    _, path = algorithm.run(1, 4, graph)
+    assert path is None
+    assert algorithm.negative_cycle
+
+
+def test_bellman_ford_ignores_unreachable_negative_cycle():
+    # Chu trình âm 3 <-> 4 không tới được từ 1
+    graph = make_graph([(1, 2, 1.0), (3, 4, 1.0), (4, 3, -2.0), (4, 2, 1.0)], 4)
+    algorithm = BellmanFord()
+    _, path = algorithm.run(1, 2, graph)
+    assert path == [1, 2]
+    assert not algorithm.negative_cycle
+
+
+BIDIRECTIONAL = {
+    "dijkstra": lambda graph: BidirectionalDijkstra(),
+    "geo": lambda graph: BidirectionalAStar(GeoHeuristic(1)),
+    "alt": lambda graph: BidirectionalAStar(build_landmarks(graph, count=8)),
+}
+
+
+@pytest.mark.parametrize("kind", BIDIRECTIONAL)
+def test_bidirectional_follows_one_way_streets(kind):
+    # 1 -> 2 -> 3 một chiều (rẻ), 1 - 4 - 3 hai chiều (đắt); chi phí x1000 để chim bay (~111 m/node) vẫn là cận dưới
+    edges = [(1, 2, 1.0), (2, 3, 1.0), (1, 4, 5.0), (4, 1, 5.0), (4, 3, 5.0), (3, 4, 5.0)]
+    graph = make_graph([(u, v, w * 1000) for u, v, w in edges], 4)
+    assert BIDIRECTIONAL[kind](graph).run(1, 3, graph)[1] == [1, 2, 3]
+    assert BIDIRECTIONAL[kind](graph).run(3, 1, graph)[1] == [3, 4, 1]
+
+
+@pytest.mark.parametrize("kind", BIDIRECTIONAL)
+def test_bidirectional_does_not_stop_at_first_meeting(kind):
+    # Node m được chốt từ cả hai phía trước, nhưng đường qua a, b rẻ hơn (9 < 10)
+    edges = [(1, 5, 5.0), (5, 4, 5.0), (1, 2, 3.0), (2, 3, 3.0), (3, 4, 3.0)]
+    graph = make_graph([(u, v, w * 1000) for u, v, w in edges], 5)
+    algorithm = BIDIRECTIONAL[kind](graph)
+    _, path = algorithm.run(1, 4, graph)
+    assert path == [1, 2, 3, 4]
+    assert algorithm.mu == 9000.0
+
+
+@pytest.mark.parametrize("kind", BIDIRECTIONAL)
+def test_bidirectional_is_optimal(city, kind):
+    algorithm = BIDIRECTIONAL[kind](city)
+    expanded = []
+    for start, goal in sample_pairs(city, 30, seed=6):
+        count, path = algorithm.run(start, goal, city)
+        assert path[0] == start and path[-1] == goal
+        assert path_cost(city, path) == pytest.approx(true_distances(city, goal)[city.index_of(start)])
+        assert algorithm.mu == pytest.approx(path_cost(city, path))
+        expanded.append(count)
+    # Dừng khi top_xuôi + top_ngược >= mu, không duyệt hết thành phần liên thông
+    assert sum(expanded) / len(expanded) < len(largest_component(city)) / 2
+
+
+HEURISTIC_ALGORITHMS = {"A*", "Greedy", "Bidirectional A*", "A* (ALT)", "Bidirectional A* (ALT)",
+                        "LPA* (tìm lại tăng dần)"}
+
+
+@pytest.mark.parametrize("name", Router.ALGORITHMS)
+def test_metrics_record_phases_and_heuristic_calls(tmp_path, city, name):
+    router = Router(str(tmp_path / "city.osm"))
+    router.graph = city
+    start, goal = sample_pairs(city, 1, seed=12)[0]
+    metrics = SearchMetrics(name)
+    router.route(name, start, goal, use_cache=False, metrics=metrics)
+    assert metrics.popped > 0
+    assert set(metrics.phases_ms) == {"setup", "search", "path"}
+    if name in HEURISTIC_ALGORITHMS:
+        assert metrics.heuristic_calls >= metrics.pushed > 0  # mỗi node vào heap đã được tra h
+    else:
+        assert metrics.heuristic_calls == 0
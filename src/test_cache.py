@@ -0,0 +1,85 @@
+import pytest
+from algorithm import Dijkstra
+from graph import CHANGE_LOG_SIZE
+from route_cache import RouteCache
+from tree_cache import TreeCache
+from conftest import build_city, sample_pairs
+
+
+class RouteCacheCase:
+    """Lưu một đường vào RouteCache; lookup() cho biết còn dùng lại được không"""
+
+    def __init__(self, graph, start, goal):
+        self.cache = RouteCache()
+        self.key = ("Dijkstra", 1, start, goal)
+        expanded, path = Dijkstra().run(start, goal, graph)
+        self.cache.put(graph, self.key, graph.version, expanded, path)
+        self.path = path
+
+    def lookup(self, graph):
+        return self.cache.get(graph, self.key) is not None
+
+
+class TreeCacheCase:
+    """Dựng một cây từ start trong TreeCache; lookup() cho biết đích goal có lấy từ cây có sẵn không"""
+
+    def __init__(self, graph, start, goal):
+        self.cache = TreeCache()
+        self.s, self.t = graph.index_of(start), graph.index_of(goal)
+        _, self.path = self.cache.route(graph, self.s, self.t)
+        self.cache._last = (None, None)  # lần sau không đổi chiều cây vì giữ điểm đích
+
+    def lookup(self, graph):
+        settled, _ = self.cache.route(graph, self.s, self.t)
+        return settled == 0
+
+
+CASES = {"route": RouteCacheCase, "tree": TreeCacheCase}
+
+
+@pytest.fixture(params=CASES)
+def case(request, city):
+    start, goal = sample_pairs(city, 1, seed=2)[0]
+    return CASES[request.param](city, start, goal)
+
+
+def off_path(graph, path, count):
+    """count node_id không nằm trên đường đi (kể cả node giữa của cạnh đã co)"""
+    on_path = set(graph.expand_path(path))
+    return [int(v) for v in graph.ids if int(v) not in on_path][:count]
+
+
+def test_hit_on_same_state(city, case):
+    assert case.lookup(city)
+    assert case.lookup(city.snapshot())  # bản chụp dùng chung uid
+
+
+def test_other_graph_is_a_miss(case):
+    assert not case.lookup(build_city())  # cùng id node, khác Graph.uid
+
+
+def test_obstacle_off_path_keeps_entry(city, case):
+    city.add_obstacles(off_path(city, case.path, 5))
+    assert case.lookup(city)
+
+
+def test_obstacle_on_chain_of_path_is_a_miss(city, case):
+    inner = [v for v in city.expand_path(case.path) if v not in case.path]
+    assert inner  # đường đi qua cạnh đã co
+    city.add_obstacle(inner[0])
+    assert not case.lookup(city)
+
+
+def test_unblocking_is_a_miss(city, case):
+    node = off_path(city, case.path, 1)[0]
+    city.add_obstacle(node)
+    assert case.lookup(city)
+    city.remove_obstacle(node)  # bỏ chặn có thể mở đường ngắn hơn
+    assert not case.lookup(city)
+
+
+def test_lost_history_is_a_miss(city, case):
+    for node in off_path(city, case.path, CHANGE_LOG_SIZE + 1):
+        city.add_obstacle(node)
+    assert city.changes_since(0) is None
+    assert not case.lookup(city)
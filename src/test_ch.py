@@ -0,0 +1,77 @@
+import pytest
+from algorithm import AStar
+from heuristic import GeoHeuristic
+from ch import build_hierarchy, ContractionHierarchies
+from conftest import build_city, sample_pairs, true_distances
+
+
+class CountingAStar(AStar):
+    """A* dự phòng đếm số lần được gọi"""
+
+    def __init__(self):
+        super().__init__(GeoHeuristic(1))
+        self.calls = 0
+
+    def run(self, start, goal, graph):
+        self.calls += 1
+        return super().run(start, goal, graph)
+
+
+def path_cost(graph, path):
+    return sum(graph.cost(u, v) for u, v in zip(path, path[1:]))
+
+
+def check_optimal(graph, start, goal, path):
+    dist = true_distances(graph, goal)[graph.index_of(start)]
+    assert path[0] == start and path[-1] == goal
+    assert path_cost(graph, path) == pytest.approx(dist)
+
+
+@pytest.fixture
+def hierarchy(city):
+    return build_hierarchy(city, workers=1)
+
+
+def test_query_is_optimal(city, hierarchy):
+    fallback = CountingAStar()
+    algorithm = ContractionHierarchies(hierarchy, fallback)
+    for start, goal in sample_pairs(city, 30, seed=7):
+        _, path = algorithm.run(start, goal, city)
+        check_optimal(city, start, goal, path)
+    assert fallback.calls == 0
+
+
+def test_obstacle_on_path_falls_back(city, hierarchy):
+    fallback = CountingAStar()
+    algorithm = ContractionHierarchies(hierarchy, fallback)
+    start, goal = next((s, t) for s, t in sample_pairs(city, 50, seed=8)
+                       if len(city.expand_path(algorithm.run(s, t, city)[1])) > 6)
+    _, path = algorithm.run(start, goal, city)
+    expanded = city.expand_path(path)
+    blocked = expanded[len(expanded) // 2]  # có thể là node giữa của cạnh đã co
+    # Cặp có đường (khi chưa có vật cản) không đi qua node sắp chặn
+    other = next((s, t) for s, t in sample_pairs(city, 50, seed=9)
+                 if blocked not in city.expand_path(algorithm.run(s, t, city)[1]))
+    city.add_obstacle(blocked)
+
+    _, path = algorithm.run(start, goal, city)
+    assert fallback.calls == 1
+    assert blocked not in city.expand_path(path)
+    check_optimal(city, start, goal, path)
+
+    # Vật cản không nằm trên đường của CH: không cần tìm lại
+    _, path = algorithm.run(*other, city)
+    assert fallback.calls == 1
+    check_optimal(city, *other, path)
+
+
+def test_stale_hierarchy_falls_back(hierarchy):
+    other = build_city(seed=3)  # cùng số node, khác chi phí / chiều đường
+    assert hierarchy.num_nodes == other.num_nodes and hierarchy.fingerprint != other.fingerprint()
+    fallback = CountingAStar()
+    algorithm = ContractionHierarchies(hierarchy, fallback)
+    pairs = sample_pairs(other, 10, seed=4)
+    for start, goal in pairs:
+        _, path = algorithm.run(start, goal, other)
+        check_optimal(other, start, goal, path)
+    assert fallback.calls == len(pairs)
@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+from graph import Graph
+from contract import contract_chains
+from router import Router
+
+
+def make_graph():
+    """Đường 1-2-3-4 (2, 3 là node giữa), mỗi đầu có thêm hai nhánh cụt; mọi cạnh hai chiều"""
+    graph = Graph()
+    ids = [1, 2, 3, 4, 5, 6, 7, 8]
+    graph.add_nodes(ids, [21.030 + 0.001 * i for i in range(8)], [105.82] * 8)
+    pairs = [(1, 2, 10.0), (2, 3, 20.0), (3, 4, 30.0), (4, 5, 5.0), (4, 6, 5.0), (1, 7, 5.0), (1, 8, 5.0)]
+    us = [u for u, v, _ in pairs] + [v for u, v, _ in pairs]
+    vs = [v for u, v, _ in pairs] + [u for u, v, _ in pairs]
+    graph.add_edges(us, vs, [w for _, _, w in pairs] * 2)
+    graph.freeze()
+    return contract_chains(graph)
+
+
+def test_chain_is_contracted():
+    graph = make_graph()
+    assert graph.cost(1, 4) == 60.0
+    assert graph.expand_path([1, 4]) == [1, 2, 3, 4]
+    assert graph.neighbors(2) == []
+
+
+def test_distance_matrix_between_junctions():
+    graph = make_graph()
+    dist = graph.distance_matrix([7], [5, 6], workers=1)
+    assert dist.tolist() == [[70.0, 70.0]]
+
+
+@pytest.mark.parametrize("sources, targets", [([2], [5]), ([7], [3])])
+def test_distance_matrix_rejects_interior_node(sources, targets):
+    graph = make_graph()
+    with pytest.raises(ValueError, match="giữa một cạnh đã co"):
+        graph.distance_matrix(sources, targets, workers=1)
+
+
+def test_route_rejects_interior_node():
+    router = Router(None)
+    router.graph = make_graph()
+    with pytest.raises(ValueError, match="giữa một cạnh đã co"):
+        router.route("Dijkstra", 3, 5)
+    expanded, path, cached = router.route("Dijkstra", 7, 5)
+    assert router.graph.expand_path(path) == [7, 1, 2, 3, 4, 5]
+
+
+def test_blocked_interior_node_cuts_chain():
+    graph = make_graph()
+    graph.add_obstacle(3)
+    assert np.isinf(graph.distance_matrix([7], [5], workers=1)).all()
+    graph.remove_obstacle(3)
+    assert graph.distance_matrix([7], [5], workers=1).tolist() == [[70.0]]
@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+from heuristic import GeoHeuristic
+from incremental import LPAStar
+from conftest import sample_pairs, true_distances
+
+
+def path_cost(graph, path):
+    return sum(graph.cost(u, v) for u, v in zip(path, path[1:]))
+
+
+def check_fresh(graph, start, goal, path):
+    """Kết quả sửa lại phải giống một lần tìm mới trên cùng trạng thái vật cản"""
+    dist = true_distances(graph, goal)[graph.index_of(start)]
+    if np.isinf(dist):
+        assert path is None
+    else:
+        assert path[0] == start and path[-1] == goal
+        assert path_cost(graph, path) == pytest.approx(dist)
+
+
+def test_repair_matches_fresh_search(city, monkeypatch):
+    planner = LPAStar(GeoHeuristic(1))
+    resets = []
+    reset = planner._reset
+    monkeypatch.setattr(planner, "_reset", lambda *args: (resets.append(args[1:]), reset(*args)))
+    start, goal = max(sample_pairs(city, 20, seed=5),
+                      key=lambda pair: true_distances(city, pair[1])[city.index_of(pair[0])])
+    rng = np.random.default_rng(11)
+    chain_nodes = set(city.ids[city.chain_nodes].tolist())
+
+    _, path = planner.run(start, goal, city.snapshot())
+    check_fresh(city, start, goal, path)
+    blocked = []
+    for step in range(12):
+        if step % 4 == 3:
+            # Bỏ chặn một nửa vật cản đã thêm
+            city.remove_obstacles(blocked[::2])
+            blocked = blocked[1::2]
+        else:
+            expanded = city.expand_path(path) if path else []
+            inner = [v for v in expanded[1:-1] if v in chain_nodes]
+            if step % 2 == 0 and inner:
+                nodes = [inner[len(inner) // 2]]  # node giữa của cạnh đã co: chỉ sửa được qua edges_through
+            else:
+                nodes = [int(v) for v in rng.choice(city.ids, 5, replace=False) if v not in (start, goal)]
+            blocked += city.add_obstacles(nodes).tolist()
+        _, path = planner.run(start, goal, city.snapshot())
+        check_fresh(city, start, goal, path)
+    assert len(resets) <= 3  # phần lớn các lần là sửa lại, không phải tìm từ đầu
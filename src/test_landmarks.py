@@ -0,0 +1,74 @@
+import numpy as np
+import pytest
+from algorithm import AStar
+from heuristic import GeoHeuristic
+from landmarks import build_landmarks, STRATEGIES
+from router import Router
+from conftest import build_city, sample_pairs, true_distances
+
+
+@pytest.mark.parametrize("strategy", STRATEGIES)
+def test_landmarks_on_contracted_graph(city, strategy):
+    assert len(city.chain_nodes)  # có node giữa không có cạnh
+    landmarks = build_landmarks(city, count=8, strategy=strategy)
+    assert len(landmarks.landmarks) == 8
+    junctions = np.diff(city.indptr) > 0
+    assert junctions[landmarks.landmarks].all()
+    assert np.isfinite(landmarks.dist_from[:, junctions]).mean() > 0.9
+
+
+def test_alt_expands_fewer_nodes_than_astar(city):
+    alt, plain = AStar(build_landmarks(city, count=8)), AStar(GeoHeuristic(1))
+    expanded_alt = expanded_plain = 0
+    for start, goal in sample_pairs(city, 20):
+        n_alt, path_alt = alt.run(start, goal, city)
+        n_plain, path_plain = plain.run(start, goal, city)
+        assert path_alt is not None
+        cost_alt = sum(city.cost(u, v) for u, v in zip(path_alt, path_alt[1:]))
+        cost_plain = sum(city.cost(u, v) for u, v in zip(path_plain, path_plain[1:]))
+        assert cost_alt == pytest.approx(cost_plain)
+        expanded_alt += n_alt
+        expanded_plain += n_plain
+    assert expanded_alt < expanded_plain
+
+
+@pytest.mark.parametrize("strategy", STRATEGIES)
+def test_alt_bounds_are_admissible(city, strategy):
+    landmarks = build_landmarks(city, count=6, strategy=strategy)
+    for target in sample_pairs(city, 5, seed=1):
+        target = target[1]
+        t = city.index_of(target)
+        dist_to_t = true_distances(city, target)  # d(v, t)
+        bounds = np.array(landmarks.table(city, t))
+        reachable = np.isfinite(dist_to_t)
+        assert (bounds[reachable] <= dist_to_t[reachable] + 1e-6).all()
+        assert (bounds[reachable] > 0).mean() > 0.5
+
+
+def test_alt_bounds_hold_with_obstacles(city):
+    landmarks = build_landmarks(city, count=6)
+    start, goal = sample_pairs(city, 1, seed=2)[0]
+    city.add_obstacles(sample_pairs(city, 10, seed=3)[0])  # vật cản chỉ làm đường dài ra
+    t = city.index_of(goal)
+    dist_to_t = true_distances(city, goal)
+    bounds = np.array(landmarks.table(city, t))
+    reachable = np.isfinite(dist_to_t)
+    assert (bounds[reachable] <= dist_to_t[reachable] + 1e-6).all()
+
+
+def test_selection_stops_when_graph_is_too_small():
+    graph = build_city(size=2, one_way=0.0)
+    landmarks = build_landmarks(graph, count=16)
+    assert len(set(landmarks.landmarks.tolist())) == len(landmarks.landmarks) <= 4
+
+
+@pytest.mark.parametrize("name", ["A* (ALT)", "Contraction Hierarchies"])
+def test_preprocessing_follows_routed_graph(tmp_path, name):
+    router = Router(str(tmp_path / "city.osm"))
+    router.graph = build_city(size=8, seed=1)
+    other = build_city(size=10, seed=2)  # ví dụ tập ô khác của TiledRouter
+    for start, goal in sample_pairs(other, 10, seed=3):
+        _, path, _ = router.route(name, start, goal, use_cache=False, graph=other)
+        assert router.path_cost(path, other) == pytest.approx(true_distances(other, goal)[other.index_of(start)])
+    built = router._landmarks if "ALT" in name else router._hierarchy  # dựng cho đồ thị đã tìm, không phải router.graph
+    assert built.fingerprint == other.fingerprint()
@@ -0,0 +1,198 @@
+import json
+import os
+import threading
+from collections import OrderedDict
+import numpy as np
+from graph import Graph
+from osm_loader import load_osm
+from contract import contract_chains
+from snapshot import source_fingerprint, is_fresh
+
+TILE_DEG = 0.005  # cạnh ô theo độ (~550 m ở Hà Nội)
+MAX_TILES = 64  # số ô giữ trong bộ nhớ cùng lúc (LRU)
+TILES_VERSION = 1
+
+
+def tile_keys(lat, lon, tile_deg=TILE_DEG):
+    """Khóa ô (hàng, cột) của các tọa độ: mảng (n, 2) int64"""
+    lat, lon = np.atleast_1d(lat), np.atleast_1d(lon)
+    return np.stack((np.floor(lat / tile_deg), np.floor(lon / tile_deg)), axis=-1).astype(np.int64)
+
+
+def tiles_folder(source_paths):
+    """[res/KimMa.osm, res/map.osm] -> res/.cache/KimMa.osm+map.osm.tiles"""
+    folder = os.path.dirname(source_paths[0])
+    name = "+".join(os.path.basename(path) for path in source_paths)
+    return os.path.join(folder, ".cache", name + ".tiles")
+
+
+def build_tiles(source_paths, folder, tile_deg=TILE_DEG, progress=None):
+    """
+    Đọc các file OSM (có thể chồng lấn nhau), gộp theo node_id rồi cắt thành ô tile_deg độ.
+    Mỗi ô ghi một file .npz: các node nằm trong ô, tiếp theo là các node biên thuộc ô khác mà
+    cạnh của ô đi tới, và các cạnh có điểm đầu trong ô. Manifest được ghi sau cùng nên thư mục
+    cắt dở không bao giờ được dùng. Trả về manifest.
+    """
+    report = progress or (lambda message: None)
+    merged = Graph()
+    for path in source_paths:
+        graph = load_osm(path, progress, simplify=False)
+        merged.add_nodes(graph.ids, graph.lat, graph.lon)
+        merged.add_edges(np.repeat(graph.ids, np.diff(graph.indptr)), graph.ids[graph.indices], graph.weights)
+    report("Đang cắt bản đồ thành ô...")
+    ids, lat, lon = merged.ids, merged.lat, merged.lon  # freeze gộp node/cạnh trùng giữa các file
+    u = np.repeat(np.arange(merged.num_nodes), np.diff(merged.indptr))
+    v = merged.indices.astype(np.int64)
+
+    keys = tile_keys(lat, lon, tile_deg)
+    unique, node_tile = np.unique(keys, axis=0, return_inverse=True)
+    node_tile = node_tile.reshape(-1)
+    node_order = np.argsort(node_tile, kind="stable")
+    node_ptr = np.searchsorted(node_tile[node_order], np.arange(len(unique) + 1))
+    edge_tile = node_tile[u]  # cạnh thuộc ô của điểm đầu
+    edge_order = np.argsort(edge_tile, kind="stable")
+    edge_ptr = np.searchsorted(edge_tile[edge_order], np.arange(len(unique) + 1))
+
+    os.makedirs(folder, exist_ok=True)
+    tiles = {}
+    for k, (row, col) in enumerate(unique.tolist()):
+        home = node_order[node_ptr[k]:node_ptr[k + 1]]
+        edges = edge_order[edge_ptr[k]:edge_ptr[k + 1]]
+        heads = np.unique(v[edges])
+        nodes = np.concatenate((home, heads[node_tile[heads] != k]))
+        name = f"{row}_{col}"
+        np.savez(os.path.join(folder, name + ".npz"), ids=ids[nodes], lat=lat[nodes], lon=lon[nodes],
+                 u=ids[u[edges]], v=ids[v[edges]], w=merged.weights[edges])
+        tiles[name] = [len(home), len(edges)]
+
+    manifest = {
+        "version": TILES_VERSION,
+        "tile_deg": tile_deg,
+        "sources": [dict(source_fingerprint(path), path=os.path.basename(path)) for path in source_paths],
+        "tiles": tiles,
+    }
+    tmp_path = os.path.join(folder, "manifest.json.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, os.path.join(folder, "manifest.json"))
+    return manifest
+
+
+class TileStore:
+    """
+    Các ô đồ thị đã cắt sẵn (build_tiles), nạp khi cần và giữ tối đa max_tiles ô theo LRU.
+
+    assemble() dựng Graph (đã co chuỗi node bậc 2) chỉ từ các ô request() trả về, nên bộ nhớ
+    theo diện tích đang dùng chứ không theo cả thành phố. Node biên có cùng id ở hai ô kề nhau nên các ô
+    tự nối lại khi cùng được nạp; node biên của ô chưa nạp là biên mở (open_boundary).
+    """
+
+    def __init__(self, source_paths, folder=None, tile_deg=TILE_DEG, max_tiles=MAX_TILES, progress=None):
+        self.source_paths = list(source_paths)
+        self.folder = folder or tiles_folder(self.source_paths)
+        self.tile_deg = tile_deg
+        self.max_tiles = max_tiles
+        self.progress = progress or (lambda message: None)
+        self.available = set()  # khóa (hàng, cột) của mọi ô có dữ liệu
+        self._tiles = OrderedDict()  # khóa -> dict mảng của ô đang giữ, cũ nhất ở đầu
+        self._generation = 0  # tăng mỗi khi tập ô đang giữ đổi
+        self._lock = threading.Lock()
+
+    def open(self):
+        """Đọc manifest; cắt lại nếu chưa có, khác kích thước ô hoặc file nguồn đã đổi"""
+        manifest = self._read_manifest()
+        if manifest is None:
+            self.progress("Đang cắt bản đồ thành ô...")
+            manifest = build_tiles(self.source_paths, self.folder, self.tile_deg, self.progress)
+        with self._lock:
+            self._tiles.clear()
+            self._generation += 1
+            self.available = {tuple(int(x) for x in name.split("_")) for name in manifest["tiles"]}
+        return manifest
+
+    def _read_manifest(self):
+        try:
+            with open(os.path.join(self.folder, "manifest.json"), encoding="utf-8") as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return None
+        sources = manifest.get("sources", [])
+        if (manifest.get("version") != TILES_VERSION or manifest.get("tile_deg") != self.tile_deg
+                or len(sources) != len(self.source_paths)
+                or not all(is_fresh(saved, path) for saved, path in zip(sources, self.source_paths))):
+            return None
+        return manifest
+
+    def keys_in(self, lat1, lon1, lat2, lon2, margin=0):
+        """Các ô có dữ liệu giao với khung lat/lon, nới thêm margin ô mỗi phía"""
+        (r1, c1), (r2, c2) = tile_keys([min(lat1, lat2), max(lat1, lat2)],
+                                       [min(lon1, lon2), max(lon1, lon2)], self.tile_deg).tolist()
+        return {(r, c) for r in range(r1 - margin, r2 + margin + 1)
+                for c in range(c1 - margin, c2 + margin + 1) if (r, c) in self.available}
+
+    def loaded(self):
+        with self._lock:
+            return set(self._tiles)
+
+    def request(self, keys):
+        """
+        Nạp các ô keys và đánh dấu vừa dùng; bỏ các ô dùng lâu nhất (ngoài keys) khi vượt
+        max_tiles. Trả về (thế hệ, các ô đang giữ ngay sau đó: dict khóa -> mảng, luôn gồm keys);
+        thế hệ lớn hơn nghĩa là tập ô mới hơn.
+        """
+        keys = set(keys) & self.available
+        loaded = {}
+        while True:
+            with self._lock:
+                missing = keys - set(self._tiles) - set(loaded)
+                if not missing:
+                    before = len(self._tiles)
+                    self._tiles.update(loaded)
+                    changed = len(self._tiles) != before
+                    for key in keys:
+                        self._tiles.move_to_end(key)
+                    for key in list(self._tiles):
+                        if len(self._tiles) <= self.max_tiles:
+                            break
+                        if key not in keys:
+                            del self._tiles[key]
+                            changed = True
+                    if changed:
+                        self._generation += 1
+                    return self._generation, dict(self._tiles)
+            # Đọc file ngoài khóa; luồng khác có thể bỏ một ô trong keys lúc này nên kiểm tra lại
+            loaded.update((key, self._load(key)) for key in missing)
+
+    def touch(self, keys):
+        """Đánh dấu vừa dùng các ô keys đang giữ (không nạp gì)"""
+        with self._lock:
+            for key in keys:
+                if key in self._tiles:
+                    self._tiles.move_to_end(key)
+
+    def _load(self, key):
+        with np.load(os.path.join(self.folder, f"{key[0]}_{key[1]}.npz")) as data:
+            return {name: data[name] for name in data.files}
+
+    def assemble(self, tiles):
+        """Graph từ các ô tiles (giá trị của request(); node biên trùng id được gộp), đã co chuỗi node bậc 2"""
+        graph = Graph()
+        for tile in tiles.values():
+            graph.add_nodes(tile["ids"], tile["lat"], tile["lon"])
+            graph.add_edges(tile["u"], tile["v"], tile["w"])
+        graph.freeze()
+        return contract_chains(graph)
+
+    def open_boundary(self, graph, loaded):
+        """
+        Chỉ số các node của graph nằm ngoài các ô loaded mà graph được dựng từ đó (đường đi ra
+        khỏi vùng đã nạp phải qua chúng)
+        """
+        keys = tile_keys(graph.lat, graph.lon, self.tile_deg)
+        inside = np.fromiter((key in loaded for key in map(tuple, keys.tolist())), dtype=bool, count=len(keys))
+        return np.flatnonzero(~inside)
+
+    def tiles_of(self, graph, idx):
+        """Khóa các ô có dữ liệu chứa các node idx của graph"""
+        keys = tile_keys(graph.lat[idx], graph.lon[idx], self.tile_deg)
+        return {tuple(key) for key in np.unique(keys, axis=0).tolist()} & self.available
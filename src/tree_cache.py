@@ -0,0 +1,138 @@
+from collections import OrderedDict
+import threading
+from time import perf_counter
+import numpy as np
+from algorithm import Dijkstra
+
+
+class ShortestPathTree:
+    """
+    Cây đường đi ngắn nhất một-tới-tất-cả từ root (chỉ số node) trên đồ thị uid ở version.
+    dist[v]: chi phí root -> v (reverse=True: v -> root), inf nếu không tới được;
+    pred[v]: node kế tiếp trên đường về root (-1 nếu không có).
+    """
+
+    def __init__(self, root, reverse, uid, version, dist, pred, settled):
+        self.root = root
+        self.reverse = reverse
+        self.uid = uid
+        self.version = version
+        self.dist = dist
+        self.pred = pred
+        self.settled = settled  # số node đã chốt khi dựng cây
+
+    def path_to(self, node):
+        """Chỉ số các node trên đường root -> node (reverse: node -> root), None nếu không tới được"""
+        if not np.isfinite(self.dist[node]):
+            return None
+        path = [node]
+        pred = self.pred
+        while node != self.root:
+            node = int(pred[node])
+            path.append(node)
+        return path if self.reverse else path[::-1]
+
+
+def build_tree(graph, root, reverse=False, algorithm=None):
+    """
+    Dijkstra từ root (chỉ số) tới hết đồ thị, theo cạnh đi ra hoặc đi vào (reverse=True), bằng chế độ
+    một-tới-tất-cả của BestFirstSearch. algorithm (algorithm.Algorithm): lấy cancel để hủy giữa chừng
+    và metrics để ghi số liệu.
+    """
+    search = Dijkstra()
+    if algorithm is not None:
+        search.cancel, search.metrics = algorithm.cancel, algorithm.metrics
+    space = search.explore(graph, root, reverse)
+    n = graph.num_nodes
+    dist = np.full(n, np.inf)
+    pred = np.full(n, -1, dtype=np.int32)
+    g, parent = space.g, space.parent
+    nodes = np.fromiter(g.keys(), dtype=np.int64, count=len(g))
+    dist[nodes] = np.fromiter(g.values(), dtype=np.float64, count=len(g))
+    del parent[root]
+    if parent:
+        children = np.fromiter(parent.keys(), dtype=np.int64, count=len(parent))
+        pred[children] = np.fromiter(parent.values(), dtype=np.int32, count=len(parent))
+    return ShortestPathTree(root, reverse, graph.uid, graph.version, dist, pred, space.popped)
+
+
+class TreeCache:
+    """
+    LRU các ShortestPathTree, khóa (root, reverse). Giữ nguyên điểm đầu và đổi điểm đích chỉ
+    cần lần ngược pred (O(độ dài đường đi)); cây ngược dùng khi giữ điểm đích và đổi điểm đầu.
+
+    Cây gắn với Graph.uid và Graph.version như RouteCache (chỉ số node chỉ có nghĩa trong một
+    đồ thị): sau khi chỉ thêm vật cản, đường lấy từ cây vẫn đúng và tối ưu nếu không đi qua
+    node mới bị chặn; bỏ chặn, mất lịch sử hoặc đồ thị khác thì bỏ cây.
+    """
+
+    def __init__(self, maxsize=16):
+        self.maxsize = maxsize
+        self._trees = OrderedDict()  # (root, reverse) -> ShortestPathTree
+        self._lock = threading.Lock()
+        self._last = (None, None)  # (s, t) của lần tìm trước, để chọn chiều cây cần dựng
+        self.hits = 0
+        self.misses = 0
+
+    def route(self, graph, s, t, algorithm=None):
+        """(số node đã chốt, đường đi node_id) từ s tới t (chỉ số); 0 node nếu lấy từ cây có sẵn"""
+        with self._lock:
+            for key, target in (((s, False), t), ((t, True), s)):
+                found, path = self._lookup(graph, key, target)
+                if found:
+                    self.hits += 1
+                    self._last = (s, t)
+                    return 0, graph.ids[path].tolist() if path is not None else None
+            self.misses += 1
+            # Giữ điểm đích, đổi điểm đầu: cây ngược từ t dùng lại được cho các lần sau
+            reverse = t == self._last[1] and s != self._last[0]
+            self._last = (s, t)
+        tree = self.tree(graph, t if reverse else s, reverse, algorithm)
+        time_path = perf_counter()
+        path = tree.path_to(s if reverse else t)
+        path = graph.ids[path].tolist() if path is not None else None
+        if algorithm is not None:
+            algorithm.record_counts(phases={"path": perf_counter() - time_path})
+        return tree.settled, path
+
+    def tree(self, graph, root, reverse=False, algorithm=None):
+        """Cây từ root (chỉ số) còn đúng với trạng thái vật cản hiện tại, dựng mới nếu cần"""
+        key = (root, reverse)
+        with self._lock:
+            tree = self._trees.get(key)
+            if tree is not None and tree.uid == graph.uid and tree.version == graph.version:
+                self._trees.move_to_end(key)
+                return tree
+        tree = build_tree(graph, root, reverse, algorithm)
+        with self._lock:
+            self._trees[key] = tree
+            self._trees.move_to_end(key)
+            while len(self._trees) > self.maxsize:
+                self._trees.popitem(last=False)
+        return tree
+
+    def clear(self):
+        with self._lock:
+            self._trees.clear()
+
+    def __len__(self):
+        return len(self._trees)
+
+    def _lookup(self, graph, key, target):
+        """(True, path chỉ số hoặc None) nếu cây key trả lời được target, (False, None) nếu không"""
+        tree = self._trees.get(key)
+        if tree is None:
+            return False, None
+        if tree.uid != graph.uid:
+            del self._trees[key]
+            return False, None
+        path = tree.path_to(target)
+        if tree.version != graph.version:
+            changes = graph.changes_since(tree.version)
+            if changes is None or len(changes[1]):
+                del self._trees[key]
+                return False, None
+            if path is not None and np.isin(changes[0], graph.expand_indices(path)).any():
+                return False, None
+        self._trees.move_to_end(key)
+        return True, path